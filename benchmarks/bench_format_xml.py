@@ -0,0 +1,102 @@
+"""Micro-benchmark: single-pass format_xml vs. the minidom round trip.
+
+Usage:
+    python benchmarks/bench_format_xml.py [--corpus DIR] [--repeat N]
+
+Without ``--corpus`` the sample receipts in ``example/receipt-sample`` are
+used, plus synthetic receipts with many items. Outputs of both formatters are
+checked to be identical before timing.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.utils import format_xml, format_xml_minidom
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+
+ITEM = """    <item>
+      <n>商品{index}</n>
+      <category>食品</category>
+      <subcategory>菓子</subcategory>
+      <quantity>1</quantity>
+      <unit_price>{price}</unit_price>
+      <total_price>{price}</total_price>
+    </item>"""
+
+
+def synthetic_receipt(item_count: int) -> str:
+    """A receipt with ``item_count`` items, similar to model output."""
+    items = "\n".join(ITEM.format(index=i, price=100 + i) for i in range(item_count))
+    return f"""<receipt>
+  <store_info>
+    <n>ベンチマーク商店 &amp; カフェ</n>
+    <address>東京都千代田区1-1</address>
+    <phone>03-0000-0000</phone>
+  </store_info>
+  <items>
+{items}
+  </items>
+  <totals>
+    <subtotal>1000</subtotal>
+    <tax>100</tax>
+    <total>1100</total>
+  </totals>
+</receipt>"""
+
+
+def load_corpus(corpus_dir: Path = None) -> list:
+    """Receipt XML documents to format."""
+    if corpus_dir is not None:
+        return [path.read_text(encoding="utf-8") for path in sorted(corpus_dir.rglob("*.xml"))]
+    documents = [path.read_text(encoding="utf-8") for path in sorted(SAMPLE_DIR.glob("*.xml"))]
+    documents += [synthetic_receipt(count) for count in (5, 20, 100)]
+    return documents
+
+
+def measure(formatter, documents: list, repeat: int) -> float:
+    """Best wall time in seconds to format every document once."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for document in documents:
+            formatter(document)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, help="Directory of receipt XML files (searched recursively)")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions, best is reported (default: 20)")
+    args = parser.parse_args()
+
+    documents = load_corpus(args.corpus)
+    if not documents:
+        parser.error("No XML documents found")
+
+    mismatches = sum(format_xml(document) != format_xml_minidom(document) for document in documents)
+    if mismatches:
+        print(f"❌ {mismatches}/{len(documents)} documents differ between formatters")
+        sys.exit(1)
+
+    total_bytes = sum(len(document.encode("utf-8")) for document in documents)
+    print(f"📄 {len(documents)} documents, {total_bytes / 1024:.1f} KiB, outputs identical")
+
+    results = {
+        "minidom round trip": measure(format_xml_minidom, documents, args.repeat),
+        "single pass": measure(format_xml, documents, args.repeat),
+    }
+    baseline = results["minidom round trip"]
+    for name, seconds in results.items():
+        per_doc = seconds / len(documents) * 1e6
+        print(f"{name:<20} {seconds * 1e3:9.2f} ms total {per_doc:9.1f} µs/doc  {baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Offline benchmark of the receipt pipeline against a local fake LLM backend.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scenario NAME ...] [--corpus-sizes 20,100]
+        [--image-size small|medium|large] [--latency 0.2] [--jitter 0.05] [--error-rate 0.0]
+        [--concurrency 8] [--batch-size 1] [--cpu-workers 0] [--output results.json]
+
+Scenarios:
+    cli            ``harina`` over a directory of synthetic receipt images
+    server         ``POST /process`` of the FastAPI example server
+    server-stream  ``POST /process_stream`` of the FastAPI example server
+    utils          XML extraction, formatting and CSV/JSON rendering of canned responses
+
+No API key is needed: ``litellm.completion`` is replaced by ``FakeLLM``, so the
+numbers measure Harina's own overhead at a given backend latency. Every
+scenario and corpus size runs in a fresh subprocess, so peak RSS is per run.
+Throughput, p50/p95/p99 latency and peak RSS are printed and, with
+``--output``, written as JSON for comparison across commits.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from fake_llm import FakeLLM, canned_receipt, patched
+
+SERVER_MAIN = PROJECT_ROOT / "example" / "fastapi-server" / "src" / "main.py"
+SCENARIOS = ("cli", "server", "server-stream", "utils")
+IMAGE_SIZES = {"small": (600, 1000), "medium": (1200, 2400), "large": (3000, 4000)}
+MODEL = "gemini/gemini-2.5-flash"
+
+
+def make_corpus(directory: Path, count: int, size: str) -> list:
+    """Write ``count`` distinct receipt-like JPEGs of the given size preset."""
+    from PIL import Image, ImageDraw
+
+    width, height = IMAGE_SIZES[size]
+    base = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(base)
+    line_height = max(12, height // 60)
+    for row, top in enumerate(range(line_height * 3, height - line_height * 3, line_height * 2)):
+        # Grey bars stand in for printed text lines of varying length
+        length = width // 3 + (row * 37) % (width // 2)
+        draw.rectangle([width // 10, top, width // 10 + length, top + line_height], fill=(60, 60, 60))
+
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for index in range(count):
+        image = base.copy()
+        ImageDraw.Draw(image).text((width // 10, line_height), f"RECEIPT {index:06d}", fill="black")
+        path = directory / f"receipt_{index:06d}.jpg"
+        image.save(path, format="JPEG", quality=90)
+        paths.append(path)
+    return paths
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    rank = min(len(ordered) - 1, max(0, int(fraction * len(ordered) + 0.999999) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None where unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarize(latencies: list, errors: int, seconds: float) -> dict:
+    """Throughput and latency percentiles of one run."""
+    result = {
+        "receipts": len(latencies) + errors,
+        "errors": errors,
+        "seconds": round(seconds, 4),
+        "throughput": round((len(latencies) + errors) / seconds, 3) if seconds else None,
+    }
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        result[name] = round(percentile(latencies, fraction), 4) if latencies else None
+    return result
+
+
+def run_cli(paths: list, args, workdir: Path) -> dict:
+    """Run the ``harina`` CLI in-process over the corpus directory."""
+    from click.testing import CliRunner
+
+    from harina.cli import cli
+
+    metrics_file = workdir / "metrics.jsonl"
+    output = workdir / "out"
+    output.mkdir()
+    command = [str(paths[0].parent), "-o", str(output), "--no-cache", "-j", str(args.concurrency),
+               "--batch-size", str(args.batch_size), "--cpu-workers", str(args.cpu_workers),
+               "--max-retries", str(args.max_retries), "--model", MODEL, "--metrics-file", str(metrics_file)]
+
+    start = time.perf_counter()
+    CliRunner().invoke(cli, command, catch_exceptions=False)
+    seconds = time.perf_counter() - start
+
+    records = [json.loads(line) for line in metrics_file.read_text(encoding="utf-8").splitlines()]
+    latencies = [record["stages"]["total"] for record in records if record["succeeded"]]
+    return summarize(latencies, sum(not record["succeeded"] for record in records), seconds)
+
+
+def _load_server():
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("harina_bench_server", SERVER_MAIN)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app
+
+
+def run_server(paths: list, args, stream: bool = False) -> dict:
+    """POST every image to the example server with ``concurrency`` clients."""
+    from fastapi.testclient import TestClient
+
+    app = _load_server()
+    endpoint = "/process_stream" if stream else "/process"
+
+    def post(client, path: Path):
+        start = time.perf_counter()
+        response = client.post(endpoint, files={"file": (path.name, path.read_bytes(), "image/jpeg")},
+                               data={"model": MODEL})
+        elapsed = time.perf_counter() - start
+        if stream:
+            last = json.loads(response.text.strip().splitlines()[-1])
+            ok = response.status_code == 200 and last.get("complete", False)
+        else:
+            ok = response.status_code == 200 and response.json()["success"]
+        return elapsed, ok
+
+    with TestClient(app) as client:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(lambda path: post(client, path), paths))
+        seconds = time.perf_counter() - start
+
+    latencies = [elapsed for elapsed, ok in results if ok]
+    return summarize(latencies, sum(not ok for _, ok in results), seconds)
+
+
+def run_utils(count: int, args) -> dict:
+    """Parse and render ``count`` canned model responses, as after every API call."""
+    from harina.core import HarinaCore
+    from harina.utils import convert_xml_to_csv, extract_xml
+
+    response = f"```xml\n{canned_receipt(args.items)}\n```"
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        began = time.perf_counter()
+        receipt = HarinaCore._build_receipt(extract_xml(response))
+        receipt.to_csv()
+        receipt.to_json()
+        convert_xml_to_csv(receipt.xml)
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, 0, time.perf_counter() - start)
+
+
+def run_child(args) -> dict:
+    """Run one scenario at one corpus size in this process."""
+    fake = FakeLLM(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, items=args.items,
+                   seed=args.seed)
+    with tempfile.TemporaryDirectory(prefix="harina-bench-") as tmp:
+        workdir = Path(tmp)
+        if args.scenario[0] == "utils":
+            result = run_utils(args.corpus_size, args)
+        else:
+            paths = make_corpus(workdir / "corpus", args.corpus_size, args.image_size)
+            with patched(fake):
+                if args.scenario[0] == "cli":
+                    result = run_cli(paths, args, workdir)
+                else:
+                    result = run_server(paths, args, stream=args.scenario[0] == "server-stream")
+    result.update(scenario=args.scenario[0], corpus_size=args.corpus_size, api_calls=fake.calls,
+                  api_errors=fake.errors, peak_rss_mb=peak_rss_mb())
+    return result
+
+
+def git_commit():
+    """Short hash of the checked-out commit, if this is a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                        help="Scenario to run; repeatable (default: all)")
+    parser.add_argument("--corpus-sizes", default="20,100", help="Comma-separated image counts (default: 20,100)")
+    parser.add_argument("--image-size", choices=list(IMAGE_SIZES), default="medium",
+                        help="Synthetic image size preset (default: medium)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake API latency in seconds (default: 0.2)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Uniform extra latency in seconds (default: 0.05)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of API calls failing with 503 (default: 0)")
+    parser.add_argument("--items", type=int, default=10, help="Items per canned receipt (default: 10)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel receipts or clients (default: 8)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Receipts per API request for cli (default: 1)")
+    parser.add_argument("--cpu-workers", type=int, default=0,
+                        help="Image preparation processes for cli (default: 0, in the API threads)")
+    parser.add_argument("--max-retries", type=int, default=2, help="Retries per API call for cli (default: 2)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for jitter and errors (default: 0)")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file")
+    parser.add_argument("--corpus-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # The result is the last stdout line; the server and CLI may print before it
+        print(json.dumps(run_child(args)))
+        return
+
+    scenarios = args.scenario or list(SCENARIOS)
+    sizes = [int(size) for size in args.corpus_sizes.split(",") if size.strip()]
+    passthrough = ["--image-size", args.image_size, "--latency", str(args.latency), "--jitter", str(args.jitter),
+                   "--error-rate", str(args.error_rate), "--items", str(args.items),
+                   "--concurrency", str(args.concurrency), "--batch-size", str(args.batch_size),
+                   "--cpu-workers", str(args.cpu_workers), "--max-retries", str(args.max_retries), "--seed", str(args.seed)]
+
+    results = []
+    print(f"{'scenario':<15}{'receipts':>9}{'errors':>7}{'seconds':>9}{'rec/s':>9}"
+          f"{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'RSS MiB':>9}")
+    for scenario in scenarios:
+        for size in sizes:
+            child = subprocess.run(
+                [sys.executable, __file__, "--child", "--scenario", scenario, "--corpus-size", str(size), *passthrough],
+                capture_output=True, text=True)
+            if child.returncode != 0:
+                print(f"❌ {scenario} ({size} images) failed:\n{child.stderr}", file=sys.stderr)
+                sys.exit(1)
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            results.append(result)
+
+            def cell(value, digits=3):
+                return "-" if value is None else f"{value:.{digits}f}"
+            print(f"{scenario:<15}{result['receipts']:>9}{result['errors']:>7}{result['seconds']:>9.2f}"
+                  f"{cell(result['throughput'], 2):>9}{cell(result['p50']):>9}{cell(result['p95']):>9}"
+                  f"{cell(result['p99']):>9}{cell(result['peak_rss_mb'], 1):>9}")
+
+    if args.output:
+        report = {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": dict({key: value for key, value in vars(args).items()
+                            if key not in ("output", "child", "corpus_size", "scenario")}, scenarios=scenarios),
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"💾 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
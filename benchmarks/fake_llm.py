@@ -0,0 +1,157 @@
+"""Local stand-in for ``litellm.completion`` so the pipeline can be benchmarked offline.
+
+``FakeLLM`` answers every request with a canned ``<receipt>`` (or an indexed
+``<receipts>`` wrapper for batched prompts) after a configurable latency, and
+fails a configurable share of calls with a retryable 503. Use ``patched()``
+to plug it into ``HarinaCore`` for the current process.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Iterator, Optional
+
+ITEM = """    <item>
+      <n>商品{index}</n>
+      <category>食品</category>
+      <subcategory>菓子</subcategory>
+      <quantity>1</quantity>
+      <unit_price>{price}</unit_price>
+      <total_price>{price}</total_price>
+    </item>"""
+
+
+def canned_receipt(item_count: int = 5, index: Optional[int] = None) -> str:
+    """A receipt in the shape the model returns, with ``item_count`` items."""
+    items = "\n".join(ITEM.format(index=i, price=100 + i) for i in range(item_count))
+    total = sum(100 + i for i in range(item_count))
+    attr = f' index="{index}"' if index is not None else ""
+    return f"""<receipt{attr}>
+  <store_info>
+    <n>ベンチマーク商店</n>
+    <address>東京都千代田区1-1</address>
+    <phone>03-0000-0000</phone>
+  </store_info>
+  <items>
+{items}
+  </items>
+  <totals>
+    <subtotal>{total}</subtotal>
+    <tax>{total // 10}</tax>
+    <total>{total + total // 10}</total>
+  </totals>
+  <payment_info>
+    <method>現金</method>
+  </payment_info>
+</receipt>"""
+
+
+class FakeAPIError(Exception):
+    """A retryable provider failure (HTTP 503) with a short ``Retry-After``."""
+
+    status_code = 503
+
+    def __init__(self, message: str = "fake backend unavailable", retry_after_ms: int = 50):
+        super().__init__(message)
+        self.response = SimpleNamespace(status_code=503, headers={'retry-after-ms': str(retry_after_ms)})
+
+
+def _image_count(messages: list) -> int:
+    content = messages[0].get('content') if messages else None
+    if not isinstance(content, list):
+        return 1
+    return max(1, sum(part.get('type') == 'image_url' for part in content))
+
+
+def _usage(images: int, text: str) -> SimpleNamespace:
+    # Roughly what Gemini bills: ~260 tokens per image plus the prompt, ~1 token per 3 characters out
+    completion_tokens = len(text) // 3
+    return SimpleNamespace(prompt_tokens=1500 + 260 * images, completion_tokens=completion_tokens,
+                           total_tokens=1500 + 260 * images + completion_tokens)
+
+
+class FakeLLM:
+    """Callable replacement for ``litellm.completion`` and ``litellm.acompletion``.
+
+    Each call sleeps ``latency`` seconds plus uniform ``jitter`` and raises
+    :class:`FakeAPIError` with probability ``error_rate``. Streamed calls
+    yield the answer in ``chunk_size`` character chunks.
+    """
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, error_rate: float = 0.0,
+                 items: int = 5, chunk_size: int = 64, seed: Optional[int] = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.items = items
+        self.chunk_size = chunk_size
+        self.calls = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        """Return ``(delay, fail)`` for the next call."""
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def _answer(self, messages: list) -> str:
+        images = _image_count(messages)
+        if images == 1:
+            return canned_receipt(self.items)
+        return "<receipts>\n" + "\n".join(canned_receipt(self.items, i) for i in range(1, images + 1)) + "\n</receipts>"
+
+    def _response(self, model: str, messages: list) -> SimpleNamespace:
+        text = self._answer(messages)
+        return SimpleNamespace(model=model, choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+                               usage=_usage(_image_count(messages), text))
+
+    def _chunks(self, text: str) -> Iterator[SimpleNamespace]:
+        for start in range(0, len(text), self.chunk_size):
+            delta = SimpleNamespace(content=text[start:start + self.chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    def __call__(self, model: str, messages: list, stream: bool = False, **kwargs):
+        delay, fail = self._draw()
+        time.sleep(delay)
+        if fail:
+            raise FakeAPIError()
+        if stream:
+            return self._chunks(self._answer(messages))
+        return self._response(model, messages)
+
+    async def acompletion(self, model: str, messages: list, stream: bool = False, **kwargs):
+        """Async variant; ``client`` and other LiteLLM keyword arguments are ignored."""
+        delay, fail = self._draw()
+        await asyncio.sleep(delay)
+        if fail:
+            raise FakeAPIError()
+        if stream:
+            return self._achunks(self._answer(messages))
+        return self._response(model, messages)
+
+    async def _achunks(self, text: str):
+        for chunk in self._chunks(text):
+            yield chunk
+
+
+@contextmanager
+def patched(fake: FakeLLM) -> Iterator[FakeLLM]:
+    """Route ``litellm.completion``/``acompletion`` (and so every ``HarinaCore``) to ``fake``."""
+    # Imported here so worker processes re-importing the benchmark stay fast
+    import litellm
+
+    originals = litellm.completion, litellm.acompletion
+    litellm.completion, litellm.acompletion = fake, fake.acompletion
+    try:
+        yield fake
+    finally:
+        litellm.completion, litellm.acompletion = originals
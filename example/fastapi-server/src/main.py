@@ -3,24 +3,28 @@ Fast API server for Harina v3 CLI - Receipt OCR API
 """
 import os
 import sys
-import tempfile
+import asyncio
 import base64
+import importlib
+import json
+from contextlib import asynccontextmanager
+from dataclasses import asdict
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 # プロジェクトルートをパスに追加
 project_root = Path(__file__).parent.parent.parent.parent
 sys.path.insert(0, str(project_root))
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 from dotenv import load_dotenv
 
 from harina.core import HarinaCore
-from harina.utils import convert_xml_to_csv
+from harina.metrics import MetricsCollector
 
 def setup_environment():
     """環境設定"""
@@ -59,10 +63,100 @@ def check_api_keys():
 # 環境設定を実行
 setup_environment()
 
+DEFAULT_MODEL = "gemini/gemini-2.5-flash"
+
+
+class HarinaRegistry:
+    """設定されたモデルごとに1つのHarinaCoreを保持するレジストリ
+
+    任意のモデル名でインスタンスが増え続けないよう、起動時に作成したモデルだけを扱う。
+    """
+
+    def __init__(self, models: List[str], metrics: Optional[MetricsCollector] = None):
+        self.metrics = metrics
+        self._instances: Dict[str, HarinaCore] = {
+            model: HarinaCore(model_name=model, metrics=metrics) for model in models
+        }
+
+    @property
+    def models(self) -> List[str]:
+        """利用可能なモデル一覧（先頭が省略時のモデル）"""
+        return list(self._instances)
+
+    def get(self, model: str) -> HarinaCore:
+        """モデルに対応するHarinaCoreを返す（設定にないモデルはKeyError）"""
+        return self._instances[model]
+
+    async def aclose(self):
+        """すべてのHarinaCoreのHTTPクライアントを閉じる"""
+        for ocr in list(self._instances.values()):
+            await ocr.aclose()
+
+
+def get_preload_models():
+    """起動時に作成するモデル一覧（HARINA_MODELS, カンマ区切り）"""
+    models = os.getenv('HARINA_MODELS') or os.getenv('HARINA_MODEL', DEFAULT_MODEL)
+    return [model.strip() for model in models.split(',') if model.strip()]
+
+
+def get_max_concurrency() -> int:
+    """上流APIへの同時呼び出し数の上限（HARINA_MAX_CONCURRENCY）"""
+    return max(1, int(os.getenv('HARINA_MAX_CONCURRENCY', 8)))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時にレジストリを作成し、終了時にHTTPクライアントを閉じる"""
+    max_concurrency = get_max_concurrency()
+    # harina.coreはlitellmを遅延importするため、最初のリクエストでイベントループを止めないよう先に読み込む
+    await asyncio.to_thread(importlib.import_module, 'litellm')
+    app.state.metrics = MetricsCollector()
+    app.state.registry = HarinaRegistry(get_preload_models(), app.state.metrics)
+    app.state.semaphore = asyncio.Semaphore(max_concurrency)
+    print(f"⚙️  モデル: {', '.join(get_preload_models())} / 同時実行数の上限: {max_concurrency}")
+    try:
+        yield
+    finally:
+        await app.state.registry.aclose()
+
+
+OUTPUT_FORMATS = ['xml', 'csv', 'json']
+
+
+def resolve_model(model: Optional[str]) -> Tuple[str, HarinaCore]:
+    """リクエストのモデル名とHarinaCoreを返す（省略時は最初のモデル、設定にないモデルは400）"""
+    registry = app.state.registry
+    model = model or registry.models[0]
+    try:
+        return model, registry.get(model)
+    except KeyError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"未対応のモデルです: {model}（利用可能: {', '.join(registry.models)}）"
+        )
+
+
+async def run_ocr(ocr: HarinaCore, image_data: bytes, output_format: str = 'xml') -> str:
+    """ネイティブ非同期APIでOCR処理を行う（画像はメモリ上のまま渡し、指定形式で直接受け取る）"""
+    async with app.state.semaphore:
+        return await ocr.aprocess_receipt(image_data, output_format)
+
+
+async def stream_ocr(ocr: HarinaCore, image_data: bytes):
+    """認識途中の結果（店舗情報・商品など）をNDJSONで1行ずつ返す"""
+    async with app.state.semaphore:
+        try:
+            async for progress in ocr.astream_receipt(image_data):
+                yield json.dumps(asdict(progress), ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"complete": False, "error": str(e)}, ensure_ascii=False) + "\n"
+
+
 app = FastAPI(
     title="Harina v3 Receipt OCR API",
     description="レシート画像を認識してXML/CSV形式で出力するAPI",
-    version="3.0.1"
+    version="3.0.1",
+    lifespan=lifespan
 )
 
 # CORS設定
@@ -85,7 +179,7 @@ class ReceiptResponse(BaseModel):
 class Base64Request(BaseModel):
     """BASE64画像リクエストモデル"""
     image_base64: str
-    model: str = "gemini/gemini-2.5-flash"
+    model: Optional[str] = None
     format: str = "xml"
 
 @app.get("/")
@@ -97,7 +191,9 @@ async def root():
         "endpoints": {
             "process": "/process - レシート画像を処理（ファイルアップロード）",
             "process_base64": "/process_base64 - レシート画像を処理（BASE64）",
-            "health": "/health - ヘルスチェック"
+            "process_stream": "/process_stream - 認識途中の結果をNDJSONでストリーミング",
+            "health": "/health - ヘルスチェック",
+            "metrics": "/metrics - Prometheus形式のメトリクス"
         }
     }
 
@@ -106,11 +202,16 @@ async def health_check():
     """ヘルスチェックエンドポイント"""
     return {"status": "healthy", "service": "harina-v3-api"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus形式のメトリクス（処理件数、ステージ別の処理時間、トークン数、推定コスト）"""
+    return PlainTextResponse(app.state.metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.post("/process", response_model=ReceiptResponse)
 async def process_receipt(
     file: UploadFile = File(..., description="レシート画像ファイル"),
-    model: str = Form(default="gemini/gemini-2.5-flash", description="使用するAIモデル"),
-    format: str = Form(default="xml", description="出力形式 (xml/csv)")
+    model: Optional[str] = Form(default=None, description="使用するAIモデル（HARINA_MODELSのいずれか）"),
+    format: str = Form(default="xml", description="出力形式 (xml/csv/json)")
 ):
     """
     レシート画像を処理してXMLまたはCSV形式で返す
@@ -119,12 +220,12 @@ async def process_receipt(
     - ファイルパスではなくバイナリデータを受け取るため、セキュリティが向上
     - クライアントの環境に依存しない
     - Webブラウザからも直接利用可能
-    - 一時ファイルは自動的にクリーンアップされる
+    - 画像はメモリ上で処理され、一時ファイルを作成しない（読み取り専用コンテナでも動作）
     
     Args:
         file: アップロードされた画像ファイル（バイナリデータ）
-        model: 使用するAIモデル (デフォルト: gemini/gemini-2.5-flash)
-        format: 出力形式 (xml または csv)
+        model: 使用するAIモデル (デフォルト: HARINA_MODELSの先頭)
+        format: 出力形式 (xml、csv または json)
     
     Returns:
         ReceiptResponse: 処理結果
@@ -137,41 +238,28 @@ async def process_receipt(
         )
     
     # 出力形式チェック
-    if format not in ['xml', 'csv']:
+    if format not in OUTPUT_FORMATS:
         raise HTTPException(
             status_code=400,
-            detail="formatは 'xml' または 'csv' を指定してください"
+            detail="formatは 'xml'、'csv' または 'json' を指定してください"
         )
-    
+
+    model, ocr = resolve_model(model)
+
     try:
-        # 一時ファイルに保存
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file_path = Path(temp_file.name)
-        
-        try:
-            # OCR処理
-            ocr = HarinaCore(model_name=model)
-            
-            if format == 'xml':
-                result = ocr.process_receipt(temp_file_path, output_format='xml')
-            else:
-                xml_result = ocr.process_receipt(temp_file_path, output_format='xml')
-                result = convert_xml_to_csv(xml_result)
-            
-            return ReceiptResponse(
-                success=True,
-                data=result,
-                format=format,
-                model=model
-            )
-            
-        finally:
-            # 一時ファイルを削除
-            if temp_file_path.exists():
-                temp_file_path.unlink()
-                
+        # アップロードされた画像をメモリに1回だけ読み込む
+        content = await file.read()
+
+        # OCR処理（モデルごとに共有されるHarinaCoreのネイティブ非同期APIを使用）
+        result = await run_ocr(ocr, content, format)
+
+        return ReceiptResponse(
+            success=True,
+            data=result,
+            format=format,
+            model=model
+        )
+
     except Exception as e:
         return ReceiptResponse(
             success=False,
@@ -180,6 +268,35 @@ async def process_receipt(
             error=str(e)
         )
 
+@app.post("/process_stream")
+async def process_receipt_stream(
+    file: UploadFile = File(..., description="レシート画像ファイル"),
+    model: Optional[str] = Form(default=None, description="使用するAIモデル（HARINA_MODELSのいずれか）")
+):
+    """
+    レシート画像を処理し、認識途中の結果をNDJSON（1行1JSON）でストリーミングする
+
+    店舗情報や商品が読み取れた時点で1行ずつ送信するため、UIは生成の完了を待たずに
+    表示を始められます。最後の行は ``complete: true`` で、整形済みのXMLを ``xml`` に含みます。
+    エラー時は ``error`` を含む行を返します。
+
+    Args:
+        file: アップロードされた画像ファイル（バイナリデータ）
+        model: 使用するAIモデル (デフォルト: HARINA_MODELSの先頭)
+
+    Returns:
+        StreamingResponse: application/x-ndjson
+    """
+    if not file.content_type or not file.content_type.startswith('image/'):
+        raise HTTPException(
+            status_code=400,
+            detail="画像ファイルをアップロードしてください"
+        )
+
+    _, ocr = resolve_model(model)
+    content = await file.read()
+    return StreamingResponse(stream_ocr(ocr, content), media_type="application/x-ndjson")
+
 @app.post("/process_base64", response_model=ReceiptResponse)
 async def process_receipt_base64(request: Base64Request):
     """
@@ -195,12 +312,14 @@ async def process_receipt_base64(request: Base64Request):
         ReceiptResponse: 処理結果
     """
     # 出力形式チェック
-    if request.format not in ['xml', 'csv']:
+    if request.format not in OUTPUT_FORMATS:
         raise HTTPException(
             status_code=400,
-            detail="formatは 'xml' または 'csv' を指定してください"
+            detail="formatは 'xml'、'csv' または 'json' を指定してください"
         )
-    
+
+    model, ocr = resolve_model(request.model)
+
     try:
         # BASE64デコード
         try:
@@ -211,40 +330,23 @@ async def process_receipt_base64(request: Base64Request):
                 detail="無効なBASE64データです"
             )
         
-        # 一時ファイルに保存
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            temp_file.write(image_data)
-            temp_file_path = Path(temp_file.name)
-        
-        try:
-            # OCR処理
-            ocr = HarinaCore(model_name=request.model)
-            
-            if request.format == 'xml':
-                result = ocr.process_receipt(temp_file_path, output_format='xml')
-            else:
-                xml_result = ocr.process_receipt(temp_file_path, output_format='xml')
-                result = convert_xml_to_csv(xml_result)
-            
-            return ReceiptResponse(
-                success=True,
-                data=result,
-                format=request.format,
-                model=request.model
-            )
-            
-        finally:
-            # 一時ファイルを削除
-            if temp_file_path.exists():
-                temp_file_path.unlink()
-                
+        # デコードしたバイト列をそのままエンコーダーへ渡す（JPEGは再エンコードなしで送信）
+        result = await run_ocr(ocr, image_data, request.format)
+
+        return ReceiptResponse(
+            success=True,
+            data=result,
+            format=request.format,
+            model=model
+        )
+
     except HTTPException:
         raise
     except Exception as e:
         return ReceiptResponse(
             success=False,
             format=request.format,
-            model=request.model,
+            model=model,
             error=str(e)
         )
 
@@ -0,0 +1,62 @@
+"""Concurrent batch execution helpers for Harina v3."""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+
+def chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Lazily group ``items`` into lists of at most ``size`` elements."""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(items: Iterable[Any], worker: Callable[[Any], Any],
+              concurrency: int = 1) -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """Run ``worker`` over ``items`` with a bounded pool and yield results as they finish.
+
+    Yields ``(item, result, error)`` tuples in completion order. Exceptions raised
+    by ``worker`` are captured per item so one failing file never stops the batch.
+    At most ``concurrency`` items are in flight, and ``items`` is consumed lazily,
+    so a generator input starts processing before it is exhausted.
+    """
+    concurrency = max(1, int(concurrency))
+
+    if concurrency == 1:
+        for item in items:
+            try:
+                yield item, worker(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="harina") as executor:
+        pending = {}
+
+        def fill():
+            while len(pending) < concurrency:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                pending[executor.submit(worker, item)] = item
+
+        try:
+            fill()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    error = future.exception()
+                    yield item, (None if error else future.result()), error
+                fill()
+        finally:
+            # Drop work that has not started yet if the consumer stops early
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,135 @@
+"""Persistent on-disk result cache for Harina v3."""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from loguru import logger
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 90
+PRUNE_INTERVAL = 100
+
+
+def default_cache_dir() -> Path:
+    """Return the cache directory, honoring HARINA_CACHE_DIR and XDG_CACHE_HOME."""
+    if os.getenv('HARINA_CACHE_DIR'):
+        return Path(os.environ['HARINA_CACHE_DIR']).expanduser()
+    xdg_cache = os.getenv('XDG_CACHE_HOME')
+    base = Path(xdg_cache).expanduser() if xdg_cache else Path.home() / '.cache'
+    return base / 'harina'
+
+
+class ResultCache:
+    """Content-addressed cache of recognized receipts stored in SQLite."""
+
+    def __init__(self, cache_dir: Union[str, Path] = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES, max_age_days: float = DEFAULT_MAX_AGE_DAYS):
+        """Open (or create) the cache database under ``cache_dir``."""
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = self.cache_dir / 'results.sqlite3'
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                       key TEXT PRIMARY KEY,
+                       model TEXT NOT NULL,
+                       value TEXT NOT NULL,
+                       size INTEGER NOT NULL,
+                       created_at REAL NOT NULL,
+                       accessed_at REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)")
+        self.prune()
+
+    @staticmethod
+    def make_key(image_data: Union[bytes, str], prompt_hash: str, model_name: str) -> str:
+        """Build a cache key from the encoded image, prompt hash and model name."""
+        digest = hashlib.sha256()
+        for part in (image_data, prompt_hash, model_name):
+            data = part.encode('utf-8') if isinstance(part, str) else part
+            # Length-prefix each part so different splits never collide
+            digest.update(len(data).to_bytes(8, 'big'))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached result for ``key`` or None when missing or expired."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.max_age_days and now - created_at > self.max_age_days * 86400:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: str, model_name: str = "") -> None:
+        """Store ``value`` under ``key``, pruning the cache periodically."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, model, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, value, len(value.encode('utf-8')), now, now),
+            )
+            self._writes += 1
+            should_prune = self._writes % PRUNE_INTERVAL == 0
+        if should_prune:
+            self.prune()
+
+    def prune(self) -> int:
+        """Evict expired entries, then least recently used ones until under ``max_bytes``."""
+        removed = 0
+        with self._lock, self._conn:
+            if self.max_age_days:
+                cutoff = time.time() - self.max_age_days * 86400
+                removed += self._conn.execute(
+                    "DELETE FROM results WHERE created_at < ?", (cutoff,)
+                ).rowcount
+
+            if self.max_bytes:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self._conn.execute(
+                        "SELECT key, size FROM results ORDER BY accessed_at ASC"
+                    ).fetchall()
+                    stale = []
+                    for key, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        stale.append((key,))
+                        total -= size
+                    self._conn.executemany("DELETE FROM results WHERE key = ?", stale)
+                    removed += len(stale)
+
+        if removed:
+            logger.debug(f"🧹 Evicted {removed} cached results")
+        return removed
+
+    def clear(self) -> None:
+        """Remove every cached result."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results")
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.close()
@@ -1,24 +1,116 @@
 """CLI interface for Harina v3 - Receipt OCR."""
 
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import click
-from dotenv import load_dotenv
 from loguru import logger
-from tqdm import tqdm
 
+from .batch import chunked, run_batch
+from .cache import ResultCache
 from .core import HarinaCore
+from .dedup import DEDUP_FILENAME, DEFAULT_MAX_DISTANCE, HASH_BITS, DuplicateIndex, DuplicateReceiptError
+from .export import AGGREGATE_FORMATS, DEFAULT_FLUSH_EVERY, AggregateWriter
+from .imaging import IMAGE_FORMATS, PreprocessOptions
+from .manifest import MANIFEST_FILENAME, Manifest
+from .metrics import MetricsCollector, jsonl_sink
+from .models import Receipt, write_csv
+from .pipeline import prepare_files, run_pipeline
+from .scan import DEFAULT_SCAN_WORKERS, scan_images
+from .scheduler import DeadLetterQueue, Scheduler
+from .watch import DEFAULT_POLL_INTERVAL, DEFAULT_SETTLE_SECONDS, FolderWatcher
+from .worker import DEFAULT_MAX_ATTEMPTS, FAILED, QUEUE_FILENAME, JobQueue, Worker
 
+DEAD_LETTER_FILENAME = '.harina-dead-letter.jsonl'
 
-def find_image_files(directory: Path):
-    """Find all image files in a directory recursively."""
-    image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp'}
-    image_files = []
-    for file_path in directory.rglob('*'):
-        if file_path.is_file() and file_path.suffix.lower() in image_extensions:
-            image_files.append(file_path)
-    return image_files
+
+def find_image_files(directory: Path, include=(), exclude=(), workers: int = DEFAULT_SCAN_WORKERS):
+    """Lazily find image files in a directory recursively."""
+    return scan_images(directory, include=include, exclude=exclude, workers=workers)
+
+
+def skip_done(image_files, is_done, message: str):
+    """Lazily drop images for which ``is_done`` is true, logging ``message`` with the count at the end."""
+    skipped = 0
+    for image_file in image_files:
+        if is_done(image_file):
+            skipped += 1
+            continue
+        yield image_file
+    if skipped:
+        logger.info(f"⏭️ Skipped {skipped} {message}")
+
+
+def resolve_output_path(image_file: Path, output: Path, format: str) -> Path:
+    """Determine where the output for ``image_file`` should be written."""
+    if output and output.is_dir():
+        # If output is a directory, create file in that directory
+        return output / f"{image_file.stem}.{format}"
+    elif output and not output.suffix:
+        # If output is specified but has no extension, treat it as a directory
+        return Path(output) / f"{image_file.stem}.{format}"
+    elif output:
+        # If output is a file path
+        return output
+    # If no output specified, create file in same directory as input
+    return image_file.parent / f"{image_file.stem}.{format}"
+
+
+def process_image_file(ocr: HarinaCore, image_file: Path, output: Path, format: str, typed: bool = False) -> Path:
+    """Process a single receipt image and save the result, returning the output path."""
+    logger.info(f"📸 Processing receipt image: {image_file.name}")
+    receipt = ocr.process_receipt(image_file, 'receipt')
+    return save_output(image_file, receipt, output, format, typed)
+
+
+def save_output(image_file: Path, receipt: Receipt, output: Path, format: str, typed: bool = False) -> Path:
+    """Save a recognized receipt in the requested format, returning the output path."""
+    output_file = resolve_output_path(image_file, output, format)
+    logger.info(f"💾 Saving {format.upper()} output to: {output_file}")
+    if format == 'xml':
+        output_file.write_text(receipt.to_xml(), encoding='utf-8')
+    elif format == 'csv':
+        with open(output_file, 'w', encoding='utf-8', newline='') as f:
+            write_csv([receipt], f, typed=typed)
+    elif format == 'json':
+        output_file.write_text(receipt.to_json(), encoding='utf-8')
+    return output_file
+
+
+def setup_environment(verbose: bool) -> None:
+    """Configure logging and load ``.env`` files."""
+    from dotenv import load_dotenv
+
+    # Configure logger
+    logger.remove()  # Remove default handler
+    if verbose:
+        logger.add(sys.stderr, format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>", level="DEBUG")
+    else:
+        logger.add(sys.stderr, format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>", level="INFO")
+    
+    # Load .env file from current working directory and project root
+    load_dotenv()  # Load from current directory
+    load_dotenv(Path.cwd() / '.env')  # Explicitly load from project root
+
+
+class DefaultCommandGroup(click.Group):
+    """Command group that runs ``default_command`` when no subcommand is named.
+
+    Keeps ``harina receipt.jpg`` working next to ``harina worker``.
+    """
+
+    def __init__(self, *args, default_command: str = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ('--help', '-h'):
+            args = [self.default_command] + list(args)
+        return super().parse_args(ctx, args)
 
 
 @click.command()
@@ -27,26 +119,84 @@ def find_image_files(directory: Path):
                 help='Output file path (default: same directory as input with .xml or .csv extension)')
 @click.option('--model', default='gemini/gemini-2.5-flash', envvar='HARINA_MODEL',
                 help='Model to use (default: gemini/gemini-2.5-flash). Examples: gpt-4o, claude-3-sonnet-20240229')
-@click.option('--format', '-f', type=click.Choice(['xml', 'csv']), default='xml',
+@click.option('--fallback-model', 'fallback_models', multiple=True,
+                help='Model to try when the previous one fails; repeat for an ordered list (e.g. gpt-4o-mini)')
+@click.option('--hedge', is_flag=True,
+                help='Send a second request when the first is slower than its p95 latency, keeping the first answer')
+@click.option('--stream', is_flag=True,
+                help='Stream responses and stop reading as soon as the receipt XML is complete')
+@click.option('--format', '-f', type=click.Choice(['xml', 'csv', 'json']), default='xml',
                 help='Output format (default: xml)')
+@click.option('--typed-csv', is_flag=True,
+                help='Write CSV amounts as unquoted numbers and quote every text field')
+@click.option('--aggregate', type=click.Path(dir_okay=False, path_type=Path),
+                help=f'Append every receipt to one file ({"/".join(AGGREGATE_FORMATS)}) instead of one output per image; '
+                     'an interrupted run resumes where it stopped')
+@click.option('--parquet', type=click.Path(dir_okay=False, path_type=Path),
+                help='Also write the --aggregate rows as a Parquet file when the run finishes (requires pyarrow)')
+@click.option('--flush-every', type=click.IntRange(min=1), default=DEFAULT_FLUSH_EVERY,
+                help=f'Receipts buffered before --aggregate output is flushed to disk (default: {DEFAULT_FLUSH_EVERY})')
 @click.option('--template', '-t', type=click.Path(exists=True, path_type=Path),
                 help='Path to custom XML template file')
 @click.option('--categories', '-c', type=click.Path(exists=True, path_type=Path),
                 help='Path to custom product categories file')
+@click.option('--max-edge', type=click.IntRange(min=1),
+                help='Downscale images so the long edge is at most this many pixels before upload')
+@click.option('--grayscale', is_flag=True, help='Convert images to grayscale before upload')
+@click.option('--auto-crop', is_flag=True, help='Crop images to the detected receipt paper before upload')
+@click.option('--image-format', type=click.Choice(list(IMAGE_FORMATS)), default='jpeg',
+                help='Encoding used for the uploaded image (default: jpeg)')
+@click.option('--quality', type=click.IntRange(1, 100), default=85,
+                help='JPEG/WebP encoding quality for the uploaded image (default: 85)')
+@click.option('--reencode', is_flag=True,
+                help='Always re-encode images, even JPEGs that could be uploaded unchanged')
+@click.option('--include', multiple=True,
+                help='Only process images matching this glob (relative path or file name); repeatable')
+@click.option('--exclude', multiple=True,
+                help='Skip images and directories matching this glob (e.g. "archive/*"); repeatable')
+@click.option('--scan-workers', type=click.IntRange(min=1), default=DEFAULT_SCAN_WORKERS,
+                help=f'Threads listing subdirectories in parallel (default: {DEFAULT_SCAN_WORKERS})')
+@click.option('--batch-size', type=click.IntRange(min=1), default=1,
+                help='Number of receipt images to send in a single API request (default: 1)')
+@click.option('--concurrency', '-j', type=click.IntRange(min=1), default=1, envvar='HARINA_CONCURRENCY',
+                help='Number of receipts to process in parallel (default: 1)')
+@click.option('--cpu-workers', type=click.IntRange(min=0), default=0, envvar='HARINA_CPU_WORKERS',
+                help='Decode and encode images in this many worker processes, apart from the API calls (default: 0, off)')
+@click.option('--no-cache', is_flag=True,
+                help='Disable the on-disk result cache (default location: ~/.cache/harina)')
+@click.option('--refresh', is_flag=True,
+                help='Ignore cached results and overwrite them with fresh API responses')
+@click.option('--incremental', is_flag=True,
+                help='Skip images whose output is already up to date (tracked in a manifest file)')
+@click.option('--manifest', type=click.Path(dir_okay=False, path_type=Path),
+                help=f'Manifest file for --incremental (default: {MANIFEST_FILENAME} in the input directory)')
+@click.option('--dedup', is_flag=True,
+                help='Reuse the result of an earlier receipt when an image is a near-duplicate of it (perceptual hash)')
+@click.option('--dedup-index', type=click.Path(dir_okay=False, path_type=Path),
+                help=f'Duplicate index for --dedup (default: {DEDUP_FILENAME} in the input directory)')
+@click.option('--dedup-distance', type=click.IntRange(0, HASH_BITS), default=DEFAULT_MAX_DISTANCE,
+                help=f'Maximum differing hash bits for two images to count as duplicates (default: {DEFAULT_MAX_DISTANCE})')
+@click.option('--skip-duplicates', is_flag=True,
+                help='With --dedup, flag and skip near-duplicates instead of writing the earlier result')
+@click.option('--rpm', type=click.FloatRange(min=0, min_open=True), envvar='HARINA_RPM',
+                help='Maximum API requests per minute for the model')
+@click.option('--tpm', type=click.FloatRange(min=0, min_open=True), envvar='HARINA_TPM',
+                help='Maximum API tokens per minute for the model')
+@click.option('--max-retries', type=click.IntRange(min=0), default=5,
+                help='Retries for rate-limited, timed out or failed API calls (default: 5)')
+@click.option('--dead-letter', type=click.Path(dir_okay=False, path_type=Path),
+                help=f'File listing receipts that still failed (default: {DEAD_LETTER_FILENAME} in the input directory)')
+@click.option('--redrive', is_flag=True,
+                help='Treat INPUT_PATH as a dead-letter file and retry the receipts listed in it')
+@click.option('--metrics-file', type=click.Path(dir_okay=False, path_type=Path),
+                help='Append per-receipt timings, tokens and cost to this JSON Lines file')
 @click.option('--verbose', '-v', is_flag=True, help='Enable verbose logging')
-def main(input_path, output, model, format, template, categories, verbose):
-    """Recognize receipt content from image and output as XML or CSV."""
-    
-    # Configure logger
-    logger.remove()  # Remove default handler
-    if verbose:
-        logger.add(sys.stderr, format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>", level="DEBUG")
-    else:
-        logger.add(sys.stderr, format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>", level="INFO")
-    
-    # Load .env file from current working directory and project root
-    load_dotenv()  # Load from current directory
-    load_dotenv(Path.cwd() / '.env')  # Explicitly load from project root
+def main(input_path, output, model, fallback_models, hedge, stream, format, typed_csv, aggregate, parquet, flush_every,
+         template, categories, max_edge, grayscale, auto_crop, image_format, quality, reencode, include, exclude,
+         scan_workers, batch_size, concurrency, cpu_workers, no_cache, refresh, incremental, manifest, dedup, dedup_index,
+         dedup_distance, skip_duplicates, rpm, tpm, max_retries, dead_letter, redrive, metrics_file, verbose):
+    """Recognize receipt content from image and output as XML, CSV or JSON."""
+    setup_environment(verbose)
     
     try:
         # Prepare template and categories paths
@@ -55,63 +205,379 @@ def main(input_path, output, model, format, template, categories, verbose):
         
         # Initialize OCR (API key is read from environment variables automatically)
         logger.info("🔧 Initializing OCR processor...")
-        ocr = HarinaCore(model, template_path=template_path, categories_path=categories_path)
+        cache = None if no_cache else ResultCache()
+        if cache is not None:
+            logger.debug(f"🗄️ Using result cache: {cache.path}")
+        preprocess = PreprocessOptions(max_edge=max_edge, grayscale=grayscale, auto_crop=auto_crop,
+                                       format=image_format, quality=quality, passthrough=not reencode)
+        # Rate limits and retries for every API call; concurrency shrinks on 429s
+        scheduler = Scheduler(rpm=rpm, tpm=tpm, max_concurrency=concurrency, max_retries=max_retries)
+        metrics = MetricsCollector(jsonl_sink(metrics_file) if metrics_file else None)
+        # Re-photographed or re-sent receipts are matched by perceptual hash before any API call
+        duplicate_index = None
+        if dedup:
+            dedup_index = dedup_index or (input_path if input_path.is_dir() else input_path.parent) / DEDUP_FILENAME
+            duplicate_index = DuplicateIndex(dedup_index, max_distance=dedup_distance)
+            logger.info(f"🪞 Duplicate detection: {len(duplicate_index)} known receipts in {dedup_index}")
+        ocr = HarinaCore(model, template_path=template_path, categories_path=categories_path,
+                         cache=cache, refresh_cache=refresh, preprocess=preprocess, scheduler=scheduler,
+                         fallback_models=list(fallback_models), hedge=hedge, stream=stream, metrics=metrics,
+                         dedup=duplicate_index, reuse_duplicates=not skip_duplicates)
         
         # Determine if input_path is a file or directory
-        if input_path.is_file():
+        if redrive:
+            if not input_path.is_file():
+                logger.error(f"❌ --redrive expects a dead-letter file: {input_path}")
+                raise click.Abort()
+            image_files = [Path(source) for source in DeadLetterQueue.read_sources(input_path)]
+            logger.info(f"📬 Re-driving {len(image_files)} receipts from {input_path}")
+        elif input_path.is_file():
             image_files = [input_path]
         elif input_path.is_dir():
-            logger.info(f"📂 Searching for image files in directory: {input_path}")
-            image_files = find_image_files(input_path)
-            logger.info(f"📸 Found {len(image_files)} image files to process")
+            # Processing starts while the directory tree is still being scanned
+            logger.info(f"📂 Scanning for image files in directory: {input_path}")
+            image_files = find_image_files(input_path, include, exclude, scan_workers)
         else:
             logger.error(f"❌ Invalid input path: {input_path}")
             raise click.Abort()
+        # Scans and skip filters are lazy, so their length is unknown up front
+        total = None if input_path.is_dir() or aggregate or incremental else len(image_files)
         
-        # Process each image file
-        for i, image_file in enumerate(tqdm(image_files, desc="Processing receipts", unit="file"), 1):
-            logger.info(f"🚀 Starting receipt processing ({i}/{len(image_files)}): {image_file.name}")
-            logger.info(f"📱 Using model: {model}")
-            
-            try:
-                logger.info("📸 Processing receipt image...")
-                xml_result = ocr.process_receipt(image_file)
-                
-                # Determine output path
-                if output and output.is_dir():
-                    # If output is a directory, create file in that directory
-                    output_file = output / f"{image_file.stem}.{format}"
-                elif output and not output.suffix:
-                    # If output is specified but has no extension, treat it as a directory
-                    output_file = Path(output) / f"{image_file.stem}.{format}"
-                elif output:
-                    # If output is a file path
-                    output_file = output
+        # Append to one aggregate file, skipping receipts an earlier run already wrote
+        aggregate_writer = None
+        if parquet and not aggregate:
+            logger.error("❌ --parquet requires --aggregate")
+            raise click.Abort()
+        if aggregate:
+            aggregate_writer = AggregateWriter(aggregate, flush_every=flush_every, parquet_path=parquet,
+                                               typed=typed_csv)
+            exported = set(aggregate_writer.completed)
+            image_files = skip_done(image_files, lambda image_file: image_file.as_posix() in exported,
+                                    f"receipts already in {aggregate}")
+
+        # Skip unchanged receipts before any image decode or API call
+        receipt_manifest = None
+        if incremental:
+            manifest_path = manifest or (input_path if input_path.is_dir() else input_path.parent) / MANIFEST_FILENAME
+            receipt_manifest = Manifest(manifest_path)
+            image_files = skip_done(
+                image_files,
+                lambda image_file: receipt_manifest.is_up_to_date(
+                    image_file, aggregate or resolve_output_path(image_file, output, format), model, format,
+                    ocr.prompt.hash, preprocess),
+                f"up-to-date receipts (manifest: {manifest_path})")
+
+        # Process image files, saving each output as soon as it is ready
+        logger.info(f"📱 Using model: {model}")
+        if fallback_models:
+            logger.info(f"🔀 Fallback models: {', '.join(fallback_models)}")
+        single_file = input_path.is_file() and not redrive
+        if not single_file and concurrency > 1:
+            logger.info(f"⚡ Processing with concurrency: {concurrency}")
+        if not single_file and batch_size > 1:
+            logger.info(f"📦 Sending up to {batch_size} receipts per API request")
+        if not single_file and cpu_workers:
+            logger.info(f"🧮 Preparing images in {cpu_workers} worker processes")
+
+        def record(image_file, output_file):
+            if receipt_manifest is not None:
+                receipt_manifest.record(image_file, output_file, model, format, ocr.prompt.hash, preprocess)
+
+        def save(image_file, receipt):
+            if aggregate_writer is not None:
+                # Recorded once the writer commits the rows, see committed() below
+                aggregate_writer.add(image_file.as_posix(), receipt, model)
+                return aggregate
+            output_file = save_output(image_file, receipt, output, format, typed_csv)
+            record(image_file, output_file)
+            return output_file
+
+        def committed(sources):
+            # Until a flush is durable a crash truncates these rows, so the manifest must not list them yet
+            for source in sources:
+                record(Path(source), aggregate)
+
+        if aggregate_writer is not None:
+            aggregate_writer.on_commit = committed
+
+        def worker(chunk, prepared=None):
+            """Process a chunk of images, returning ``(image_file, output_file, error)`` per image.
+
+            ``prepared`` holds the chunk's encoded images, or their load errors, from the worker processes.
+            """
+            results = []
+            pending = []
+            for image_file, source in zip(chunk, prepared or chunk):
+                if isinstance(source, Exception):
+                    results.append((image_file, None, source))
                 else:
-                    # If no output specified, create file in same directory as input
-                    output_file = image_file.parent / f"{image_file.stem}.{format}"
-                
-                logger.info(f"💾 Saving {format.upper()} output to: {output_file}")
-                # Save to file
-                if format == 'xml':
-                    output_file.write_text(xml_result, encoding='utf-8')
-                elif format == 'csv':
-                    csv_result = ocr.convert_xml_to_csv(xml_result)
-                    output_file.write_text(csv_result, encoding='utf-8')
-                
-                logger.success(f"✅ Successfully processed receipt! Output saved to: {output_file}")
-                    
-            except Exception as e:
-                logger.error(f"❌ Error processing receipt {image_file.name}: {e}")
-                if len(image_files) == 1:
-                    raise click.Abort()
-                # Continue with next file if processing multiple files
-                continue
-            
+                    pending.append((image_file, source))
+
+            if len(pending) == 1:
+                image_file, source = pending[0]
+                logger.info(f"📸 Processing receipt image: {image_file.name}")
+                try:
+                    results.append((image_file, save(image_file, ocr.process_receipt(source, 'receipt')), None))
+                except Exception as e:
+                    results.append((image_file, None, e))
+                return results
+            if not pending:
+                return results
+
+            logger.info(f"📸 Processing {len(pending)} receipt images in one request")
+            receipts = ocr.process_batch([source for _, source in pending], 'receipt')
+            for (image_file, _), receipt in zip(pending, receipts):
+                if isinstance(receipt, Exception):
+                    results.append((image_file, None, receipt))
+                    continue
+                try:
+                    output_file = save(image_file, receipt)
+                    results.append((image_file, output_file, None))
+                except Exception as e:
+                    results.append((image_file, None, e))
+            return results
+
+        from tqdm import tqdm
+
+        chunks = chunked(image_files, batch_size)
+        if single_file or not cpu_workers:
+            finished = run_batch(chunks, worker, concurrency)
+        else:
+            # Only encoded bytes come back from the worker processes; the API threads keep the GIL free
+            prepare = partial(prepare_files, options=preprocess, fingerprint=duplicate_index is not None)
+            finished = run_pipeline(chunks, prepare, worker, cpu_workers, concurrency,
+                                    log_level='DEBUG' if verbose else 'INFO')
+
+        dead_letters = DeadLetterQueue()
+        resolved = []
+        failed = 0
+        processed = 0
+        duplicates = 0
+        try:
+            with tqdm(total=total, desc="Processing receipts", unit="file") as progress:
+                for chunk, chunk_results, chunk_error in finished:
+                    if chunk_error is not None:
+                        chunk_results = [(image_file, None, chunk_error) for image_file in chunk]
+
+                    for image_file, output_file, error in chunk_results:
+                        progress.update(1)
+                        processed += 1
+                        if error is None:
+                            logger.success(f"✅ Successfully processed receipt! Output saved to: {output_file}")
+                            resolved.append(image_file)
+                            continue
+                        if isinstance(error, DuplicateReceiptError):
+                            logger.warning(f"🪞 Skipped {image_file.name}: {error}")
+                            resolved.append(image_file)
+                            duplicates += 1
+                            continue
+
+                        logger.error(f"❌ Error processing receipt {image_file.name}: {error}")
+                        dead_letters.add(image_file, error)
+                        if single_file:
+                            raise click.Abort()
+                        # Continue with next file if processing multiple files
+                        failed += 1
+        finally:
+            if aggregate_writer is not None:
+                aggregate_writer.close()
+            if receipt_manifest is not None:
+                receipt_manifest.save()
+            if duplicate_index is not None:
+                duplicate_index.close()
+            if duplicates:
+                logger.info(f"🪞 Skipped {duplicates} duplicate receipts")
+            # Where the time and money went, stage by stage
+            if metrics.count > 1 or (verbose and metrics.count):
+                click.echo(metrics.summary(), err=True)
+
+        # Keep failed receipts so they can be retried with --redrive
+        if redrive:
+            dead_letter_path = dead_letter or input_path
+        else:
+            dead_letter_path = dead_letter or (input_path if input_path.is_dir() else input_path.parent) / DEAD_LETTER_FILENAME
+        # Only receipts retried in this run replace their entries, so partial runs keep earlier failures
+        remaining = dead_letters.merge(dead_letter_path, resolved)
+        if failed:
+            logger.warning(f"⚠️ {failed}/{processed} receipts failed to process")
+        if remaining:
+            logger.warning(f"📬 {remaining} failed receipts listed in {dead_letter_path}, retry with: "
+                           f"harina {dead_letter_path} --redrive")
+
     except Exception as e:
         logger.error(f"❌ Error processing receipts: {e}")
         raise click.Abort()
 
 
+
+@click.command()
+@click.option('--queue', 'queue_path', type=click.Path(dir_okay=False, path_type=Path), default=QUEUE_FILENAME,
+                envvar='HARINA_QUEUE', show_default=True, help='SQLite job queue file')
+@click.option('--add', 'add_paths', multiple=True, type=click.Path(exists=True, path_type=Path),
+                help='Enqueue an image, or every image in a directory; repeatable')
+@click.option('--include', multiple=True, help='Only enqueue images matching this glob; repeatable')
+@click.option('--exclude', multiple=True, help='Skip images and directories matching this glob; repeatable')
+@click.option('--output', '-o', type=click.Path(file_okay=False, path_type=Path),
+                help='Directory for outputs (default: next to each image)')
+@click.option('--format', '-f', type=click.Choice(['xml', 'csv', 'json']), default='xml',
+                help='Output format (default: xml)')
+@click.option('--model', default='gemini/gemini-2.5-flash', envvar='HARINA_MODEL',
+                help='Model to use (default: gemini/gemini-2.5-flash)')
+@click.option('--fallback-model', 'fallback_models', multiple=True,
+                help='Model to try when the previous one fails; repeat for an ordered list')
+@click.option('--template', '-t', type=click.Path(exists=True, path_type=Path),
+                help='Path to custom XML template file')
+@click.option('--categories', '-c', type=click.Path(exists=True, path_type=Path),
+                help='Path to custom product categories file')
+@click.option('--concurrency', '-j', type=click.IntRange(min=1), default=4, envvar='HARINA_CONCURRENCY',
+                help='Number of jobs to run in parallel (default: 4)')
+@click.option('--no-cache', is_flag=True, help='Disable the on-disk result cache')
+@click.option('--rpm', type=click.FloatRange(min=0, min_open=True), envvar='HARINA_RPM',
+                help='Maximum API requests per minute for the model')
+@click.option('--tpm', type=click.FloatRange(min=0, min_open=True), envvar='HARINA_TPM',
+                help='Maximum API tokens per minute for the model')
+@click.option('--max-retries', type=click.IntRange(min=0), default=5,
+                help='Immediate retries of a failed API call within one attempt (default: 5)')
+@click.option('--max-attempts', type=click.IntRange(min=1), default=DEFAULT_MAX_ATTEMPTS,
+                help=f'Attempts per job before it is marked failed (default: {DEFAULT_MAX_ATTEMPTS})')
+@click.option('--follow', is_flag=True, help='Keep running and poll the queue for new jobs')
+@click.option('--retry-failed', is_flag=True, help='Queue failed jobs again before starting')
+@click.option('--status', is_flag=True, help='Print job counts and failures, then exit')
+@click.option('--verbose', '-v', is_flag=True, help='Enable verbose logging')
+def worker(queue_path, add_paths, include, exclude, output, format, model, fallback_models, template, categories,
+           concurrency, no_cache, rpm, tpm, max_retries, max_attempts, follow, retry_failed, status, verbose):
+    """Process receipts from a durable job queue, resuming after crashes or restarts."""
+    setup_environment(verbose)
+    queue = JobQueue(queue_path, max_attempts=max_attempts)
+    try:
+        for path in add_paths:
+            sources = scan_images(path, include, exclude) if path.is_dir() else [path]
+            added = queue.enqueue(str(source.resolve()) for source in sources)
+            logger.info(f"📥 Enqueued {added} new jobs from {path}")
+        if retry_failed:
+            logger.info(f"🔁 Re-queued {queue.retry_failed()} failed jobs")
+        if status:
+            counts = queue.counts()
+            click.echo(' '.join(f"{name}={count}" for name, count in counts.items()))
+            for failure in queue.failures():
+                click.echo(f"{failure['source']}\t{failure['attempts']}\t{failure['error']}")
+            return
+
+        if output:
+            output.mkdir(parents=True, exist_ok=True)
+        scheduler = Scheduler(rpm=rpm, tpm=tpm, max_concurrency=concurrency, max_retries=max_retries)
+        metrics = MetricsCollector()
+        ocr = HarinaCore(model, template_path=str(template) if template else None,
+                         categories_path=str(categories) if categories else None,
+                         cache=None if no_cache else ResultCache(), scheduler=scheduler,
+                         fallback_models=list(fallback_models), metrics=metrics)
+
+        def handle(source):
+            logger.info(f"📸 Processing receipt image: {source}")
+            image_file = Path(source)
+            return str(save_output(image_file, ocr.process_receipt(image_file, 'receipt'), output, format))
+
+        job_worker = Worker(queue, handle, concurrency=concurrency)
+        logger.info(f"👷 Worker {queue.worker} processing {queue_path} with model {model}")
+        for job, output_file, error in job_worker.run(follow=follow):
+            if error is None:
+                logger.success(f"✅ {job.source} -> {output_file}")
+            else:
+                logger.error(f"❌ Error processing receipt {job.source}: {error}")
+
+        if metrics.count:
+            click.echo(metrics.summary(), err=True)
+        counts = queue.counts()
+        logger.info("📊 " + ", ".join(f"{name}: {count}" for name, count in counts.items()))
+        if counts[FAILED]:
+            logger.warning(f"⚠️ {counts[FAILED]} jobs failed, retry with: harina worker --queue {queue_path} --retry-failed")
+    except KeyboardInterrupt:
+        logger.warning("⏹️ Interrupted, unfinished jobs will be resumed on the next run")
+        raise click.Abort()
+    except Exception as e:
+        logger.error(f"❌ Worker error: {e}")
+        raise click.Abort()
+    finally:
+        queue.close()
+
+
+@click.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option('--output', '-o', type=click.Path(file_okay=False, path_type=Path),
+                help='Directory for outputs (default: next to each image)')
+@click.option('--format', '-f', type=click.Choice(['xml', 'csv', 'json']), default='xml',
+                help='Output format (default: xml)')
+@click.option('--model', default='gemini/gemini-2.5-flash', envvar='HARINA_MODEL',
+                help='Model to use (default: gemini/gemini-2.5-flash)')
+@click.option('--fallback-model', 'fallback_models', multiple=True,
+                help='Model to try when the previous one fails; repeat for an ordered list')
+@click.option('--template', '-t', type=click.Path(exists=True, path_type=Path),
+                help='Path to custom XML template file')
+@click.option('--categories', '-c', type=click.Path(exists=True, path_type=Path),
+                help='Path to custom product categories file')
+@click.option('--include', multiple=True, help='Only process images matching this glob; repeatable')
+@click.option('--exclude', multiple=True, help='Ignore images and directories matching this glob; repeatable')
+@click.option('--concurrency', '-j', type=click.IntRange(min=1), default=4, envvar='HARINA_CONCURRENCY',
+                help='Number of receipts to process in parallel (default: 4)')
+@click.option('--no-cache', is_flag=True, help='Disable the on-disk result cache')
+@click.option('--rpm', type=click.FloatRange(min=0, min_open=True), envvar='HARINA_RPM',
+                help='Maximum API requests per minute for the model')
+@click.option('--tpm', type=click.FloatRange(min=0, min_open=True), envvar='HARINA_TPM',
+                help='Maximum API tokens per minute for the model')
+@click.option('--max-retries', type=click.IntRange(min=0), default=5,
+                help='Retries for rate-limited, timed out or failed API calls (default: 5)')
+@click.option('--settle', type=click.FloatRange(min=0), default=DEFAULT_SETTLE_SECONDS,
+                help=f'Seconds a file must stop changing before it is processed (default: {DEFAULT_SETTLE_SECONDS})')
+@click.option('--poll-interval', type=click.FloatRange(min=0.1), default=DEFAULT_POLL_INTERVAL,
+                help=f'Seconds between rescans when polling (default: {DEFAULT_POLL_INTERVAL})')
+@click.option('--polling', is_flag=True, help='Poll the directory even when filesystem events are available')
+@click.option('--existing', is_flag=True, help='Also process images already in the directory at startup')
+@click.option('--dead-letter', type=click.Path(dir_okay=False, path_type=Path),
+                help=f'File listing receipts that failed (default: {DEAD_LETTER_FILENAME} in the directory)')
+@click.option('--verbose', '-v', is_flag=True, help='Enable verbose logging')
+def watch(directory, output, format, model, fallback_models, template, categories, include, exclude, concurrency,
+          no_cache, rpm, tpm, max_retries, settle, poll_interval, polling, existing, dead_letter, verbose):
+    """Watch a directory and process new receipt images as soon as they are written."""
+    setup_environment(verbose)
+    if output:
+        output.mkdir(parents=True, exist_ok=True)
+    dead_letter_path = dead_letter or directory / DEAD_LETTER_FILENAME
+    scheduler = Scheduler(rpm=rpm, tpm=tpm, max_concurrency=concurrency, max_retries=max_retries)
+    ocr = HarinaCore(model, template_path=str(template) if template else None,
+                     categories_path=str(categories) if categories else None,
+                     cache=None if no_cache else ResultCache(), scheduler=scheduler,
+                     fallback_models=list(fallback_models))
+    dead_letters = DeadLetterQueue()
+    stopping = threading.Event()
+
+    def handle(image_file, first_seen):
+        if stopping.is_set():
+            return
+        try:
+            logger.info(f"📸 Processing receipt image: {image_file}")
+            output_file = save_output(image_file, ocr.process_receipt(image_file, 'receipt'), output, format)
+        except Exception as e:
+            logger.error(f"❌ Error processing receipt {image_file.name}: {e}")
+            dead_letters.append(dead_letter_path, dead_letters.add(image_file, e))
+            return
+        logger.success(f"✅ {image_file.name} -> {output_file} ({time.monotonic() - first_seen:.1f}s after detection)")
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="harina-watch") as executor:
+        watcher = FolderWatcher(directory, lambda image_file, first_seen: executor.submit(handle, image_file, first_seen),
+                                include=include, exclude=exclude, settle=settle, poll_interval=poll_interval,
+                                polling=polling, process_existing=existing)
+        logger.info(f"👀 Watching {directory} for new receipts (Ctrl+C to stop)")
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            stopping.set()
+            logger.info("⏹️ Stopping, waiting for receipts in progress...")
+
+
+cli = DefaultCommandGroup(
+    name='harina', default_command='process', commands={'process': main, 'worker': worker, 'watch': watch},
+    help='Harina v3 - Receipt OCR. Runs `process` when no command is given (e.g. `harina receipt.jpg`).')
+
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    cli()
\ No newline at end of file
@@ -1,139 +1,745 @@
 """Harina v3 - Receipt OCR using Gemini API with OpenAI-compatible format via LiteLLM."""
 
+import asyncio
+import threading
+import time
 from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
 
-import litellm
 from loguru import logger
-from PIL import Image
 
+from .cache import ResultCache
+from .dedup import DuplicateIndex, DuplicateReceiptError, image_dhash
+from .errors import ReceiptProcessingError
+from .imaging import EncodedImage, ImageSource, PreprocessOptions, describe_source, prepare_image
+from .metrics import MetricsCollector, ReceiptMetrics, payload_bytes
+from .models import Receipt
+from .prompt import ReceiptPrompt
+from .routing import MAX_ROUTE_WORKERS, AttemptCancelled, Router
+from .scheduler import Scheduler, estimate_tokens
+from .streaming import ReceiptProgress, ReceiptStreamParser, delta_text
 from .utils import (
-    image_to_base64,
+    extract_receipts,
     extract_xml,
-    format_xml,
-    convert_xml_to_csv
+    parse_xml
 )
 
+# Providers whose LiteLLM handlers accept a shared AsyncHTTPHandler via ``client``.
+# Other providers fall back to LiteLLM's own cached clients.
+ASYNC_CLIENT_PROVIDERS = {'gemini', 'vertex_ai', 'vertex_ai_beta', 'anthropic'}
+
+
+def __getattr__(name: str):
+    # litellm takes seconds to import, so it is loaded on the first API call
+    # rather than with this module; ``harina.core.litellm`` still resolves to it.
+    if name == 'litellm':
+        import litellm
+        return litellm
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class HarinaCore:
     """Receipt OCR processor using Gemini API via LiteLLM."""
 
     def __init__(self, model_name: str = "gemini/gemini-1.5-flash",
-                 template_path: str = None, categories_path: str = None):
-        """Initialize with model name."""
+                 template_path: str = None, categories_path: str = None,
+                 cache: Optional[ResultCache] = None, refresh_cache: bool = False,
+                 preprocess: Optional[PreprocessOptions] = None,
+                 timeout: Optional[float] = None,
+                 scheduler: Optional[Scheduler] = None,
+                 fallback_models: Optional[List[str]] = None, hedge: bool = False,
+                 stream: bool = False, metrics: Optional[MetricsCollector] = None,
+                 dedup: Optional[DuplicateIndex] = None, reuse_duplicates: bool = True):
+        """Initialize with model name.
+
+        When ``cache`` is given, results are looked up by image, prompt and model
+        before calling the API. ``refresh_cache`` skips lookups but still stores
+        fresh results. ``preprocess`` controls downscaling and re-encoding of the
+        image before upload. ``timeout`` limits each API call in seconds.
+        ``scheduler`` applies rate limits and retries to every API call and may
+        be shared between instances. ``fallback_models`` are tried in order
+        when ``model_name`` fails, and ``hedge`` sends a second request when
+        the first is slower than its model's p95 latency. Cached results are
+        keyed by ``model_name`` whichever model answered. ``stream`` reads
+        responses as a stream and stops as soon as ``</receipt>`` closes.
+        ``metrics`` receives a :class:`ReceiptMetrics` record for every receipt.
+        With ``dedup``, images within the index's Hamming distance of an earlier
+        receipt reuse its result, or raise :class:`DuplicateReceiptError` when
+        ``reuse_duplicates`` is False, instead of calling the API.
+        """
         self.model_name = model_name
         self.template_path = template_path
         self.categories_path = categories_path
+        self.prompt = ReceiptPrompt(template_path, categories_path)
+        self.cache = cache
+        self.refresh_cache = refresh_cache
+        self.preprocess = preprocess or PreprocessOptions()
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.stream = stream
+        self.metrics = metrics
+        self.dedup = dedup
+        self.reuse_duplicates = reuse_duplicates
+        # Room for a primary and a hedge per request the scheduler lets through
+        max_workers = max(MAX_ROUTE_WORKERS, 2 * scheduler.max_concurrency) if scheduler else MAX_ROUTE_WORKERS
+        self.router = Router([model_name, *(fallback_models or [])], hedge=hedge, max_workers=max_workers)
+        self._async_clients: Dict[str, Any] = {}
+        self._async_client_loop = None
 
-    def _load_xml_template(self) -> str:
-        """Load XML template from file."""
-        if self.template_path:
-            template_path = Path(self.template_path)
-        else:
-            template_path = Path(__file__).parent / "receipt_template.xml"
+    def _prepare(self, image_path: ImageSource) -> EncodedImage:
+        """Load, preprocess and encode an image for upload."""
+        logger.debug(f"📂 Loading image: {describe_source(image_path)}")
         try:
-            return template_path.read_text(encoding='utf-8')
+            encoded_image = prepare_image(image_path, self.preprocess)
         except Exception as e:
-            raise ValueError(f"Failed to load XML template: {e}") from e
-
-    def _load_product_categories(self) -> str:
-        """Load product categories from file."""
-        if self.categories_path:
-            categories_path = Path(self.categories_path)
-        else:
-            categories_path = Path(__file__).parent / "product_categories.xml"
+            logger.error(f"❌ Failed to load image: {e}")
+            raise ValueError(f"Failed to load image: {e}") from e
+        if encoded_image.source is None and isinstance(image_path, (str, Path)):
+            encoded_image.source = str(image_path)
+        logger.info(f"📐 Encoded image: {encoded_image.width}x{encoded_image.height} "
+                    f"({encoded_image.pixels} pixels), {len(encoded_image.data)} bytes "
+                    f"{self.preprocess.format.upper()}"
+                    f"{' (original bytes)' if encoded_image.passthrough else ''}")
+        return encoded_image
+
+    def _lookup_cache(self, encoded_image: EncodedImage) -> Tuple[Optional[str], Optional[Receipt]]:
+        """Return ``(cache_key, cached_receipt)`` for an encoded image.
+
+        Near-duplicates of earlier receipts are checked first, so exact copies
+        are flagged too when duplicates are not reused.
+        """
+        if self.dedup is not None:
+            duplicate_receipt = self._lookup_duplicate(encoded_image)
+            if duplicate_receipt is not None:
+                return None, duplicate_receipt
+        if self.cache is None:
+            return None, None
+        cache_key = ResultCache.make_key(encoded_image.data, self.prompt.hash, self.model_name)
+        if self.refresh_cache:
+            return cache_key, None
+        cached_xml = self.cache.get(cache_key)
+        if cached_xml is None:
+            return cache_key, None
         try:
-            return categories_path.read_text(encoding='utf-8')
-        except Exception as e:
-            raise ValueError(f"Failed to load product categories: {e}") from e
+            cached_receipt = Receipt.from_xml(cached_xml)
+        except Exception:
+            # Entries written before results had to be valid XML are treated as misses
+            return cache_key, None
+        logger.info("♻️ Using cached result")
+        return cache_key, cached_receipt
+
+    @property
+    def _dedup_scope(self) -> str:
+        # Results are only reused for the same model and prompt, like cache keys
+        return f"{self.model_name}:{self.prompt.hash}"
+
+    def _lookup_duplicate(self, encoded_image: EncodedImage) -> Optional[Receipt]:
+        """Hash the image and return the receipt of a near-duplicate processed earlier, if any."""
+        if encoded_image.fingerprint is None:
+            try:
+                encoded_image.fingerprint = image_dhash(encoded_image.data)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not hash image for duplicate detection: {e}")
+                return None
+        if self.refresh_cache:
+            return None
+        duplicate = self.dedup.find(encoded_image.fingerprint, self._dedup_scope,
+                                    source=self._dedup_source(encoded_image))
+        if duplicate is None:
+            return None
+        if not self.reuse_duplicates:
+            raise DuplicateReceiptError(duplicate)
+        try:
+            receipt = Receipt.from_xml(duplicate.xml)
+        except Exception:
+            return None
+        logger.info(f"🪞 Duplicate of {duplicate.source} (hash distance {duplicate.distance}), reusing its result")
+        return receipt
+
+    @staticmethod
+    def _dedup_source(encoded_image: EncodedImage) -> Optional[str]:
+        # Files are named by absolute path so a rerun finds and replaces its own entry
+        return str(Path(encoded_image.source).resolve()) if encoded_image.source else None
+
+    def _store(self, cache_key: Optional[str], encoded_image: EncodedImage, receipt: Receipt, source: str) -> None:
+        """Remember a fresh result in the cache and the duplicate index."""
+        if cache_key is not None:
+            self.cache.set(cache_key, receipt.xml, self.model_name)
+        if self.dedup is not None and encoded_image.fingerprint is not None:
+            dedup_source = self._dedup_source(encoded_image)
+            self.dedup.add(encoded_image.fingerprint, dedup_source or source, receipt.xml, self._dedup_scope,
+                           replace=dedup_source is not None)
+
+    def _build_messages(self, encoded_image: EncodedImage) -> list:
+        """Create chat messages for LiteLLM."""
+        logger.info("🤖 Preparing API request...")
+        # Prompt is rendered once and only reloaded when its source files change
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": self.prompt.text
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": encoded_image.to_data_url()
+                        }
+                    }
+                ]
+            }
+        ]
+
+    def _complete(self, model: str, messages: list, stream: bool = False):
+        """Call the completion API, through the scheduler when one is set."""
+        import litellm
+
+        def call():
+            return litellm.completion(
+                model=model,
+                messages=messages,
+                timeout=self.timeout,
+                **({'stream': True} if stream else {})
+            )
+
+        if self.scheduler is None:
+            return call()
+        # A stream keeps its slot until it has been read or closed
+        return self.scheduler.call(model, call, estimate_tokens(messages), stream=stream,
+                                   close_stream=self._close_stream)
+
+    def _request(self, messages: list, parse: Callable[[Any], Any], stream: bool = False,
+                 metrics: Optional[ReceiptMetrics] = None) -> Any:
+        """Send ``messages`` through the router and return the first valid parsed answer.
+
+        The usage of every response that arrives before the winner, including
+        failed fallback and hedged attempts, is added to ``metrics``. A hedged
+        loser still running afterwards is abandoned: its stream is closed at
+        the next chunk and a late response's usage is dropped. API time is the
+        wall time until the winning answer, so concurrent hedged attempts are
+        not counted twice; parse time is the winner's.
+        """
+        metrics = metrics or ReceiptMetrics()
+        settled = threading.Event()
+        lock = threading.Lock()
 
-    def process_receipt(self, image_path: Path, output_format: str = 'xml') -> str:
-        """Process receipt image and return XML or CSV format."""
+        def call(model):
+            response = self._complete(model, messages, stream)
+            if stream:
+                # Reading a stream is mostly waiting for the model
+                return model, parse(self._until_settled(response, settled)), None
+            with lock:
+                if settled.is_set():
+                    raise AttemptCancelled(model)
+                metrics.add_usage(response, model)
+            start = time.perf_counter()
+            result = parse(response)
+            return model, result, time.perf_counter() - start
 
-        # Load and validate image
-        logger.debug(f"📂 Loading image: {image_path}")
         try:
-            image = Image.open(image_path)
-            logger.debug(f"✅ Image loaded successfully: {image.size} pixels, mode: {image.mode}")
+            with metrics.stage('api'):
+                model, result, parse_seconds = self.router.call(call)
+        finally:
+            with lock:
+                settled.set()
+        self._finish_request(metrics, model, parse_seconds)
+        return result
+
+    def _until_settled(self, stream, settled: threading.Event):
+        """Yield ``stream``'s chunks until ``settled`` is set, closing it when reading stops."""
+        try:
+            for chunk in stream:
+                if settled.is_set():
+                    raise AttemptCancelled()
+                yield chunk
+        finally:
+            self._close_stream(stream)
+
+    @staticmethod
+    def _finish_request(metrics: ReceiptMetrics, model: str, parse_seconds: Optional[float]) -> None:
+        """Credit the answering model and move the winner's parse time out of the API stage."""
+        metrics.model = model
+        if parse_seconds is not None:
+            metrics.stages['api'] -= parse_seconds
+            metrics.stages['parse'] = metrics.stages.get('parse', 0.0) + parse_seconds
+
+    async def _acomplete(self, model: str, messages: list, stream: bool = False):
+        """Async version of :meth:`_complete` with a pooled HTTP client."""
+        import litellm
+
+        kwargs = {}
+        client = await self._get_async_client(model)
+        if client is not None:
+            kwargs['client'] = client
+
+        async def call():
+            try:
+                return await asyncio.wait_for(
+                    litellm.acompletion(
+                        model=model,
+                        messages=messages,
+                        timeout=self.timeout,
+                        **({'stream': True} if stream else {}),
+                        **kwargs
+                    ),
+                    timeout=self.timeout
+                )
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"API call timed out after {self.timeout} seconds") from None
+
+        if self.scheduler is None:
+            return await call()
+        return await self.scheduler.acall(model, call, estimate_tokens(messages), stream=stream)
+
+    async def _arequest(self, messages: list, parse: Callable[[Any], Any], stream: bool = False,
+                        metrics: Optional[ReceiptMetrics] = None) -> Any:
+        """Async version of :meth:`_request`; ``parse`` may be a coroutine function."""
+        metrics = metrics or ReceiptMetrics()
+
+        async def call(model):
+            response = await self._acomplete(model, messages, stream)
+            if stream:
+                return model, await parse(response), None
+            metrics.add_usage(response, model)
+            start = time.perf_counter()
+            result = parse(response)
+            if asyncio.iscoroutine(result):
+                result = await result
+            return model, result, time.perf_counter() - start
+
+        with metrics.stage('api'):
+            model, result, parse_seconds = await self.router.acall(call)
+        self._finish_request(metrics, model, parse_seconds)
+        return result
+
+    def _parse_response(self, response) -> Receipt:
+        """Extract the receipt from a completion response."""
+        if not response.choices or not response.choices[0].message.content:
+            logger.error("❌ No response from API")
+            raise ValueError("No response from Gemini API")
+
+        response_text = response.choices[0].message.content
+        logger.info("✅ Received response from API")
+        return self._format_response_text(response_text)
+
+    def _parse_stream(self, stream, on_progress=None) -> Receipt:
+        """Consume a streamed response until the receipt closes, then parse it."""
+        parser = ReceiptStreamParser(on_progress)
+        try:
+            for chunk in stream:
+                if parser.feed(delta_text(chunk)):
+                    break
+        finally:
+            self._close_stream(stream)
+        return self._finish_stream(parser)
+
+    @staticmethod
+    def _close_stream(stream) -> None:
+        """Close a sync stream so its HTTP response is released when reading stops early.
+
+        LiteLLM's ``CustomStreamWrapper`` only has ``aclose``; the provider
+        iterator in its ``completion_stream`` owns the response.
+        """
+        try:
+            close = getattr(stream, 'close', None)
+            if callable(close):
+                close()
+                return
+            inner = getattr(stream, 'completion_stream', None)
+            if inner is None:
+                return
+            stream.completion_stream = None
+            for target in (inner, getattr(inner, 'response', None)):
+                close = getattr(target, 'close', None)
+                if callable(close):
+                    close()
+                    return
         except Exception as e:
-            logger.error(f"❌ Failed to load image: {e}")
-            raise ValueError(f"Failed to load image: {e}") from e
+            logger.debug(f"Could not close response stream: {e}")
 
-        # Convert image to base64
-        logger.debug("🔄 Converting image to base64...")
-        image_base64 = image_to_base64(image)
-        logger.debug(f"✅ Image converted to base64 ({len(image_base64)} characters)")
+    async def _aparse_stream(self, stream, on_progress=None) -> Receipt:
+        """Async version of :meth:`_parse_stream`."""
+        parser = ReceiptStreamParser(on_progress)
+        try:
+            async for chunk in stream:
+                if parser.feed(delta_text(chunk)):
+                    break
+        finally:
+            aclose = getattr(stream, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+        return self._finish_stream(parser)
 
-        # Load XML template and product categories
-        logger.debug("📋 Loading XML template and product categories...")
-        xml_template = self._load_xml_template()
-        product_categories = self._load_product_categories()
-        logger.debug("✅ Templates loaded successfully")
+    def _finish_stream(self, parser: ReceiptStreamParser) -> Receipt:
+        if not parser.text.strip():
+            logger.error("❌ No response from API")
+            raise ValueError("No response from Gemini API")
+        if parser.done:
+            logger.info(f"✅ Receipt closed after {len(parser.text)} streamed characters, stopped reading")
+        return self._format_response_text(parser.result())
 
-        # Create prompt for receipt recognition
-        prompt = f"""このレシート画像を分析して、以下のXML形式で情報を抽出してください：
+    def _format_response_text(self, response_text: str) -> Receipt:
+        """Extract the receipt XML from response text and parse it into a Receipt."""
+        # Extract XML from response
+        logger.info("🔍 Extracting XML content from response...")
+        xml_content = extract_xml(response_text)
+        logger.debug("✅ XML content extracted successfully")
 
-{xml_template}
+        # Validate and format XML
+        logger.info("📝 Formatting and validating XML...")
+        receipt = self._build_receipt(xml_content)
+        logger.info("✅ XML formatted and validated successfully")
+        return receipt
 
-商品のカテゴリ分けには以下の分類を参考にしてください：
+    @staticmethod
+    def _build_receipt(xml_content: str) -> Receipt:
+        """Format receipt XML and build the model from the same parse."""
+        formatted_xml, root = parse_xml(xml_content)
+        if root is None:
+            raise ValueError("Response does not contain valid receipt XML")
+        return Receipt.from_element(root, formatted_xml)
 
-{product_categories}
+    def process_receipt(self, image_path: ImageSource, output_format: str = 'xml',
+                        on_progress: Optional[Callable[[ReceiptProgress], None]] = None):
+        """Process receipt image and return XML, CSV or JSON text, or a Receipt.
 
-各商品について、最も適切なカテゴリとサブカテゴリを選択してください。
-情報が読み取れない場合は、該当する要素を空にするか省略してください。
-数値は数字のみで出力し、通貨記号は含めないでください。
-XMLタグのみを出力し、他の説明文は含めないでください。
-"""
+        ``output_format`` is ``'xml'``, ``'csv'``, ``'json'`` or ``'receipt'``
+        for the parsed :class:`Receipt` itself; every format renders from the
+        same single parse of the response.
 
+        ``image_path`` may also be raw image bytes, a binary file-like object or
+        a PIL image, so callers holding the image in memory need no temp file.
+        ``on_progress`` streams the response and is called with partial
+        results as sections and items are recognized.
+        """
+        metrics = ReceiptMetrics(source=describe_source(image_path), model=self.model_name)
         try:
-            # Create messages for LiteLLM
-            logger.info("🤖 Preparing API request...")
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
-                        }
-                    ]
-                }
-            ]
+            with metrics.stage('total'):
+                with metrics.stage('prepare'):
+                    encoded_image = self._prepare(image_path)
+                metrics.image_bytes = len(encoded_image.data)
+
+                cache_key, cached_receipt = self._lookup_cache(encoded_image)
+                if cached_receipt is not None:
+                    metrics.cached = True
+                    self._report_complete(cached_receipt, on_progress)
+                    return self._render_output(cached_receipt, output_format)
+
+                return self._process_encoded(encoded_image, cache_key, output_format, on_progress, metrics)
+        except DuplicateReceiptError:
+            # Flagged, not failed: the API was never called
+            metrics.cached = True
+            raise
+        except Exception as e:
+            metrics.succeeded = False
+            metrics.error = str(e)
+            raise
+        finally:
+            self._record(metrics)
+
+    def _record(self, metrics: ReceiptMetrics) -> None:
+        """Log a receipt's metrics and hand them to the collector."""
+        logger.info(f"⏱️ {metrics.source}: {metrics.describe()}")
+        if self.metrics is not None:
+            self.metrics.record(metrics)
+
+    def _process_encoded(self, encoded_image: EncodedImage, cache_key: Optional[str],
+                         output_format: str,
+                         on_progress: Optional[Callable[[ReceiptProgress], None]] = None,
+                         metrics: Optional[ReceiptMetrics] = None):
+        """Send one encoded image to the API and return the rendered result."""
+        metrics = metrics or ReceiptMetrics()
+        try:
+            messages = self._build_messages(encoded_image)
+            metrics.request_bytes += payload_bytes(messages)
 
             # Call LiteLLM (API key is read from environment variables automatically)
             logger.info(f"🌐 Calling {self.model_name} API...")
-            response = litellm.completion(
-                model=self.model_name,
-                messages=messages
-            )
+            if self.stream or on_progress is not None:
+                receipt = self._request(
+                    messages, lambda stream: self._parse_stream(stream, on_progress), stream=True,
+                    metrics=metrics)
+            else:
+                receipt = self._request(messages, self._parse_response, metrics=metrics)
+
+            self._store(cache_key, encoded_image, receipt, metrics.source)
+            self._report_complete(receipt, on_progress)
+
+            return self._render_output(receipt, output_format)
+
+        except Exception as e:
+            error = ReceiptProcessingError.from_exception(e)
+            logger.error(f"❌ {error}")
+            raise error
+
+    def _build_batch_messages(self, encoded_images: List[EncodedImage]) -> list:
+        """Create one chat message carrying several receipt images."""
+        content = [{"type": "text", "text": self.prompt.render_batch(len(encoded_images))}]
+        for index, encoded_image in enumerate(encoded_images, 1):
+            content.append({"type": "text", "text": f"画像 {index}:"})
+            content.append({"type": "image_url", "image_url": {"url": encoded_image.to_data_url()}})
+        return [{"role": "user", "content": content}]
+
+    @staticmethod
+    def _parse_batch_response(response) -> dict:
+        """Extract the indexed receipts from a batched completion response."""
+        if not response.choices or not response.choices[0].message.content:
+            raise ValueError("No response from API")
+        receipts = extract_receipts(response.choices[0].message.content)
+        if not receipts:
+            raise ValueError("No <receipt> elements in batched response")
+        return receipts
+
+    def process_batch(self, image_paths: Iterable[ImageSource], output_format: str = 'xml',
+                      return_exceptions: bool = True) -> List:
+        """Process several receipts with a single API call sharing one prompt.
+
+        The model is asked for a ``<receipts>`` wrapper with one indexed
+        ``<receipt>`` per image. Each receipt is validated and formatted
+        separately; any image whose receipt is missing or malformed is retried
+        alone in its own request. Results are returned in input order.
+        With ``return_exceptions`` a failed image yields its exception instead
+        of raising. Each receipt's metrics carry its share of the batched
+        request's tokens and cost.
+        """
+        started = time.perf_counter()
+        image_paths = list(image_paths)
+        results: List = [None] * len(image_paths)
+        metrics = [ReceiptMetrics(source=describe_source(image_path), model=self.model_name)
+                   for image_path in image_paths]
+        pending = []
+
+        def finish(position: int, result: Any) -> None:
+            results[position] = result
+            receipt_metrics = metrics[position]
+            receipt_metrics.stages['total'] = time.perf_counter() - started
+            if isinstance(result, DuplicateReceiptError):
+                receipt_metrics.cached = True
+            elif isinstance(result, Exception):
+                receipt_metrics.succeeded = False
+                receipt_metrics.error = str(result)
+            self._record(receipt_metrics)
+
+        for position, image_path in enumerate(image_paths):
+            try:
+                with metrics[position].stage('prepare'):
+                    encoded_image = self._prepare(image_path)
+                metrics[position].image_bytes = len(encoded_image.data)
+                cache_key, cached_receipt = self._lookup_cache(encoded_image)
+            except Exception as e:
+                finish(position, e)
+                if not return_exceptions:
+                    raise
+                continue
+            if cached_receipt is not None:
+                metrics[position].cached = True
+                finish(position, self._render_output(cached_receipt, output_format))
+            else:
+                pending.append((position, encoded_image, cache_key))
+
+        receipts = {}
+        if len(pending) > 1:
+            batch_metrics = ReceiptMetrics(model=self.model_name)
+            try:
+                logger.info(f"🌐 Calling {self.model_name} API with {len(pending)} receipts...")
+                messages = self._build_batch_messages([encoded for _, encoded, _ in pending])
+                batch_metrics.request_bytes = payload_bytes(messages)
+                receipts = self._request(messages, self._parse_batch_response, metrics=batch_metrics)
+                logger.info(f"✅ Received {len(receipts)}/{len(pending)} receipts from batched response")
+            except Exception as e:
+                logger.warning(f"⚠️ Batched request failed, retrying receipts one by one: {e}")
+            for position, _, _ in pending:
+                metrics[position].add_share(batch_metrics, len(pending))
+
+        for index, (position, encoded_image, cache_key) in enumerate(pending, 1):
+            receipt_metrics = metrics[position]
+            try:
+                if index in receipts:
+                    with receipt_metrics.stage('parse'):
+                        receipt = self._build_receipt(receipts[index])
+                    self._store(cache_key, encoded_image, receipt, receipt_metrics.source)
+                    result = self._render_output(receipt, output_format)
+                else:
+                    if len(pending) > 1:
+                        logger.info(f"🔁 Receipt {index} missing from batched response, retrying alone")
+                    result = self._process_encoded(encoded_image, cache_key, output_format,
+                                                   metrics=receipt_metrics)
+            except Exception as e:
+                finish(position, e)
+                if not return_exceptions:
+                    raise
+                continue
+            finish(position, result)
+
+        return results
+
+    async def _get_async_client(self, model: str):
+        """Return the pooled HTTP client shared by async calls to ``model``'s provider.
 
-            if not response.choices or not response.choices[0].message.content:
-                logger.error("❌ No response from API")
-                raise ValueError("No response from Gemini API")
+        httpx clients are bound to an event loop, so new clients are created
+        if the instance is used from a different loop; the old ones are closed first.
+        """
+        import litellm
 
-            response_text = response.choices[0].message.content
-            logger.info("✅ Received response from API")
+        try:
+            _, provider, _, _ = litellm.get_llm_provider(model)
+        except Exception:
+            return None
+        if provider not in ASYNC_CLIENT_PROVIDERS:
+            return None
+
+        loop = asyncio.get_running_loop()
+        if self._async_client_loop is not loop:
+            stale, stale_loop = self._async_clients, self._async_client_loop
+            self._async_clients = {}
+            self._async_client_loop = loop
+            await self._close_clients(stale, stale_loop)
+        if provider not in self._async_clients:
+            from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+            self._async_clients[provider] = AsyncHTTPHandler(timeout=self.timeout)
+        return self._async_clients[provider]
+
+    async def aprocess_receipt(self, image_path: ImageSource, output_format: str = 'xml',
+                               on_progress: Optional[Callable[[ReceiptProgress], None]] = None):
+        """Asynchronously process a receipt image, rendered as in :meth:`process_receipt`.
+
+        Image decoding and encoding run in the default executor, the API call
+        uses ``litellm.acompletion`` so no thread is held while waiting. The
+        call is cancellable and honors ``timeout``. ``on_progress`` works as in
+        :meth:`process_receipt`.
+        """
+        metrics = ReceiptMetrics(source=describe_source(image_path), model=self.model_name)
+        try:
+            with metrics.stage('total'):
+                return await self._aprocess(image_path, output_format, on_progress, metrics)
+        except DuplicateReceiptError:
+            # Flagged, not failed: the API was never called
+            metrics.cached = True
+            raise
+        except Exception as e:
+            metrics.succeeded = False
+            metrics.error = str(e)
+            raise
+        finally:
+            self._record(metrics)
 
-            # Extract XML from response
-            logger.info("🔍 Extracting XML content from response...")
-            xml_content = extract_xml(response_text)
-            logger.debug("✅ XML content extracted successfully")
+    async def _aprocess(self, image_path: ImageSource, output_format: str,
+                        on_progress: Optional[Callable[[ReceiptProgress], None]],
+                        metrics: ReceiptMetrics):
+        loop = asyncio.get_running_loop()
+        with metrics.stage('prepare'):
+            encoded_image = await loop.run_in_executor(None, self._prepare, image_path)
+        metrics.image_bytes = len(encoded_image.data)
 
-            # Validate and format XML
-            logger.info("📝 Formatting and validating XML...")
-            formatted_xml = format_xml(xml_content)
-            logger.info("✅ XML formatted and validated successfully")
+        # Hashing the image and the SQLite lookups would otherwise stall every other receipt on the loop
+        cache_key, cached_receipt = await loop.run_in_executor(None, self._lookup_cache, encoded_image)
+        if cached_receipt is not None:
+            metrics.cached = True
+            self._report_complete(cached_receipt, on_progress)
+            return self._render_output(cached_receipt, output_format)
 
-            if output_format.lower() == 'csv':
-                return convert_xml_to_csv(formatted_xml)
+        try:
+            messages = self._build_messages(encoded_image)
+            metrics.request_bytes += payload_bytes(messages)
+
+            logger.info(f"🌐 Calling {self.model_name} API (async)...")
+            if self.stream or on_progress is not None:
+                receipt = await self._arequest(
+                    messages, lambda stream: self._aparse_stream(stream, on_progress), stream=True,
+                    metrics=metrics)
             else:
-                return formatted_xml
+                receipt = await self._arequest(messages, self._parse_response, metrics=metrics)
+
+            await loop.run_in_executor(None, self._store, cache_key, encoded_image, receipt, metrics.source)
+            self._report_complete(receipt, on_progress)
+
+            return self._render_output(receipt, output_format)
 
         except Exception as e:
-            logger.error(f"❌ Failed to process receipt: {e}")
-            raise RuntimeError(f"Failed to process receipt: {e}") from e
+            error = ReceiptProcessingError.from_exception(e)
+            logger.error(f"❌ {error}")
+            raise error
+
+    async def astream_receipt(self, image_path: ImageSource) -> AsyncIterator[ReceiptProgress]:
+        """Yield partial results while a receipt is recognized.
+
+        The last update has ``complete`` set and carries the formatted XML.
+        Errors are raised from the iterator; closing it early cancels the call.
+        """
+        updates: asyncio.Queue = asyncio.Queue()
+        task = asyncio.ensure_future(self.aprocess_receipt(image_path, on_progress=updates.put_nowait))
+        task.add_done_callback(lambda _: updates.put_nowait(None))
+        try:
+            while True:
+                update = await updates.get()
+                if update is None:
+                    break
+                yield update
+            # Surface any failure
+            await task
+        finally:
+            if not task.done():
+                task.cancel()
+
+    @staticmethod
+    def _report_complete(receipt: Receipt, on_progress: Optional[Callable[[ReceiptProgress], None]]) -> None:
+        """Send the final, complete progress update."""
+        if on_progress is not None:
+            on_progress(ReceiptProgress.from_xml(receipt.xml))
+
+    async def aprocess_many(self, image_paths: Iterable[ImageSource], output_format: str = 'xml',
+                            concurrency: int = 16, return_exceptions: bool = True) -> List:
+        """Process many receipts concurrently on the current event loop.
+
+        Results are returned in input order. With ``return_exceptions`` a failed
+        receipt yields its exception instead of aborting the batch; otherwise
+        the first failure cancels the remaining receipts. Cancelling the caller
+        cancels every in-flight receipt.
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(image_path):
+            async with semaphore:
+                return await self.aprocess_receipt(image_path, output_format)
+
+        tasks = [asyncio.ensure_future(run(image_path)) for image_path in image_paths]
+        try:
+            return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    @staticmethod
+    async def _close_clients(clients: Dict[str, Any], owner=None) -> None:
+        """Close HTTP clients created on ``owner``, on that loop if it is still running elsewhere."""
+        current = asyncio.get_running_loop()
+        for provider, client in clients.items():
+            try:
+                if owner is not None and owner is not current and owner.is_running():
+                    await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.close(), owner))
+                else:
+                    await client.close()
+            except Exception as e:
+                logger.debug(f"Failed to close the {provider} HTTP client: {e}")
+
+    async def aclose(self) -> None:
+        """Close the pooled async HTTP clients."""
+        clients, self._async_clients = self._async_clients, {}
+        owner, self._async_client_loop = self._async_client_loop, None
+        await self._close_clients(clients, owner)
+        self.router.close()
+
+    @staticmethod
+    def _render_output(receipt: Receipt, output_format: str):
+        """Render a receipt in the requested output format."""
+        output_format = output_format.lower()
+        if output_format == 'receipt':
+            return receipt
+        if output_format == 'csv':
+            return receipt.to_csv()
+        if output_format == 'json':
+            return receipt.to_json()
+        return receipt.xml
@@ -0,0 +1,250 @@
+"""Perceptual-hash detection of duplicate receipt images for Harina v3."""
+
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from itertools import combinations
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from loguru import logger
+from PIL import Image
+
+from .imaging import auto_crop_paper, open_image
+
+DEDUP_FILENAME = '.harina-dedup.sqlite3'
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+DEFAULT_MAX_DISTANCE = 6
+# Largest Hamming radius probed inside one chunk of the multi-index
+MAX_CHUNK_RADIUS = 2
+
+
+def dhash(image: Image.Image, size: int = HASH_SIZE) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale thumbnail.
+
+    Resizing, recompression and small exposure changes flip few bits, so
+    near-identical photos of the same receipt have a small Hamming distance.
+    """
+    pixels = image.convert('L').resize((size + 1, size), Image.BOX).tobytes()
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = value << 1 | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def image_dhash(data: bytes, size: int = HASH_SIZE) -> int:
+    """Difference hash of the receipt paper in encoded image bytes.
+
+    The photo is cropped to the paper first: otherwise the outline of a white
+    strip on a dark table dominates the hash and different receipts collide.
+    JPEGs are decoded at reduced scale.
+    """
+    image = open_image(data)
+    image.draft('L', (256, 256))
+    image = image.convert('L')
+    image.thumbnail((256, 256))
+    return dhash(auto_crop_paper(image), size)
+
+
+def hamming(a: int, b: int) -> int:
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count('1')
+
+
+def _to_signed(value: int) -> int:
+    """Map an unsigned 64-bit hash onto SQLite's signed INTEGER range."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _chunk_masks(width: int, radius: int) -> List[int]:
+    """XOR masks of every ``width``-bit value within ``radius`` bits of zero."""
+    masks = [0]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(width), flips):
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            masks.append(mask)
+    return masks
+
+
+class MultiIndexHash:
+    """In-memory Hamming-distance index using multi-index hashing.
+
+    The 64-bit hashes are split into ``max_distance // 3 + 1`` chunks. Two
+    hashes within ``max_distance`` bits must agree on at least one chunk to
+    within ``max_distance // chunks`` bits (at most 2), so a lookup probes a
+    few hundred exact-match buckets per chunk instead of scanning every
+    entry, and stays well under a millisecond at millions of entries.
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE, bits: int = HASH_BITS):
+        self.max_distance = max_distance
+        chunks = max(1, min(bits, max_distance // (MAX_CHUNK_RADIUS + 1) + 1))
+        self.radius = max_distance // chunks
+        widths = [bits // chunks + (index < bits % chunks) for index in range(chunks)]
+        self._chunks = []
+        shift = bits
+        for width in widths:
+            shift -= width
+            self._chunks.append((shift, (1 << width) - 1, _chunk_masks(width, self.radius)))
+        # Bucket values are a single id, or a list once several hashes share a chunk
+        self._tables: List[Dict[int, Union[int, List[int]]]] = [{} for _ in self._chunks]
+        self._hashes: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, entry_id: int, value: int) -> None:
+        """Index ``value`` under ``entry_id``."""
+        self._hashes[entry_id] = value
+        for table, (shift, mask, _) in zip(self._tables, self._chunks):
+            key = value >> shift & mask
+            bucket = table.get(key)
+            if bucket is None:
+                table[key] = entry_id
+            elif isinstance(bucket, list):
+                bucket.append(entry_id)
+            else:
+                table[key] = [bucket, entry_id]
+
+    def remove(self, entry_id: int) -> None:
+        """Drop ``entry_id`` from the index, if present."""
+        value = self._hashes.pop(entry_id, None)
+        if value is None:
+            return
+        for table, (shift, mask, _) in zip(self._tables, self._chunks):
+            key = value >> shift & mask
+            bucket = table.get(key)
+            if isinstance(bucket, list):
+                bucket.remove(entry_id)
+                if len(bucket) == 1:
+                    table[key] = bucket[0]
+            elif bucket == entry_id:
+                del table[key]
+
+    def search(self, value: int, max_distance: Optional[int] = None) -> List[tuple]:
+        """Return ``(distance, entry_id)`` of every entry within ``max_distance``, nearest first."""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        seen = set()
+        matches = []
+        for table, (shift, mask, probes) in zip(self._tables, self._chunks):
+            key = value >> shift & mask
+            for probe in probes:
+                bucket = table.get(key ^ probe)
+                if bucket is None:
+                    continue
+                for entry_id in bucket if isinstance(bucket, list) else (bucket,):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    distance = hamming(value, self._hashes[entry_id])
+                    if distance <= max_distance:
+                        matches.append((distance, entry_id))
+        matches.sort()
+        return matches
+
+
+@dataclass
+class Duplicate:
+    """An earlier receipt whose image is perceptually close to the one being processed."""
+
+    source: str
+    xml: str
+    distance: int
+
+
+class DuplicateReceiptError(ValueError):
+    """Raised instead of calling the API when an image duplicates an earlier receipt."""
+
+    def __init__(self, duplicate: Duplicate):
+        super().__init__(f"Duplicate of {duplicate.source} (hash distance {duplicate.distance})")
+        self.duplicate = duplicate
+
+
+class DuplicateIndex:
+    """Persistent index of processed receipts by perceptual hash, stored in SQLite.
+
+    Hashes are loaded into a :class:`MultiIndexHash` at startup; results are
+    read from disk only for matches. Matches are limited to entries recorded
+    with the same ``scope`` (model and prompt), so a changed template never
+    reuses results in the old layout. A file is never a duplicate of itself:
+    reprocessing it updates its entry instead of adding another.
+    """
+
+    def __init__(self, path: Union[str, Path], max_distance: int = DEFAULT_MAX_DISTANCE):
+        """Open (or create) the index database at ``path``."""
+        self.path = Path(path)
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._index = MultiIndexHash(max_distance)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS receipts (
+                       id INTEGER PRIMARY KEY,
+                       hash INTEGER NOT NULL,
+                       scope TEXT NOT NULL,
+                       source TEXT NOT NULL,
+                       xml TEXT NOT NULL,
+                       created_at REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS receipts_source ON receipts (source, scope)")
+            for entry_id, value in self._conn.execute("SELECT id, hash FROM receipts"):
+                self._index.add(entry_id, value & ((1 << 64) - 1))
+        if len(self._index):
+            logger.debug(f"🪞 Loaded {len(self._index)} receipt hashes from {self.path}")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def find(self, image_hash: int, scope: str = '', source: Optional[str] = None) -> Optional[Duplicate]:
+        """Return the closest earlier receipt within ``max_distance`` in ``scope``, or None.
+
+        Entries recorded for ``source`` itself are skipped.
+        """
+        with self._lock:
+            matches = self._index.search(image_hash)
+            for distance, entry_id in matches:
+                row = self._conn.execute("SELECT source, xml FROM receipts WHERE id = ? AND scope = ?",
+                                         (entry_id, scope)).fetchone()
+                if row is not None and row[0] != source:
+                    return Duplicate(source=row[0], xml=row[1], distance=distance)
+        return None
+
+    def add(self, image_hash: int, source: str, xml: str, scope: str = '', replace: bool = True) -> None:
+        """Record a processed receipt.
+
+        With ``replace`` an earlier entry for the same ``source`` and ``scope`` is
+        updated, so reruns do not grow the index; in-memory images without a
+        file name pass False.
+        """
+        with self._lock, self._conn:
+            row = None
+            if replace:
+                row = self._conn.execute("SELECT id FROM receipts WHERE source = ? AND scope = ? ORDER BY id DESC",
+                                         (source, scope)).fetchone()
+            if row is None:
+                cursor = self._conn.execute(
+                    "INSERT INTO receipts (hash, scope, source, xml, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (_to_signed(image_hash), scope, source, xml, time.time()))
+                entry_id = cursor.lastrowid
+            else:
+                entry_id = row[0]
+                self._conn.execute("UPDATE receipts SET hash = ?, xml = ?, created_at = ? WHERE id = ?",
+                                   (_to_signed(image_hash), xml, time.time(), entry_id))
+                self._index.remove(entry_id)
+            self._index.add(entry_id, image_hash)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,82 @@
+"""Exception types for Harina v3."""
+
+import email.utils
+import time
+from typing import Optional
+
+# Status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+
+class ReceiptProcessingError(RuntimeError):
+    """Raised when a receipt could not be recognized.
+
+    Subclasses RuntimeError so existing handlers keep working, and carries
+    enough detail for schedulers to decide whether to retry.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None,
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.attempts = 1
+
+    @property
+    def rate_limited(self) -> bool:
+        """True when the provider rejected the call because of a quota."""
+        return self.status_code == 429
+
+    @classmethod
+    def from_exception(cls, error: BaseException) -> "ReceiptProcessingError":
+        """Wrap ``error`` and classify it as retryable or not.
+
+        The original exception is kept as ``__cause__``; an error that is
+        already a ReceiptProcessingError is returned unchanged.
+        """
+        if isinstance(error, ReceiptProcessingError):
+            return error
+        status_code = get_status_code(error)
+        retryable = (
+            status_code in RETRYABLE_STATUS_CODES
+            or (status_code is None and isinstance(error, (TimeoutError, ConnectionError)))
+        )
+        wrapped = cls(f"Failed to process receipt: {error}", status_code=status_code,
+                      retryable=retryable, retry_after=get_retry_after(error))
+        wrapped.__cause__ = error
+        return wrapped
+
+
+def get_status_code(error: BaseException) -> Optional[int]:
+    """Return the HTTP status code attached to a provider exception, if any."""
+    for candidate in (error, getattr(error, 'response', None)):
+        status_code = getattr(candidate, 'status_code', None)
+        if isinstance(status_code, int):
+            return status_code
+    return None
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Return the ``Retry-After`` delay in seconds from a provider exception, if any."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        value = headers.get('retry-after-ms')
+        if value is not None:
+            return max(0.0, float(value) / 1000)
+        value = headers.get('retry-after')
+    except Exception:
+        return None
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
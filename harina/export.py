@@ -0,0 +1,278 @@
+"""Aggregated multi-receipt export for Harina v3."""
+
+import csv
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+from .models import CSV_HEADER, Receipt, csv_writer
+
+METADATA_COLUMNS = ["source_file", "model", "processed_at"]
+AGGREGATE_COLUMNS = METADATA_COLUMNS + CSV_HEADER
+AGGREGATE_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+DEFAULT_FLUSH_EVERY = 100
+
+
+def aggregate_format(path: Union[str, Path]) -> str:
+    """Aggregate format for ``path`` from its extension."""
+    suffix = Path(path).suffix.lower()
+    if suffix not in AGGREGATE_FORMATS:
+        raise ValueError(f"Unsupported aggregate file extension '{suffix}' "
+                         f"(use {', '.join(AGGREGATE_FORMATS)})")
+    return AGGREGATE_FORMATS[suffix]
+
+
+def _dict_rows(record: Dict[str, Any]) -> List[List[str]]:
+    """Flatten a JSONL record into aggregate CSV rows."""
+    receipt = record.get('receipt', {})
+    store = receipt.get('store_info', {})
+    transaction = receipt.get('transaction_info', {})
+    totals = receipt.get('totals', {})
+    payment = receipt.get('payment_info', {})
+    head = [record.get(column, '') for column in METADATA_COLUMNS]
+    head += [store.get('name', ''), store.get('address', ''), store.get('phone', ''),
+             transaction.get('date', ''), transaction.get('time', ''), transaction.get('receipt_number', '')]
+    tail = [totals.get('subtotal', ''), totals.get('tax', ''), totals.get('total', ''),
+            payment.get('method', ''), payment.get('amount_paid', ''), payment.get('change', '')]
+    items = receipt.get('items') or [{}]
+    return [head + [item.get(key, '') for key in
+                    ('name', 'category', 'subcategory', 'quantity', 'unit_price', 'total_price')] + tail
+            for item in items]
+
+
+def _csv_records(path: Path) -> Iterator[Tuple[List[str], int, int]]:
+    """Yield ``(row, start, end)`` byte offsets for each record of a CSV file."""
+    with open(path, 'rb') as f:
+        position = 0
+
+        def lines():
+            nonlocal position
+            for raw in f:
+                position += len(raw)
+                yield raw.decode('utf-8')
+
+        start = 0
+        # csv.reader pulls exactly the lines each record needs, so offsets stay exact
+        for row in csv.reader(lines()):
+            yield row, start, position
+            start = position
+
+
+class _LineBuffer:
+    """File-like sink collecting written text until it is drained."""
+
+    def __init__(self):
+        self._parts: List[str] = []
+
+    def write(self, text: str) -> int:
+        self._parts.append(text)
+        return len(text)
+
+    def __bool__(self) -> bool:
+        return bool(self._parts)
+
+    def drain(self) -> str:
+        """Everything written since the last drain."""
+        text, self._parts = ''.join(self._parts), []
+        return text
+
+
+class AggregateWriter:
+    """Appends receipts from a directory run to a single CSV or JSONL file.
+
+    CSV gets one row per item with the source file and processing metadata in
+    front; JSONL gets one line per receipt. Rows are buffered and flushed to
+    disk (with fsync) every ``flush_every`` receipts, so a crash loses at most
+    one batch. After each flush the durable size is recorded in a hidden
+    ``.<name>.committed`` file next to ``path``. Reopening an existing file
+    resumes it: everything past the committed size is cut off, even when a
+    crash stopped at a line boundary inside a receipt's rows, and the receipts
+    already written are listed in ``completed`` so the caller can skip them.
+    Files without a marker fall back to cutting a torn trailing record.
+    ``on_commit`` is called with the sources of each flush once they are
+    durable, so callers can track progress that survives a crash. With ``parquet_path`` a Parquet copy of the
+    item rows is written on close (requires ``pyarrow``). ``typed`` writes
+    CSV amounts as unquoted numbers.
+    """
+
+    def __init__(self, path: Union[str, Path], flush_every: int = DEFAULT_FLUSH_EVERY,
+                 parquet_path: Optional[Union[str, Path]] = None, typed: bool = False,
+                 on_commit: Optional[Callable[[List[str]], None]] = None):
+        """Open ``path`` for appending, resuming it if it already exists."""
+        self.path = Path(path)
+        self.commit_path = self.path.with_name(f".{self.path.name}.committed")
+        self.format = aggregate_format(self.path)
+        self.flush_every = max(1, flush_every)
+        self._typed = typed
+        self.parquet_path = Path(parquet_path) if parquet_path else None
+        if self.parquet_path is not None:
+            _require_pyarrow()
+        self.completed: Set[str] = set()
+        self._buffer = _LineBuffer()
+        self._writer = csv_writer(self._buffer, typed)
+        self._pending: List[str] = []
+        self.on_commit = on_commit
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        has_header = self._resume() if self.path.exists() else False
+        self._file = open(self.path, 'ab')
+        if self.format == 'csv' and not has_header:
+            self._writer.writerow(AGGREGATE_COLUMNS)
+
+    def _read_committed(self) -> Optional[int]:
+        """Size of the file at its last completed flush, or None without a usable marker."""
+        try:
+            return int(self.commit_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+    def _resume(self) -> bool:
+        """Cut the tail after the last complete flush, collect completed sources, report whether a CSV header exists.
+
+        Rows are streamed; only the source names are kept in memory.
+        """
+        data_size = self.path.stat().st_size
+        if data_size == 0:
+            return False
+        limit = self._read_committed()
+        torn = False
+        if limit is None or limit > data_size:
+            # No marker, or the file was replaced: only a torn last line can be detected
+            limit = data_size
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b'\n'
+
+        keep = 0
+        if self.format == 'jsonl':
+            with open(self.path, 'rb') as f:
+                for raw in f:
+                    if keep + len(raw) > limit:
+                        break
+                    try:
+                        record = json.loads(raw)
+                    except ValueError:
+                        break
+                    self.completed.add(record['source_file'])
+                    keep += len(raw)
+            has_header = True
+        else:
+            has_header = False
+            run_source, run_start = None, 0
+            for row, start, end in _csv_records(self.path):
+                if end > limit:
+                    break
+                if start == 0 and row == AGGREGATE_COLUMNS:
+                    has_header = True
+                else:
+                    if row[0] != run_source:
+                        run_source, run_start = row[0], start
+                    self.completed.add(row[0])
+                keep = end
+            if torn and run_source is not None:
+                # A receipt's rows are written together; drop every row of the torn one
+                self.completed.discard(run_source)
+                keep = run_start
+
+        if keep < data_size:
+            logger.warning(f"✂️ Truncating incomplete tail of {self.path} ({data_size - keep} bytes)")
+            with open(self.path, 'r+b') as f:
+                f.truncate(keep)
+        self._size = keep
+        if self.completed:
+            logger.info(f"⏯️ Resuming {self.path}: {len(self.completed)} receipts already exported")
+        return has_header
+
+    def add(self, source: str, receipt: Receipt, model: str = '', **metadata: Any) -> None:
+        """Queue one receipt; ``metadata`` adds keys to JSONL records."""
+        processed_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        with self._lock:
+            if self.format == 'csv':
+                for row in receipt.iter_csv_rows(self._typed):
+                    self._writer.writerow([source, model, processed_at] + row)
+            else:
+                record = {'source_file': source, 'model': model, 'processed_at': processed_at, **metadata,
+                          'receipt': receipt.to_dict()}
+                self._buffer.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.completed.add(source)
+            self._pending.append(source)
+            if len(self._pending) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._buffer:
+            # One write per batch keeps each receipt's rows together on disk
+            data = self._buffer.drain().encode('utf-8')
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._size += len(data)
+            # Marked only once the rows are durable, so a crash never counts a partial batch as written
+            tmp_path = self.commit_path.with_name(f"{self.commit_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(str(self._size), encoding='utf-8')
+            os.replace(tmp_path, self.commit_path)
+        committed, self._pending = self._pending, []
+        if committed and self.on_commit is not None:
+            self.on_commit(committed)
+
+    def flush(self) -> None:
+        """Write buffered receipts to disk."""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        """Flush, close the file and write the Parquet copy if requested."""
+        with self._lock:
+            if self._file.closed:
+                return
+            self._flush_locked()
+            self._file.close()
+        if self.parquet_path is not None:
+            self.write_parquet(self.parquet_path)
+
+    def __enter__(self) -> "AggregateWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def rows(self) -> Iterator[List[str]]:
+        """Item rows of the aggregate file, in ``AGGREGATE_COLUMNS`` order."""
+        if self.format == 'csv':
+            records = _csv_records(self.path)
+            next(records, None)
+            for row, _, _ in records:
+                yield row
+        else:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    yield from _dict_rows(json.loads(line))
+
+    def write_parquet(self, path: Union[str, Path]) -> None:
+        """Write the item rows as a Parquet file with string columns."""
+        pa, pq = _require_pyarrow()
+        columns: Dict[str, List[str]] = {column: [] for column in AGGREGATE_COLUMNS}
+        for row in self.rows():
+            for column, value in zip(AGGREGATE_COLUMNS, row):
+                columns[column].append(value)
+        table = pa.table({column: pa.array(values, type=pa.string()) for column, values in columns.items()})
+        temp_path = Path(f"{path}.tmp")
+        pq.write_table(table, temp_path)
+        os.replace(temp_path, path)
+        logger.info(f"🧱 Wrote {table.num_rows} rows to {path}")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("Parquet export requires pyarrow: pip install 'harina-v3-cli[parquet]'") from e
+    return pyarrow, pyarrow.parquet
@@ -0,0 +1,321 @@
+"""Image preprocessing and encoding pipeline for Harina v3."""
+
+import base64
+import io
+import math
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Optional, Union
+
+from loguru import logger
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
+
+EXIF_ORIENTATION = 0x0112
+# Larger JPEGs are re-encoded rather than uploaded as they are
+PASSTHROUGH_MAX_BYTES = 4 * 1024 * 1024
+# ISO BMFF brands used by HEIC/HEIF photos (bytes 8-12 of the file)
+HEIF_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1'}
+
+# Output format name -> (Pillow format, MIME type)
+IMAGE_FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp'),
+    'png': ('PNG', 'image/png'),
+}
+
+
+@dataclass
+class PreprocessOptions:
+    """Settings for the preprocessing stage applied before an image is uploaded.
+
+    The defaults keep full resolution, RGB and JPEG quality 85. With ``passthrough``
+    enabled, JPEG sources that need no pixel changes are sent as-is instead of
+    being re-encoded, as long as they are at most ``passthrough_max_bytes`` and
+    carry no EXIF or XMP metadata (such as GPS coordinates).
+    """
+
+    max_edge: Optional[int] = None
+    grayscale: bool = False
+    auto_crop: bool = False
+    format: str = 'jpeg'
+    quality: int = 85
+    passthrough: bool = True
+    passthrough_max_bytes: int = PASSTHROUGH_MAX_BYTES
+
+    def __post_init__(self):
+        self.format = self.format.lower()
+        if self.format == 'jpg':
+            self.format = 'jpeg'
+        if self.format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format: {self.format} (choose from {', '.join(IMAGE_FORMATS)})")
+        if self.max_edge is not None and self.max_edge <= 0:
+            raise ValueError("max_edge must be a positive number of pixels")
+        if not 1 <= self.quality <= 100:
+            raise ValueError("quality must be between 1 and 100")
+
+    @property
+    def mime_type(self) -> str:
+        """MIME type of the encoded output."""
+        return IMAGE_FORMATS[self.format][1]
+
+
+@dataclass
+class EncodedImage:
+    """Encoded image payload ready to be sent to the model."""
+
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    passthrough: bool = False
+    # Perceptual hash, set when duplicate detection is enabled
+    fingerprint: Optional[int] = None
+    # Where the image was read from, for logs when it was prepared elsewhere
+    source: Optional[str] = None
+
+    @property
+    def pixels(self) -> int:
+        """Number of pixels in the encoded image."""
+        return self.width * self.height
+
+    def to_base64(self) -> str:
+        """Return the payload as a base64 string."""
+        return base64.b64encode(self.data).decode('utf-8')
+
+    def to_data_url(self) -> str:
+        """Return the payload as a ``data:`` URL for the chat completion API."""
+        return f"data:{self.mime_type};base64,{self.to_base64()}"
+
+
+# Anything HarinaCore can read an image from; an EncodedImage is used as is
+ImageSource = Union[str, Path, bytes, bytearray, memoryview, BinaryIO, Image.Image, EncodedImage]
+
+
+def _target_mode(options: PreprocessOptions) -> str:
+    return 'L' if options.grayscale else 'RGB'
+
+
+def _otsu_threshold(histogram) -> int:
+    """Compute Otsu's threshold from a 256-bin grayscale histogram."""
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background_weight = 0
+    background_sum = 0
+    best_threshold, best_variance = 127, -1.0
+    for value, count in enumerate(histogram):
+        background_weight += count
+        if background_weight == 0:
+            continue
+        foreground_weight = total - background_weight
+        if foreground_weight == 0:
+            break
+        background_sum += value * count
+        background_mean = background_sum / background_weight
+        foreground_mean = (weighted_total - background_sum) / foreground_weight
+        variance = background_weight * foreground_weight * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = value, variance
+    return best_threshold
+
+
+def auto_crop_paper(image: Image.Image, margin: float = 0.02) -> Image.Image:
+    """Crop the image to the bright paper region of a receipt photo.
+
+    The paper is located on a small thumbnail, so this stays cheap for large
+    photos. The image is returned unchanged when no clear paper region is found.
+    """
+    thumbnail = image.convert('L')
+    thumbnail.thumbnail((256, 256))
+    threshold = _otsu_threshold(thumbnail.histogram())
+    mask = thumbnail.point(lambda value: 255 if value > threshold else 0)
+    # Erode to drop small bright specks (reflections, text on dark backgrounds)
+    mask = mask.filter(ImageFilter.MinFilter(5))
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+
+    left, top, right, bottom = bbox
+    coverage = (right - left) * (bottom - top) / (thumbnail.width * thumbnail.height)
+    if coverage < 0.1 or coverage > 0.95:
+        return image
+
+    scale_x = image.width / thumbnail.width
+    scale_y = image.height / thumbnail.height
+    pad_x = margin * image.width
+    pad_y = margin * image.height
+    box = (
+        max(0, int(left * scale_x - pad_x)),
+        max(0, int(top * scale_y - pad_y)),
+        min(image.width, int(right * scale_x + pad_x)),
+        min(image.height, int(bottom * scale_y + pad_y)),
+    )
+    return image.crop(box)
+
+
+def preprocess_image(image: Image.Image, options: PreprocessOptions) -> Image.Image:
+    """Apply cropping, downscaling and color conversion according to ``options``."""
+    if options.auto_crop:
+        image = auto_crop_paper(image)
+
+    target_mode = _target_mode(options)
+    if image.mode != target_mode:
+        image = image.convert(target_mode)
+
+    if options.max_edge and max(image.size) > options.max_edge:
+        scale = options.max_edge / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+    return image
+
+
+def encode_image(image: Image.Image, options: PreprocessOptions) -> EncodedImage:
+    """Encode a preprocessed image in the configured output format."""
+    pil_format, mime_type = IMAGE_FORMATS[options.format]
+    save_kwargs = {}
+    if options.format in ('jpeg', 'webp'):
+        save_kwargs['quality'] = options.quality
+    elif options.format == 'png':
+        save_kwargs['optimize'] = True
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **save_kwargs)
+    return EncodedImage(data=buffer.getvalue(), mime_type=mime_type,
+                        width=image.width, height=image.height)
+
+
+def _exif_orientation(image: Image.Image) -> int:
+    try:
+        return image.getexif().get(EXIF_ORIENTATION, 1) or 1
+    except Exception:
+        return 1
+
+
+def can_pass_through(image: Image.Image, options: PreprocessOptions, size: int) -> bool:
+    """Return True when the ``size``-byte source JPEG can be uploaded without re-encoding.
+
+    Files with EXIF or XMP metadata are always re-encoded so that camera details
+    and GPS coordinates never reach the provider.
+    """
+    return (
+        options.passthrough
+        and size <= options.passthrough_max_bytes
+        and options.format == 'jpeg'
+        and not options.auto_crop
+        and image.format == 'JPEG'
+        and image.mode == _target_mode(options)
+        and (not options.max_edge or max(image.size) <= options.max_edge)
+        and not image.info.get('exif')
+        and not image.info.get('xmp')
+    )
+
+
+def load_image(image: Image.Image, options: PreprocessOptions) -> Image.Image:
+    """Decode an opened image using the cheapest path for the target resolution.
+
+    JPEGs are decoded with Pillow's draft mode, letting libjpeg scale by 1/2,
+    1/4 or 1/8 during decoding when the target is much smaller than the source.
+    EXIF orientation is applied once, after decoding.
+    """
+    if image.format == 'JPEG' and options.max_edge and not options.auto_crop:
+        scale = options.max_edge / max(image.size)
+        if scale < 1:
+            requested = (math.ceil(image.width * scale), math.ceil(image.height * scale))
+            image.draft(_target_mode(options), requested)
+
+    image.load()
+    if _exif_orientation(image) != 1:
+        image = ImageOps.exif_transpose(image)
+    return image
+
+
+def describe_source(source: ImageSource) -> str:
+    """Return a short human-readable description of an image source for logs."""
+    if isinstance(source, (str, Path)):
+        return str(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return f"<{len(source)} bytes>"
+    if isinstance(source, Image.Image):
+        return f"<{source.mode} image {source.width}x{source.height}>"
+    if isinstance(source, EncodedImage):
+        return source.source or f"<{source.mime_type} {source.width}x{source.height}>"
+    return f"<{getattr(source, 'name', type(source).__name__)}>"
+
+
+def read_source(source: ImageSource) -> Union[bytes, Image.Image]:
+    """Return the raw bytes of a path, buffer or file-like source.
+
+    PIL images are returned unchanged since they are already decoded.
+    """
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        return source.read()
+    return Path(source).read_bytes()
+
+
+@lru_cache(maxsize=None)
+def register_heif_opener() -> bool:
+    """Register the optional ``pillow-heif`` plugin so Pillow can open HEIC/HEIF files."""
+    try:
+        from pillow_heif import register_heif_opener as register
+    except ImportError:
+        return False
+    register()
+    return True
+
+
+def open_image(data: bytes) -> Image.Image:
+    """Open encoded image bytes, loading HEIC/HEIF support only when it is needed."""
+    try:
+        return Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        if data[8:12] not in HEIF_BRANDS:
+            raise
+    if not register_heif_opener():
+        raise ValueError("HEIC/HEIF images require pillow-heif: pip install 'harina-v3-cli[heic]'")
+    return Image.open(io.BytesIO(data))
+
+
+def prepare_image(source: ImageSource, options: PreprocessOptions) -> EncodedImage:
+    """Load, preprocess and encode an image for upload.
+
+    ``source`` may be a path, raw bytes, a binary file-like object or a PIL image.
+    Bytes are decoded straight from memory without touching the filesystem.
+    An :class:`EncodedImage`, e.g. prepared in a worker process, is returned unchanged.
+    """
+    if isinstance(source, EncodedImage):
+        return source
+    start = time.perf_counter()
+    data = read_source(source)
+    if isinstance(data, Image.Image):
+        image, data = data, None
+    else:
+        image = open_image(data)
+    source_size, source_format = image.size, image.format
+    opened = time.perf_counter()
+
+    if data is not None and can_pass_through(image, options, len(data)):
+        logger.debug(f"⏱️ Passing {source_format} {source_size[0]}x{source_size[1]} through unchanged "
+                     f"(open: {(opened - start) * 1000:.1f} ms)")
+        return EncodedImage(data=data, mime_type='image/jpeg', width=image.width,
+                            height=image.height, passthrough=True)
+
+    image = load_image(image, options)
+    decoded = time.perf_counter()
+    image = preprocess_image(image, options)
+    processed = time.perf_counter()
+    encoded = encode_image(image, options)
+    finished = time.perf_counter()
+
+    logger.debug(f"⏱️ Loaded {source_format} {source_size[0]}x{source_size[1]} -> "
+                 f"{encoded.width}x{encoded.height} (open: {(opened - start) * 1000:.1f} ms, "
+                 f"decode: {(decoded - opened) * 1000:.1f} ms, preprocess: {(processed - decoded) * 1000:.1f} ms, "
+                 f"encode: {(finished - processed) * 1000:.1f} ms)")
+    return encoded
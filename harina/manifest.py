@@ -0,0 +1,132 @@
+"""Incremental processing manifest for Harina v3."""
+
+import hashlib
+import json
+import os
+import threading
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional, Union
+
+from loguru import logger
+
+from .imaging import PreprocessOptions
+
+MANIFEST_FILENAME = '.harina-manifest.json'
+MANIFEST_VERSION = 1
+SAVE_INTERVAL = 50
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file's raw bytes without decoding it."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Record of processed inputs (mtime, size, hash) and the outputs they produced.
+
+    Each entry also keeps the settings the output depends on (model, format,
+    prompt hash and preprocessing options); changing any of them reprocesses the file.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """Load the manifest at ``path`` if it exists."""
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._dirty = 0
+        self.entries = {}
+
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding='utf-8'))
+                if data.get('version') == MANIFEST_VERSION:
+                    self.entries = data.get('entries', {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Ignoring unreadable manifest {self.path}: {e}")
+
+    @staticmethod
+    def _key(image_file: Path) -> str:
+        return str(Path(image_file).resolve())
+
+    @staticmethod
+    def _settings(model: str, format: str, prompt_hash: str,
+                  preprocess: Optional[PreprocessOptions]) -> dict:
+        return {
+            'model': model,
+            'format': format,
+            'prompt': prompt_hash,
+            'preprocess': asdict(preprocess or PreprocessOptions()),
+        }
+
+    def is_up_to_date(self, image_file: Path, output_file: Path, model: str, format: str,
+                      prompt_hash: str = '', preprocess: Optional[PreprocessOptions] = None) -> bool:
+        """Return True when ``output_file`` was produced from the current ``image_file``.
+
+        Only ``stat`` is needed for untouched files; the input is hashed (never
+        decoded) when its mtime changed but its size did not.
+        """
+        key = self._key(image_file)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return False
+        settings = self._settings(model, format, prompt_hash, preprocess)
+        if any(entry.get(name) != value for name, value in settings.items()):
+            return False
+        if entry.get('output') != str(Path(output_file).resolve()) or not Path(output_file).exists():
+            return False
+
+        try:
+            stat = os.stat(image_file)
+        except OSError:
+            return False
+        if stat.st_size != entry.get('size'):
+            return False
+        if stat.st_mtime_ns == entry.get('mtime_ns'):
+            return True
+
+        # Touched but possibly unchanged (e.g. re-synced), compare content
+        if file_sha256(image_file) != entry.get('sha256'):
+            return False
+        with self._lock:
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._dirty += 1
+        return True
+
+    def record(self, image_file: Path, output_file: Path, model: str, format: str,
+               prompt_hash: str = '', preprocess: Optional[PreprocessOptions] = None) -> None:
+        """Record that ``output_file`` is now up to date for ``image_file``."""
+        stat = os.stat(image_file)
+        entry = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': file_sha256(image_file),
+            'output': str(Path(output_file).resolve()),
+            **self._settings(model, format, prompt_hash, preprocess),
+        }
+        with self._lock:
+            self.entries[self._key(image_file)] = entry
+            self._dirty += 1
+            should_save = self._dirty >= SAVE_INTERVAL
+        if should_save:
+            self.save()
+
+    def save(self) -> None:
+        """Atomically write the manifest to disk if anything changed."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.dumps({'version': MANIFEST_VERSION, 'entries': self.entries},
+                                  ensure_ascii=False, indent=1)
+                self._dirty = 0
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(data, encoding='utf-8')
+            os.replace(tmp_path, self.path)
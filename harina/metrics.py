@@ -0,0 +1,263 @@
+"""Per-receipt timing, token and cost metrics for Harina v3."""
+
+import json
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from loguru import logger
+
+STAGES = ('prepare', 'api', 'parse', 'total')
+SAMPLE_WINDOW = 10000
+LATENCY_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def payload_bytes(messages: list) -> int:
+    """Approximate request size: prompt text plus image data URLs, in bytes."""
+    size = 0
+    for message in messages:
+        content = message.get('content')
+        parts = content if isinstance(content, list) else [{'text': content or ''}]
+        for part in parts:
+            size += len(part.get('text', '').encode('utf-8'))
+            size += len(part.get('image_url', {}).get('url', ''))
+    return size
+
+
+def completion_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """USD cost from LiteLLM's price table, or None for models it does not know."""
+    try:
+        import litellm
+        prompt_cost, completion_cost = litellm.cost_per_token(
+            model=model, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    except Exception:
+        return None
+    return prompt_cost + completion_cost
+
+
+@dataclass
+class ReceiptMetrics:
+    """What one receipt cost: stage timings in seconds, payload bytes, tokens and USD.
+
+    Token counts and cost stay None when the provider reported no usage
+    (e.g. streamed responses that were closed early). For receipts recognized
+    in a batched request, usage and cost are the receipt's share of the batch.
+    """
+
+    source: str = ''
+    model: str = ''
+    cached: bool = False
+    succeeded: bool = True
+    error: Optional[str] = None
+    batch_size: int = 1
+    image_bytes: int = 0
+    request_bytes: int = 0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cost: Optional[float] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Add the time spent in the ``with`` block to stage ``name``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add_usage(self, response: Any, model: str) -> None:
+        """Add the token usage and cost of a completion response answered by ``model``."""
+        self.model = model
+        usage = getattr(response, 'usage', None)
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+            return
+        self.prompt_tokens = (self.prompt_tokens or 0) + prompt_tokens
+        self.completion_tokens = (self.completion_tokens or 0) + completion_tokens
+        cost = completion_cost(model, prompt_tokens, completion_tokens)
+        if cost is not None:
+            self.cost = (self.cost or 0.0) + cost
+
+    def add_share(self, batch: "ReceiptMetrics", size: int) -> None:
+        """Take this receipt's share of a batched request: its full wait, 1/``size`` of usage and bytes."""
+        self.batch_size = size
+        self.model = batch.model or self.model
+        self.request_bytes += batch.request_bytes // size
+        for stage in ('api', 'parse'):
+            if stage in batch.stages:
+                self.stages[stage] = self.stages.get(stage, 0.0) + batch.stages[stage]
+        if batch.prompt_tokens is not None:
+            self.prompt_tokens = (self.prompt_tokens or 0) + batch.prompt_tokens // size
+            self.completion_tokens = (self.completion_tokens or 0) + (batch.completion_tokens or 0) // size
+        if batch.cost is not None:
+            self.cost = (self.cost or 0.0) + batch.cost / size
+
+    def describe(self) -> str:
+        """One-line summary for logs."""
+        parts = [f"{stage} {seconds:.2f}s" for stage, seconds in self.stages.items()]
+        if self.prompt_tokens is not None:
+            parts.append(f"{self.prompt_tokens}+{self.completion_tokens or 0} tokens")
+        if self.cost is not None:
+            parts.append(f"${self.cost:.5f}")
+        return ", ".join(parts)
+
+    @property
+    def total_tokens(self) -> Optional[int]:
+        if self.prompt_tokens is None:
+            return None
+        return self.prompt_tokens + (self.completion_tokens or 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict for JSON logging."""
+        return asdict(self)
+
+
+def jsonl_sink(path: Union[str, Path]) -> Callable[[ReceiptMetrics], None]:
+    """Return a :class:`MetricsCollector` sink appending every record to a JSON Lines file."""
+    lock = threading.Lock()
+
+    def write(metrics: ReceiptMetrics) -> None:
+        line = json.dumps(metrics.to_dict(), ensure_ascii=False)
+        with lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+    return write
+
+
+def _label_value(value: Any) -> str:
+    """Escape a Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+class MetricsCollector:
+    """Thread-safe aggregate of :class:`ReceiptMetrics`.
+
+    Keeps running totals for Prometheus counters and the last
+    ``SAMPLE_WINDOW`` stage timings for percentiles. ``sink`` is called with
+    every record, e.g. to append it to a JSON Lines file.
+    """
+
+    def __init__(self, sink: Optional[Callable[[ReceiptMetrics], None]] = None):
+        self.sink = sink
+        self._lock = threading.Lock()
+        self.receipts: Dict[tuple, int] = defaultdict(int)
+        self.stage_seconds: Dict[str, float] = defaultdict(float)
+        self.stage_counts: Dict[str, int] = defaultdict(int)
+        self.samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=SAMPLE_WINDOW))
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.tokens: Dict[tuple, int] = defaultdict(int)
+        self.cost: Dict[str, float] = defaultdict(float)
+        self.bytes: Dict[str, int] = defaultdict(int)
+
+    def record(self, metrics: ReceiptMetrics) -> None:
+        """Add one receipt's metrics."""
+        with self._lock:
+            status = 'success' if metrics.succeeded else 'error'
+            self.receipts[(metrics.model, status, metrics.cached)] += 1
+            for stage, seconds in metrics.stages.items():
+                self.stage_seconds[stage] += seconds
+                self.stage_counts[stage] += 1
+                self.samples[stage].append(seconds)
+            total = metrics.stages.get('total')
+            if total is not None:
+                for index, bound in enumerate(LATENCY_BUCKETS):
+                    if total <= bound:
+                        self.latency_buckets[index] += 1
+            if metrics.prompt_tokens is not None:
+                self.tokens[(metrics.model, 'prompt')] += metrics.prompt_tokens
+                self.tokens[(metrics.model, 'completion')] += metrics.completion_tokens or 0
+            if metrics.cost is not None:
+                self.cost[metrics.model] += metrics.cost
+            self.bytes['image'] += metrics.image_bytes
+            self.bytes['request'] += metrics.request_bytes
+        if self.sink is not None:
+            try:
+                self.sink(metrics)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to write metrics: {e}")
+
+    @property
+    def count(self) -> int:
+        """Number of receipts recorded."""
+        with self._lock:
+            return sum(self.receipts.values())
+
+    def summary(self) -> str:
+        """A plain-text table of stage timings, tokens and cost."""
+        with self._lock:
+            receipts = dict(self.receipts)
+            stages = [stage for stage in STAGES if stage in self.stage_counts]
+            stages += sorted(set(self.stage_counts) - set(STAGES))
+            stage_rows = [(stage, self.stage_counts[stage], self.stage_seconds[stage], list(self.samples[stage]))
+                          for stage in stages]
+            prompt_tokens = sum(count for (_, kind), count in self.tokens.items() if kind == 'prompt')
+            completion_tokens = sum(count for (_, kind), count in self.tokens.items() if kind == 'completion')
+            cost = sum(self.cost.values())
+            image_bytes = self.bytes.get('image', 0)
+
+        total = sum(receipts.values())
+        failed = sum(count for (_, status, _), count in receipts.items() if status == 'error')
+        cached = sum(count for (_, _, is_cached), count in receipts.items() if is_cached)
+        lines = [f"{'stage':<10}{'count':>8}{'total s':>11}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'max s':>9}"]
+        for stage, count, seconds, samples in stage_rows:
+            lines.append(f"{stage:<10}{count:>8}{seconds:>11.2f}{seconds / count:>9.3f}"
+                         f"{_percentile(samples, 0.5):>9.3f}{_percentile(samples, 0.95):>9.3f}{max(samples):>9.3f}")
+        lines.append(f"receipts: {total} (cached {cached}, failed {failed})  "
+                     f"images: {image_bytes / 1024 / 1024:.1f} MiB")
+        lines.append(f"tokens: {prompt_tokens} prompt + {completion_tokens} completion  cost: ${cost:.4f}"
+                     + (f" (${cost / (total - cached):.5f}/receipt)" if total > cached else ""))
+        return "\n".join(lines)
+
+    def to_prometheus(self, prefix: str = 'harina') -> str:
+        """Counters and histograms in the Prometheus text exposition format."""
+        def labels(**values) -> str:
+            return '{' + ','.join(f'{key}="{_label_value(value)}"' for key, value in values.items()) + '}'
+
+        with self._lock:
+            lines = [f"# HELP {prefix}_receipts_total Receipts processed.",
+                     f"# TYPE {prefix}_receipts_total counter"]
+            for (model, status, cached), count in sorted(self.receipts.items()):
+                lines.append(f"{prefix}_receipts_total"
+                             f"{labels(model=model, status=status, cached=str(cached).lower())} {count}")
+
+            lines += [f"# HELP {prefix}_stage_seconds Time spent per processing stage.",
+                      f"# TYPE {prefix}_stage_seconds summary"]
+            for stage in sorted(self.stage_counts):
+                lines.append(f"{prefix}_stage_seconds_sum{labels(stage=stage)} {self.stage_seconds[stage]:.6f}")
+                lines.append(f"{prefix}_stage_seconds_count{labels(stage=stage)} {self.stage_counts[stage]}")
+
+            lines += [f"# HELP {prefix}_receipt_seconds End-to-end time per receipt.",
+                      f"# TYPE {prefix}_receipt_seconds histogram"]
+            for bound, count in zip(LATENCY_BUCKETS, self.latency_buckets):
+                lines.append(f"{prefix}_receipt_seconds_bucket{labels(le=bound)} {count}")
+            lines.append(f"{prefix}_receipt_seconds_bucket{labels(le='+Inf')} {self.stage_counts.get('total', 0)}")
+            lines.append(f"{prefix}_receipt_seconds_sum {self.stage_seconds.get('total', 0.0):.6f}")
+            lines.append(f"{prefix}_receipt_seconds_count {self.stage_counts.get('total', 0)}")
+
+            lines += [f"# HELP {prefix}_tokens_total Tokens reported by the model provider.",
+                      f"# TYPE {prefix}_tokens_total counter"]
+            for (model, kind), count in sorted(self.tokens.items()):
+                lines.append(f"{prefix}_tokens_total{labels(model=model, type=kind)} {count}")
+
+            lines += [f"# HELP {prefix}_cost_usd_total Estimated API cost in US dollars.",
+                      f"# TYPE {prefix}_cost_usd_total counter"]
+            for model, cost in sorted(self.cost.items()):
+                lines.append(f"{prefix}_cost_usd_total{labels(model=model)} {cost:.6f}")
+
+            lines += [f"# HELP {prefix}_payload_bytes_total Bytes of encoded images and API requests.",
+                      f"# TYPE {prefix}_payload_bytes_total counter"]
+            for kind, size in sorted(self.bytes.items()):
+                lines.append(f"{prefix}_payload_bytes_total{labels(kind=kind)} {size}")
+        return "\n".join(lines) + "\n"
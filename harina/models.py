@@ -0,0 +1,191 @@
+"""Structured receipt model for Harina v3."""
+
+import csv
+import io
+import json
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, TextIO, Union
+
+CSV_HEADER = ["store_name", "store_address", "store_phone",
+              "transaction_date", "transaction_time", "receipt_number",
+              "item_name", "item_category", "item_subcategory",
+              "item_quantity", "item_unit_price", "item_total_price",
+              "subtotal", "tax", "total",
+              "payment_method", "amount_paid", "change"]
+NUMERIC_COLUMNS = frozenset({"item_quantity", "item_unit_price", "item_total_price",
+                             "subtotal", "tax", "total", "amount_paid", "change"})
+_NUMERIC_INDEXES = tuple(index for index, column in enumerate(CSV_HEADER) if column in NUMERIC_COLUMNS)
+_NUMBER = re.compile(r"-?\d+(\.\d+)?")
+_NUMBER_NOISE = str.maketrans("", "", ",¥￥$円 \t")
+
+CsvValue = Union[str, int, float]
+
+
+def to_number(value: str) -> CsvValue:
+    """``value`` as an int or float when it is a plain amount (``"1,380"``, ``"¥165"``), else unchanged."""
+    cleaned = value.translate(_NUMBER_NOISE)
+    match = _NUMBER.fullmatch(cleaned)
+    if match is None:
+        return value
+    return float(cleaned) if match.group(1) else int(cleaned)
+
+
+def _texts(section) -> Dict[str, str]:
+    """Map child tags to their text in one pass, keeping the first of duplicates."""
+    texts: Dict[str, str] = {}
+    if section is not None:
+        for child in section:
+            texts.setdefault(child.tag, child.text or "")
+    return texts
+
+
+@dataclass
+class Item:
+    """One purchased item."""
+
+    __slots__ = ("name", "category", "subcategory", "quantity", "unit_price", "total_price")
+
+    name: str
+    category: str
+    subcategory: str
+    quantity: str
+    unit_price: str
+    total_price: str
+
+    @classmethod
+    def from_element(cls, element: ET.Element) -> "Item":
+        """Build an item from an ``<item>`` element."""
+        texts = _texts(element)
+        return cls(texts.get("n", ""), texts.get("category", ""), texts.get("subcategory", ""),
+                   texts.get("quantity", ""), texts.get("unit_price", ""), texts.get("total_price", ""))
+
+    def to_dict(self) -> Dict[str, str]:
+        """Plain dict using the template's field names."""
+        return {"name": self.name, "category": self.category, "subcategory": self.subcategory,
+                "quantity": self.quantity, "unit_price": self.unit_price, "total_price": self.total_price}
+
+
+@dataclass
+class Receipt:
+    """A recognized receipt, parsed once and rendered to XML, CSV or JSON.
+
+    Values are kept as the strings the model returned. ``xml`` holds the
+    formatted XML the receipt was built from, so custom templates with extra
+    elements still round-trip unchanged.
+    """
+
+    __slots__ = ("store_name", "store_address", "store_phone",
+                 "date", "time", "receipt_number", "items",
+                 "subtotal", "tax", "total",
+                 "payment_method", "amount_paid", "change", "xml")
+
+    store_name: str
+    store_address: str
+    store_phone: str
+    date: str
+    time: str
+    receipt_number: str
+    items: List[Item]
+    subtotal: str
+    tax: str
+    total: str
+    payment_method: str
+    amount_paid: str
+    change: str
+    xml: str
+
+    @classmethod
+    def from_element(cls, root: ET.Element, xml: str) -> "Receipt":
+        """Build a receipt from a parsed ``<receipt>`` element and its formatted XML."""
+        sections = {}
+        for section in root:
+            sections.setdefault(section.tag, section)
+        store = _texts(sections.get("store_info"))
+        transaction = _texts(sections.get("transaction_info"))
+        totals = _texts(sections.get("totals"))
+        payment = _texts(sections.get("payment_info"))
+        items_element = sections.get("items")
+        items = [] if items_element is None else [Item.from_element(item) for item in items_element.findall("item")]
+        return cls(store.get("n", ""), store.get("address", ""), store.get("phone", ""),
+                   transaction.get("date", ""), transaction.get("time", ""), transaction.get("receipt_number", ""),
+                   items,
+                   totals.get("subtotal", ""), totals.get("tax", ""), totals.get("total", ""),
+                   payment.get("method", ""), payment.get("amount_paid", ""), payment.get("change", ""),
+                   xml)
+
+    @classmethod
+    def from_xml(cls, xml: str) -> "Receipt":
+        """Parse receipt XML; raises ``ET.ParseError`` if it is malformed."""
+        return cls.from_element(ET.fromstring(xml), xml)
+
+    def to_xml(self) -> str:
+        """Formatted receipt XML."""
+        return self.xml
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Nested dict mirroring the XML template sections."""
+        return {
+            "store_info": {"name": self.store_name, "address": self.store_address, "phone": self.store_phone},
+            "transaction_info": {"date": self.date, "time": self.time, "receipt_number": self.receipt_number},
+            "items": [item.to_dict() for item in self.items],
+            "totals": {"subtotal": self.subtotal, "tax": self.tax, "total": self.total},
+            "payment_info": {"method": self.payment_method, "amount_paid": self.amount_paid,
+                             "change": self.change},
+        }
+
+    def to_json(self, indent: int = 2) -> str:
+        """JSON rendering of :meth:`to_dict`, keeping Japanese text readable."""
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def iter_csv_rows(self, typed: bool = False) -> Iterator[List[CsvValue]]:
+        """Yield one row per item (or a single row without items), matching ``CSV_HEADER``.
+
+        With ``typed`` the amount columns are converted with :func:`to_number`.
+        """
+        head = [self.store_name, self.store_address, self.store_phone,
+                self.date, self.time, self.receipt_number]
+        tail = [self.subtotal, self.tax, self.total,
+                self.payment_method, self.amount_paid, self.change]
+        items = self.items or [Item("", "", "", "", "", "")]
+        for item in items:
+            row: List[CsvValue] = head + [item.name, item.category, item.subcategory,
+                                          item.quantity, item.unit_price, item.total_price] + tail
+            if typed:
+                for index in _NUMERIC_INDEXES:
+                    row[index] = to_number(row[index])
+            yield row
+
+    def csv_rows(self, typed: bool = False) -> List[List[CsvValue]]:
+        """All rows of :meth:`iter_csv_rows` as a list."""
+        return list(self.iter_csv_rows(typed))
+
+    def to_csv(self, typed: bool = False) -> str:
+        """CSV text with a header row, quoted by the ``csv`` module."""
+        buffer = io.StringIO()
+        write_csv([self], buffer, typed=typed)
+        return buffer.getvalue()[:-1]
+
+
+def csv_writer(file: TextIO, typed: bool = False):
+    """``csv.writer`` for receipt rows; typed output leaves numbers unquoted and quotes all text."""
+    return csv.writer(file, lineterminator="\n",
+                      quoting=csv.QUOTE_NONNUMERIC if typed else csv.QUOTE_MINIMAL)
+
+
+def write_csv(receipts: Iterable[Receipt], file: TextIO, typed: bool = False, header: bool = True) -> int:
+    """Stream the rows of ``receipts`` to ``file``, returning the number of rows written.
+
+    Rows are written as they are generated, so memory stays constant however
+    many receipts ``receipts`` yields. Open ``file`` with ``newline=""``.
+    """
+    writer = csv_writer(file, typed)
+    if header:
+        writer.writerow(CSV_HEADER)
+    count = 0
+    for receipt in receipts:
+        for row in receipt.iter_csv_rows(typed):
+            writer.writerow(row)
+            count += 1
+    return count
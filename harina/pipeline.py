@@ -0,0 +1,108 @@
+"""Two-stage receipt pipeline: image preparation in worker processes, API calls in threads."""
+
+import multiprocessing
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from loguru import logger
+
+from .dedup import image_dhash
+from .imaging import EncodedImage, PreprocessOptions, prepare_image
+
+
+def _init_worker(level: str) -> None:
+    """Log from worker processes at the parent's level instead of loguru's DEBUG default."""
+    logger.remove()
+    logger.add(sys.stderr, level=level,
+               format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>")
+
+
+def prepare_files(paths: List[Path], options: PreprocessOptions,
+                  fingerprint: bool = False) -> List[Union[EncodedImage, Exception]]:
+    """Decode, preprocess and encode images, returning an encoded image or the error per path.
+
+    Runs in a worker process: only the encoded bytes travel back to the parent,
+    never decoded PIL images. With ``fingerprint`` the perceptual hash used for
+    duplicate detection is computed here as well.
+    """
+    results = []
+    for path in paths:
+        try:
+            encoded_image = prepare_image(path, options)
+            encoded_image.source = str(path)
+            if fingerprint:
+                encoded_image.fingerprint = image_dhash(encoded_image.data)
+            results.append(encoded_image)
+        except Exception as e:
+            # Rebuilt as a plain ValueError so it always pickles back to the parent
+            results.append(ValueError(f"Failed to load image: {e}"))
+    return results
+
+
+def run_pipeline(items: Iterable[Any], prepare: Callable[[Any], Any], worker: Callable[[Any, Any], Any],
+                 cpu_workers: int = 1, concurrency: int = 1, max_pending: Optional[int] = None,
+                 log_level: str = 'WARNING') -> Iterator[Tuple[Any, Any, Optional[BaseException]]]:
+    """Run ``prepare`` in a process pool and ``worker(item, prepared)`` in a thread pool.
+
+    Yields ``(item, result, error)`` tuples in completion order, like
+    :func:`harina.batch.run_batch`; an error raised by either stage is
+    captured for its item. ``prepare`` must be picklable (a module-level
+    function or a ``functools.partial`` of one) and should return compact
+    data such as encoded bytes.
+
+    CPU-bound decoding and encoding no longer compete with the API threads
+    for the GIL. Backpressure keeps memory bounded: at most ``max_pending``
+    items (default ``2 * cpu_workers``) are being prepared or wait for one of
+    the ``concurrency`` API slots, and ``items`` is consumed lazily.
+    """
+    cpu_workers = max(1, int(cpu_workers))
+    concurrency = max(1, int(concurrency))
+    max_pending = max(1, int(max_pending or 2 * cpu_workers))
+
+    iterator = iter(items)
+    exhausted = False
+    # Spawned workers do not inherit the scanner and API threads, unlike fork()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=cpu_workers, mp_context=context, initializer=_init_worker,
+                             initargs=(log_level,)) as processes, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="harina") as threads:
+        preparing = {}
+        ready = deque()
+        calling = {}
+
+        def fill():
+            nonlocal exhausted
+            while ready and len(calling) < concurrency:
+                item, prepared = ready.popleft()
+                calling[threads.submit(worker, item, prepared)] = item
+            # Prepare ahead only while the backlog of prepared items has room
+            while not exhausted and len(preparing) + len(ready) < max_pending:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    return
+                preparing[processes.submit(prepare, item)] = item
+
+        try:
+            fill()
+            while preparing or calling:
+                done, _ = wait([*preparing, *calling], return_when=FIRST_COMPLETED)
+                for future in done:
+                    error = future.exception()
+                    if future in preparing:
+                        item = preparing.pop(future)
+                        if error is None:
+                            ready.append((item, future.result()))
+                            continue
+                    else:
+                        item = calling.pop(future)
+                    yield item, (None if error else future.result()), error
+                fill()
+        finally:
+            # Drop work that has not started yet if the consumer stops early
+            for future in [*preparing, *calling]:
+                future.cancel()
@@ -0,0 +1,119 @@
+"""Receipt recognition prompt for Harina v3."""
+
+import hashlib
+import os
+import threading
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Optional, Tuple
+
+from loguru import logger
+
+DEFAULT_TEMPLATE_PATH = Path(__file__).parent / "receipt_template.xml"
+DEFAULT_CATEGORIES_PATH = Path(__file__).parent / "product_categories.xml"
+
+PROMPT_FORMAT = """このレシート画像を分析して、以下のXML形式で情報を抽出してください：
+
+{xml_template}
+
+商品のカテゴリ分けには以下の分類を参考にしてください：
+
+{product_categories}
+
+各商品について、最も適切なカテゴリとサブカテゴリを選択してください。
+情報が読み取れない場合は、該当する要素を空にするか省略してください。
+数値は数字のみで出力し、通貨記号は含めないでください。
+XMLタグのみを出力し、他の説明文は含めないでください。
+"""
+
+BATCH_PROMPT_FORMAT = """これから{count}枚のレシート画像を順番に送ります。各画像を個別に分析してください。
+画像ごとに上記の<receipt>形式で出力し、<receipt>タグには画像の番号をindex属性として付けてください（例: <receipt index="1">）。
+すべての<receipt>要素を1つの<receipts>要素で囲み、画像と同じ順番で{count}件すべてを出力してください。
+"""
+
+
+class ReceiptPrompt:
+    """Prompt rendered once from the XML template and product categories.
+
+    The source files are re-read only when their modification time changes, so
+    a long-lived instance can be shared across calls and threads.
+    """
+
+    def __init__(self, template_path: str = None, categories_path: str = None):
+        """Load, validate and render the prompt."""
+        self.template_path = Path(template_path) if template_path else DEFAULT_TEMPLATE_PATH
+        self.categories_path = Path(categories_path) if categories_path else DEFAULT_CATEGORIES_PATH
+        self._lock = threading.Lock()
+        self._mtimes: Optional[Tuple[int, int]] = None
+        self._template = ""
+        self._categories = ""
+        self._text = ""
+        self._hash = ""
+        self._refresh()
+
+    def _stat(self) -> Tuple[int, int]:
+        try:
+            return (os.stat(self.template_path).st_mtime_ns, os.stat(self.categories_path).st_mtime_ns)
+        except OSError:
+            # Let the reload surface a descriptive error
+            return (-1, -1)
+
+    def _refresh(self) -> None:
+        mtimes = self._stat()
+        if mtimes == self._mtimes:
+            return
+        with self._lock:
+            if mtimes == self._mtimes:
+                return
+
+            try:
+                template = self.template_path.read_text(encoding='utf-8')
+            except Exception as e:
+                raise ValueError(f"Failed to load XML template: {e}") from e
+            try:
+                ET.fromstring(template)
+            except ET.ParseError as e:
+                # The template is only shown to the model, so use it as written
+                logger.warning(f"⚠️ XML template {self.template_path} is not well-formed XML ({e}), using it as is")
+            try:
+                categories = self.categories_path.read_text(encoding='utf-8')
+            except Exception as e:
+                raise ValueError(f"Failed to load product categories: {e}") from e
+            if not categories.strip():
+                raise ValueError(f"Failed to load product categories: {self.categories_path} is empty")
+
+            text = PROMPT_FORMAT.format(xml_template=template, product_categories=categories)
+            if self._mtimes is not None:
+                logger.info("🔄 Prompt source files changed, reloaded prompt")
+            self._template, self._categories, self._text = template, categories, text
+            self._hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            self._mtimes = mtimes
+            logger.debug(f"📋 Prompt rendered ({len(text)} characters, hash {self._hash[:12]})")
+
+    @property
+    def text(self) -> str:
+        """Rendered prompt text, reloaded if a source file changed."""
+        self._refresh()
+        return self._text
+
+    def render_batch(self, count: int) -> str:
+        """Prompt asking for ``count`` receipts wrapped in a ``<receipts>`` element."""
+        return f"{self.text}\n{BATCH_PROMPT_FORMAT.format(count=count)}"
+
+    @property
+    def hash(self) -> str:
+        """SHA-256 of the rendered prompt, stable across processes."""
+        self._refresh()
+        return self._hash
+
+    @property
+    def template(self) -> str:
+        """XML template text."""
+        self._refresh()
+        return self._template
+
+    @property
+    def categories(self) -> str:
+        """Product categories text."""
+        self._refresh()
+        return self._categories
@@ -0,0 +1,287 @@
+"""Multi-model fallback and hedged requests for Harina v3."""
+
+import asyncio
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from loguru import logger
+
+# Latency samples kept per model for the p95 estimate
+LATENCY_WINDOW = 200
+# Recent outcomes used to decide whether a model is degraded
+HEALTH_WINDOW = 20
+# Seconds after which an outcome no longer counts, so a demoted model is tried first again
+HEALTH_MAX_AGE = 300.0
+# Samples needed before the p95 replaces ``initial_hedge_delay``
+MIN_LATENCY_SAMPLES = 5
+# Threads running sync hedged requests (primary and hedge) across all callers
+MAX_ROUTE_WORKERS = 32
+
+
+class AttemptCancelled(Exception):
+    """Raised by a losing attempt that stopped because another one already won."""
+
+
+class ModelStats:
+    """Latency and success counters for one model."""
+
+    def __init__(self, health_max_age: float = HEALTH_MAX_AGE):
+        self.successes = 0
+        self.failures = 0
+        self.health_max_age = health_max_age
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        # (monotonic time, succeeded) of the last calls
+        self.outcomes = deque(maxlen=HEALTH_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, succeeded: bool) -> None:
+        """Record the outcome of one call."""
+        with self._lock:
+            if succeeded:
+                self.successes += 1
+                self.latencies.append(latency)
+            else:
+                self.failures += 1
+            self.outcomes.append((time.monotonic(), succeeded))
+
+    @property
+    def success_rate(self) -> float:
+        """Share of calls within ``health_max_age`` that succeeded (1.0 without data)."""
+        cutoff = time.monotonic() - self.health_max_age
+        with self._lock:
+            recent = [succeeded for at, succeeded in self.outcomes if at >= cutoff]
+        if not recent:
+            return 1.0
+        return sum(recent) / len(recent)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency percentile of recent successful calls, or None with too few samples."""
+        with self._lock:
+            if len(self.latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Snapshot of the counters."""
+        return {
+            'successes': self.successes,
+            'failures': self.failures,
+            'success_rate': self.success_rate,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+        }
+
+
+class Router:
+    """Routes a call over an ordered list of models.
+
+    The first model is tried first and the next one is used when it fails.
+    Models whose recent success rate drops below ``min_success_rate`` are
+    moved to the back of the list. Outcomes older than ``health_max_age``
+    seconds are forgotten, so a demoted model, which is rarely called, gets
+    the first request again and recovers if it answers. With ``hedge`` a second
+    request is started when the first has not answered within the primary
+    model's p95 latency; the first valid answer wins and the other is cancelled.
+    Sync attempts run on a pool of ``max_workers`` threads: one that has not
+    started yet is dropped, one that is running is left to stop by itself
+    (``fn`` may raise :class:`AttemptCancelled`, which is not held against the model).
+    """
+
+    def __init__(self, models: Sequence[str], hedge: bool = False,
+                 hedge_delay: Optional[float] = None, initial_hedge_delay: float = 10.0,
+                 min_success_rate: float = 0.5, health_max_age: float = HEALTH_MAX_AGE,
+                 max_workers: int = MAX_ROUTE_WORKERS):
+        """Create a router for ``models`` in order of preference.
+
+        ``hedge_delay`` fixes the hedge delay in seconds instead of using the
+        observed p95 latency.
+        """
+        if not models:
+            raise ValueError("At least one model is required")
+        self.models = list(dict.fromkeys(models))
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_success_rate = min_success_rate
+        self.max_workers = max(1, max_workers)
+        self.stats: Dict[str, ModelStats] = {model: ModelStats(health_max_age) for model in self.models}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def order(self) -> List[str]:
+        """Models in the order they should be tried, healthy ones first."""
+        healthy = [m for m in self.models if self.stats[m].success_rate >= self.min_success_rate]
+        degraded = [m for m in self.models if m not in healthy]
+        return healthy + degraded
+
+    def delay_for(self, model: str) -> float:
+        """Seconds to wait on ``model`` before sending a hedged request."""
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        p95 = self.stats[model].percentile(0.95)
+        return p95 if p95 is not None else self.initial_hedge_delay
+
+    def _candidates(self) -> List[str]:
+        order = self.order()
+        if self.hedge and len(order) == 1:
+            # With a single model the hedge is a duplicate request to the same model
+            return order * 2
+        return order
+
+    def _timed(self, fn: Callable[[str], Any], model: str) -> Any:
+        start = time.perf_counter()
+        try:
+            result = fn(model)
+        except AttemptCancelled:
+            # A loser that gave up says nothing about the model's health
+            raise
+        except Exception:
+            self.stats[model].record(time.perf_counter() - start, succeeded=False)
+            raise
+        self.stats[model].record(time.perf_counter() - start, succeeded=True)
+        return result
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="harina-route")
+            return self._executor
+
+    def call(self, fn: Callable[[str], Any]) -> Any:
+        """Call ``fn(model)`` on the first model, falling back or hedging as configured.
+
+        ``fn`` should raise unless it produced a valid result, so a malformed
+        answer also moves on to the next model.
+        """
+        candidates = self._candidates()
+        if len(candidates) == 1:
+            return self._timed(fn, candidates[0])
+        if not self.hedge:
+            return self._call_sequential(fn, candidates)
+
+        executor = self._get_executor()
+        outcomes: queue.Queue = queue.Queue()
+        in_flight: List[str] = []
+        attempts = []
+        last_error = None
+        launched = 0
+
+        def run(model):
+            try:
+                outcomes.put((model, self._timed(fn, model), None))
+            except Exception as e:
+                outcomes.put((model, None, e))
+
+        def launch():
+            nonlocal launched
+            model = candidates[launched]
+            launched += 1
+            in_flight.append(model)
+            if launched > 1:
+                logger.info(f"🔀 Sending request to {model}")
+            # Off the caller's thread, so it can return whichever attempt answers first
+            attempts.append(executor.submit(run, model))
+
+        launch()
+        try:
+            while in_flight:
+                # Hedge only while a single request is in flight
+                can_hedge = len(in_flight) == 1 and launched < len(candidates)
+                try:
+                    model, result, error = outcomes.get(timeout=self.delay_for(in_flight[0]) if can_hedge else None)
+                except queue.Empty:
+                    launch()
+                    continue
+                in_flight.remove(model)
+                if error is None:
+                    return result
+                logger.warning(f"⚠️ {model} failed: {error}")
+                last_error = error
+                if not in_flight and launched < len(candidates):
+                    launch()
+            raise last_error
+        finally:
+            # Attempts still queued never start; running ones stop on their own
+            for future in attempts:
+                future.cancel()
+
+    def _call_sequential(self, fn: Callable[[str], Any], candidates: List[str]) -> Any:
+        last_error = None
+        for index, model in enumerate(candidates):
+            if index:
+                logger.info(f"🔀 Falling back to {model}")
+            try:
+                return self._timed(fn, model)
+            except Exception as e:
+                logger.warning(f"⚠️ {model} failed: {e}")
+                last_error = e
+        raise last_error
+
+    async def _atimed(self, fn: Callable[[str], Awaitable[Any]], model: str) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await fn(model)
+        except (asyncio.CancelledError, AttemptCancelled):
+            # A cancelled loser says nothing about the model's health
+            raise
+        except Exception:
+            self.stats[model].record(time.perf_counter() - start, succeeded=False)
+            raise
+        self.stats[model].record(time.perf_counter() - start, succeeded=True)
+        return result
+
+    async def acall(self, fn: Callable[[str], Awaitable[Any]]) -> Any:
+        """Async version of :meth:`call`; losing requests are cancelled."""
+        candidates = self._candidates()
+        if len(candidates) == 1:
+            return await self._atimed(fn, candidates[0])
+
+        pending = {}
+        last_error = None
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            model = candidates[launched]
+            launched += 1
+            if launched > 1:
+                logger.info(f"🔀 Sending request to {model}")
+            pending[asyncio.ensure_future(self._atimed(fn, model))] = model
+
+        launch()
+        try:
+            while pending:
+                can_hedge = self.hedge and len(pending) == 1 and launched < len(candidates)
+                timeout = self.delay_for(next(iter(pending.values()))) if can_hedge else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        return task.result()
+                    logger.warning(f"⚠️ {model} failed: {error}")
+                    last_error = error
+                if not pending and launched < len(candidates):
+                    launch()
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self) -> None:
+        """Shut down the hedging thread pool."""
+        if self._executor is not None:
+            if sys.version_info >= (3, 9):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                self._executor.shutdown(wait=False)
+            self._executor = None
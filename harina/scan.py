@@ -0,0 +1,149 @@
+"""Lazy, parallel discovery of receipt images for Harina v3."""
+
+import fnmatch
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Pattern, Tuple, Union
+
+from loguru import logger
+
+IMAGE_EXTENSIONS = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp',
+                              '.webp', '.tif', '.tiff', '.heic', '.heif'})
+DEFAULT_SCAN_WORKERS = 8
+
+
+def _compile(patterns: Iterable[str]) -> Optional[Pattern]:
+    """One regex matching any of the glob ``patterns``, or None without patterns."""
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})' for pattern in patterns))
+
+
+def _matches(pattern: Pattern, relative: str) -> bool:
+    """Match a relative POSIX path; patterns without ``/`` also match the bare name."""
+    return bool(pattern.match(relative) or pattern.match(relative.rsplit('/', 1)[-1]))
+
+
+class PathFilter:
+    """Decides which files under a root are receipt images to process.
+
+    ``include``/``exclude`` are glob patterns matched against the path relative
+    to ``root`` (or just the name for patterns without ``/``).
+    """
+
+    def __init__(self, root: Union[str, Path], include: Iterable[str] = (), exclude: Iterable[str] = (),
+                 extensions: Iterable[str] = IMAGE_EXTENSIONS):
+        self.root = os.fspath(root)
+        self.extensions = frozenset(extension.lower() for extension in extensions)
+        self._include = _compile(include)
+        self._exclude = _compile(exclude)
+
+    def relative(self, path: Union[str, Path]) -> str:
+        """``path`` relative to the root, with ``/`` separators."""
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def wants_file(self, path: Union[str, Path]) -> bool:
+        """True for an image file that is included and not excluded."""
+        if os.path.splitext(path)[1].lower() not in self.extensions:
+            return False
+        relative = self.relative(path)
+        if relative.startswith('../'):
+            return False
+        if self._include is not None and not _matches(self._include, relative):
+            return False
+        return not self.excludes(relative)
+
+    def excludes(self, relative: str) -> bool:
+        """True when a relative path (file or directory) or one of its parents matches an exclude pattern."""
+        if self._exclude is None:
+            return False
+        parts = relative.split('/')
+        return any(_matches(self._exclude, '/'.join(parts[:depth])) for depth in range(1, len(parts) + 1))
+
+
+def _scan_directory(path: str, follow_symlinks: bool) -> Tuple[List[os.DirEntry], List[os.DirEntry]]:
+    """List one directory as ``(files, subdirectories)``, sorted by name.
+
+    ``DirEntry.is_dir``/``is_file`` use the type returned by the directory
+    listing, so most entries are classified without a separate stat call.
+    """
+    files, directories = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        directories.append(entry)
+                    elif entry.is_file():
+                        files.append(entry)
+                except OSError:
+                    continue
+    except OSError as e:
+        logger.warning(f"⚠️ Cannot scan directory {path}: {e}")
+    files.sort(key=lambda entry: entry.name)
+    directories.sort(key=lambda entry: entry.name)
+    return files, directories
+
+
+def scan_images(directory: Union[str, Path], include: Iterable[str] = (), exclude: Iterable[str] = (),
+                extensions: Iterable[str] = IMAGE_EXTENSIONS, workers: int = DEFAULT_SCAN_WORKERS,
+                follow_symlinks: bool = False) -> Iterator[Path]:
+    """Yield image files under ``directory`` while the tree is still being walked.
+
+    Subdirectories are listed in parallel by ``workers`` threads, which hides
+    the per-directory latency of network filesystems. Files in a directory are
+    yielded in name order; directories are yielded as their listings finish.
+    ``include``/``exclude`` are glob patterns matched against the path relative
+    to ``directory`` (or just the file name for patterns without ``/``). An
+    excluded directory is not descended into.
+    """
+    root = os.fspath(directory)
+    path_filter = PathFilter(root, include, exclude, extensions)
+
+    def wanted(entry: os.DirEntry) -> bool:
+        return path_filter.wants_file(entry.path)
+
+    seen = set()
+
+    def children(directories: List[os.DirEntry]) -> List[str]:
+        paths = []
+        for entry in directories:
+            if path_filter.excludes(path_filter.relative(entry.path)):
+                continue
+            if follow_symlinks:
+                # Guard against symlink cycles
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if (stat.st_dev, stat.st_ino) in seen:
+                    continue
+                seen.add((stat.st_dev, stat.st_ino))
+            paths.append(entry.path)
+        return paths
+
+    if workers <= 1:
+        stack = [root]
+        while stack:
+            files, directories = _scan_directory(stack.pop(), follow_symlinks)
+            yield from (Path(entry.path) for entry in files if wanted(entry))
+            stack.extend(reversed(children(directories)))
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="harina-scan") as executor:
+        pending = {executor.submit(_scan_directory, root, follow_symlinks)}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, directories = future.result()
+                    pending.update(executor.submit(_scan_directory, path, follow_symlinks)
+                                   for path in children(directories))
+                    yield from (Path(entry.path) for entry in files if wanted(entry))
+        finally:
+            # Stop listing directories if the consumer stops early
+            for future in pending:
+                future.cancel()
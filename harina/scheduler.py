@@ -0,0 +1,482 @@
+"""Rate-limit-aware scheduling of API calls for Harina v3."""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union
+
+from loguru import logger
+
+from .errors import ReceiptProcessingError
+
+# Rough token cost of one image when estimating requests before the call
+IMAGE_TOKEN_ESTIMATE = 1000
+
+
+def estimate_tokens(messages: list) -> int:
+    """Roughly estimate the input tokens of a chat request."""
+    tokens = 0
+    for message in messages:
+        content = message.get('content')
+        parts = content if isinstance(content, list) else [{'type': 'text', 'text': content or ''}]
+        for part in parts:
+            if part.get('type') == 'image_url':
+                tokens += IMAGE_TOKEN_ESTIMATE
+            else:
+                # Japanese text is close to one token per character
+                tokens += len(part.get('text') or '')
+    return tokens
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate_per_minute``."""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Take ``amount`` tokens and return how long the caller must wait first.
+
+        Reservations may push the bucket into debt, so concurrent callers queue
+        up fairly instead of all waking at the same moment.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Never reserve more than the bucket can hold, or the wait would be unbounded
+            self.tokens -= min(amount, self.capacity)
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def adjust(self, amount: float) -> None:
+        """Charge (positive) or refund (negative) tokens once actual usage is known."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit adapted with AIMD (additive increase, multiplicative decrease).
+
+    Threads wait on a condition; coroutines queue up as futures in FIFO order
+    and are handed a slot by :meth:`release` instead of polling for one.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1, initial: Optional[int] = None,
+                 decrease_factor: float = 0.5):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(initial if initial is not None else self.max_limit)
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free and no coroutine is queued for it."""
+        with self._condition:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self) -> None:
+        """Block until a slot is free."""
+        with self._condition:
+            while self._waiters or self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    async def aacquire(self) -> None:
+        """Wait on the event loop until :meth:`release` hands this coroutine a slot."""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if not self._waiters and self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._condition:
+                try:
+                    self._waiters.remove((loop, future))
+                except ValueError:
+                    # Already handed a slot: give it back unless _grant will
+                    if future.done() and not future.cancelled():
+                        self._free_locked()
+            raise
+
+    def _grant(self, future: asyncio.Future) -> None:
+        # Runs on the waiter's loop; a waiter cancelled in the meantime passes its slot on
+        if future.done():
+            with self._condition:
+                self._free_locked()
+        else:
+            future.set_result(None)
+
+    def _free_locked(self) -> None:
+        self.in_flight -= 1
+        while self._waiters and self.in_flight < int(self.limit):
+            loop, future = self._waiters.popleft()
+            self.in_flight += 1
+            try:
+                loop.call_soon_threadsafe(self._grant, future)
+            except RuntimeError:
+                # The waiter's loop is closed, nobody will take the slot
+                self.in_flight -= 1
+        self._condition.notify_all()
+
+    def release(self, throttled: bool = False, succeeded: bool = False) -> None:
+        """Free a slot and adapt the limit to the call's outcome."""
+        with self._condition:
+            now = time.monotonic()
+            if throttled:
+                # Decrease at most once per second so a burst of 429s counts as one signal
+                if now - self._last_decrease > 1.0:
+                    self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+                    logger.warning(f"🐢 Throttled, reducing concurrency to {int(self.limit)}")
+            elif succeeded and self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._free_locked()
+
+    def block(self, seconds: float) -> None:
+        """Hold back new calls for ``seconds`` (e.g. after a Retry-After)."""
+        with self._condition:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def blocked_for(self) -> float:
+        """Seconds left before new calls may start."""
+        with self._condition:
+            return max(0.0, self.blocked_until - time.monotonic())
+
+
+def _source_key(source: Any) -> str:
+    # The same receipt may be named relative to the input directory or the working directory
+    return str(Path(source).resolve())
+
+
+@dataclass
+class DeadLetter:
+    """A receipt that failed after all retries."""
+
+    source: str
+    error: str
+    attempts: int = 1
+    status_code: Optional[int] = None
+    failed_at: float = field(default_factory=time.time)
+
+
+class DeadLetterQueue:
+    """Collects failed receipts so they can be re-driven later."""
+
+    def __init__(self):
+        self.entries: List[DeadLetter] = []
+        self._lock = threading.Lock()
+
+    def add(self, source: Any, error: BaseException, attempts: int = 1) -> DeadLetter:
+        """Record a failed receipt."""
+        entry = DeadLetter(source=str(source), error=str(error),
+                           attempts=getattr(error, 'attempts', attempts),
+                           status_code=getattr(error, 'status_code', None))
+        with self._lock:
+            self.entries.append(entry)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def write(self, path: Union[str, Path]) -> None:
+        """Write the dead letters as JSON Lines."""
+        with self._lock:
+            lines = [json.dumps(asdict(entry), ensure_ascii=False) for entry in self.entries]
+            Path(path).write_text(''.join(f"{line}\n" for line in lines), encoding='utf-8')
+
+    def append(self, path: Union[str, Path], entry: DeadLetter) -> None:
+        """Append one dead letter to the file at ``path``, keeping the entries already there."""
+        line = json.dumps(asdict(entry), ensure_ascii=False)
+        with self._lock, open(path, 'a', encoding='utf-8') as f:
+            f.write(f"{line}\n")
+
+    def merge(self, path: Union[str, Path], resolved: Iterable[Any] = ()) -> int:
+        """Update the dead-letter file at ``path`` with the outcome of this run.
+
+        Entries of ``resolved`` sources and of sources that failed again are
+        replaced; entries of receipts this run did not retry are kept, so a
+        partial run never loses earlier failures. The file is removed once it
+        is empty. Returns the number of entries left.
+        """
+        path = Path(path)
+        with self._lock:
+            retried = {_source_key(source) for source in resolved}
+            retried.update(_source_key(entry.source) for entry in self.entries)
+            lines = []
+            if path.exists():
+                for line in path.read_text(encoding='utf-8').splitlines():
+                    if line.strip() and _source_key(json.loads(line)['source']) not in retried:
+                        lines.append(line)
+            lines.extend(json.dumps(asdict(entry), ensure_ascii=False) for entry in self.entries)
+
+            if not lines:
+                if path.exists():
+                    path.unlink()
+                return 0
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(''.join(f"{line}\n" for line in lines), encoding='utf-8')
+            os.replace(tmp_path, path)
+            return len(lines)
+
+    @staticmethod
+    def read_sources(path: Union[str, Path]) -> List[str]:
+        """Read the sources recorded in a dead-letter file."""
+        sources = []
+        for line in Path(path).read_text(encoding='utf-8').splitlines():
+            if line.strip():
+                sources.append(json.loads(line)['source'])
+        return sources
+
+
+class HeldStream:
+    """A streamed response that keeps its scheduler slot until it is exhausted or closed.
+
+    ``release`` is called once with the error that ended the stream, or None.
+    :meth:`close` closes the wrapped stream with ``close_stream`` (its own
+    ``close`` by default) before releasing.
+    """
+
+    def __init__(self, stream: Any, release: Callable[[Optional[BaseException]], None],
+                 close_stream: Optional[Callable[[Any], None]] = None):
+        self.stream = stream
+        self._release = release
+        self._close_stream = close_stream
+        self._iterator = None
+        self._released = False
+        self._lock = threading.Lock()
+
+    def _finish(self, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._release(error)
+
+    def __iter__(self) -> "HeldStream":
+        return self
+
+    def __next__(self) -> Any:
+        if self._iterator is None:
+            self._iterator = iter(self.stream)
+        try:
+            return next(self._iterator)
+        except StopIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+
+    def __aiter__(self) -> "HeldStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._iterator is None:
+            self._iterator = self.stream.__aiter__()
+        try:
+            return await self._iterator.__anext__()
+        except StopAsyncIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+
+    def close(self) -> None:
+        """Close the wrapped stream and free the slot."""
+        try:
+            if self._close_stream is not None:
+                self._close_stream(self.stream)
+            elif callable(getattr(self.stream, 'close', None)):
+                self.stream.close()
+        finally:
+            self._finish()
+
+    async def aclose(self) -> None:
+        """Async version of :meth:`close`."""
+        try:
+            aclose = getattr(self.stream, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+        finally:
+            self._finish()
+
+    def __del__(self) -> None:
+        # A stream dropped without being closed must not keep its slot forever
+        self._finish()
+
+
+class _ModelState:
+    def __init__(self, rpm: Optional[float], tpm: Optional[float], limiter: AdaptiveLimiter):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.limiter = limiter
+
+
+class Scheduler:
+    """Schedules API calls under per-model RPM/TPM budgets with adaptive concurrency.
+
+    Retryable failures (429, 5xx, timeouts) are retried with full-jitter
+    exponential backoff, honoring ``Retry-After`` when the provider sends it.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_concurrency: int = 8, min_concurrency: int = 1, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0,
+                 limits: Optional[Dict[str, Dict[str, float]]] = None):
+        """Create a scheduler.
+
+        ``rpm``/``tpm`` apply to every model unless overridden in ``limits``,
+        e.g. ``{"gemini/gemini-2.5-flash": {"rpm": 1000, "tpm": 1_000_000}}``.
+        """
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limits = limits or {}
+        self._models: Dict[str, _ModelState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, model: str) -> _ModelState:
+        with self._lock:
+            state = self._models.get(model)
+            if state is None:
+                limits = self.limits.get(model, {})
+                state = _ModelState(limits.get('rpm', self.rpm), limits.get('tpm', self.tpm),
+                                    AdaptiveLimiter(self.max_concurrency, self.min_concurrency))
+                self._models[model] = state
+            return state
+
+    def concurrency(self, model: str) -> int:
+        """Current adaptive concurrency limit for ``model``."""
+        return int(self._state(model).limiter.limit)
+
+    def _reserve(self, state: _ModelState, estimated_tokens: int) -> float:
+        wait = state.limiter.blocked_for()
+        if state.requests is not None:
+            wait = max(wait, state.requests.reserve(1))
+        if state.tokens is not None:
+            wait = max(wait, state.tokens.reserve(estimated_tokens))
+        return wait
+
+    def _record_usage(self, state: _ModelState, response: Any, estimated_tokens: int) -> None:
+        if state.tokens is None:
+            return
+        usage = getattr(response, 'usage', None)
+        total_tokens = getattr(usage, 'total_tokens', None)
+        if isinstance(total_tokens, (int, float)):
+            state.tokens.adjust(total_tokens - estimated_tokens)
+
+    def _backoff(self, state: _ModelState, error: ReceiptProcessingError, attempt: int) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+            # Every call to the model waits, with or without an rpm budget
+            state.limiter.block(error.retry_after)
+        return delay
+
+    def _should_retry(self, model: str, error: ReceiptProcessingError, attempt: int) -> bool:
+        if not error.retryable or attempt >= self.max_retries:
+            error.attempts = attempt + 1
+            return False
+        logger.warning(f"🔁 {model} call failed ({error.status_code or type(error.__cause__).__name__}), "
+                       f"retry {attempt + 1}/{self.max_retries}")
+        return True
+
+    def _release_stream(self, state: _ModelState, error: Optional[BaseException]) -> None:
+        if error is None:
+            state.limiter.release(succeeded=True)
+            return
+        error = ReceiptProcessingError.from_exception(error)
+        state.limiter.release(throttled=error.rate_limited or (error.status_code or 0) >= 500)
+
+    def call(self, model: str, fn: Callable[[], Any], estimated_tokens: int = 0, stream: bool = False,
+             close_stream: Optional[Callable[[Any], None]] = None) -> Any:
+        """Run ``fn`` under the model's budgets, retrying retryable failures.
+
+        With ``stream`` the response is returned as a :class:`HeldStream` that
+        keeps the slot until it is read to the end or closed, so streamed
+        requests count against the concurrency limit while their body is read.
+        """
+        state = self._state(model)
+        attempt = 0
+        while True:
+            wait = self._reserve(state, estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            state.limiter.acquire()
+            try:
+                response = fn()
+            except Exception as e:
+                error = ReceiptProcessingError.from_exception(e)
+                state.limiter.release(throttled=error.rate_limited or (error.status_code or 0) >= 500)
+                if not self._should_retry(model, error, attempt):
+                    raise error
+                time.sleep(self._backoff(state, error, attempt))
+                attempt += 1
+                continue
+            if stream:
+                return HeldStream(response, partial(self._release_stream, state), close_stream)
+            if stream:
+                return HeldStream(response, partial(self._release_stream, state))
+            state.limiter.release(succeeded=True)
+            self._record_usage(state, response, estimated_tokens)
+            return response
+
+    async def acall(self, model: str, fn: Callable[[], Awaitable[Any]], estimated_tokens: int = 0,
+                    stream: bool = False) -> Any:
+        """Async version of :meth:`call`; ``fn`` returns a fresh awaitable per attempt."""
+        state = self._state(model)
+        attempt = 0
+        while True:
+            wait = self._reserve(state, estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await state.limiter.aacquire()
+            try:
+                response = await fn()
+            except asyncio.CancelledError:
+                state.limiter.release()
+                raise
+            except Exception as e:
+                error = ReceiptProcessingError.from_exception(e)
+                state.limiter.release(throttled=error.rate_limited or (error.status_code or 0) >= 500)
+                if not self._should_retry(model, error, attempt):
+                    raise error
+                await asyncio.sleep(self._backoff(state, error, attempt))
+                attempt += 1
+                continue
+            if stream:
+                return HeldStream(response, partial(self._release_stream, state))
+            state.limiter.release(succeeded=True)
+            self._record_usage(state, response, estimated_tokens)
+            return response
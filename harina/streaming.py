@@ -0,0 +1,146 @@
+"""Incremental extraction of receipts from streamed completions for Harina v3."""
+
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+RECEIPT_START = re.compile(r'<receipt[\s>]')
+RECEIPT_END = '</receipt>'
+
+
+@dataclass
+class ReceiptProgress:
+    """Partially recognized receipt, updated as the response streams in.
+
+    ``sections`` maps top-level sections such as ``store_info`` or ``totals``
+    to their fields once the section has closed; ``items`` grows one item at a
+    time. ``event`` names what was just completed. The final update has
+    ``complete`` set and carries the formatted receipt XML.
+    """
+
+    sections: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    items: List[Dict[str, str]] = field(default_factory=list)
+    event: str = ''
+    complete: bool = False
+    xml: Optional[str] = None
+
+    @property
+    def store_info(self) -> Dict[str, str]:
+        """Store name, address and phone once available."""
+        return self.sections.get('store_info', {})
+
+    @property
+    def totals(self) -> Dict[str, str]:
+        """Subtotal, tax and total once available."""
+        return self.sections.get('totals', {})
+
+    def snapshot(self) -> "ReceiptProgress":
+        """Copy that later updates will not mutate."""
+        return ReceiptProgress(sections={name: dict(fields) for name, fields in self.sections.items()},
+                               items=[dict(item) for item in self.items],
+                               event=self.event, complete=self.complete, xml=self.xml)
+
+    @classmethod
+    def from_xml(cls, xml_content: str) -> "ReceiptProgress":
+        """Build a completed progress record from a full receipt."""
+        progress = cls(event='receipt', complete=True, xml=xml_content)
+        root = ET.fromstring(xml_content)
+        for section in root:
+            if section.tag == 'items':
+                progress.items = [_fields(item) for item in section.findall('item')]
+            else:
+                progress.sections[section.tag] = _fields(section)
+        return progress
+
+
+def _fields(element: ET.Element) -> Dict[str, str]:
+    return {child.tag: (child.text or '').strip() for child in element}
+
+
+def delta_text(chunk: Any) -> str:
+    """Text carried by one streamed completion chunk."""
+    try:
+        return chunk.choices[0].delta.content or ''
+    except (AttributeError, IndexError):
+        return ''
+
+
+class ReceiptStreamParser:
+    """Feeds streamed text to an incremental XML parser until ``</receipt>`` closes.
+
+    Anything before ``<receipt>`` (code fences, preambles) and after
+    ``</receipt>`` is ignored. Completed sections and items are reported to
+    ``on_progress`` as soon as their closing tag arrives. If the streamed XML
+    is malformed, progress reporting stops but the end of the receipt is still
+    detected.
+    """
+
+    def __init__(self, on_progress: Optional[Callable[[ReceiptProgress], None]] = None):
+        self.on_progress = on_progress
+        self.progress = ReceiptProgress()
+        self.text = ''
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self._parser: Optional[ET.XMLPullParser] = None
+        self._fed = 0
+        self._depth = 0
+
+    @property
+    def done(self) -> bool:
+        """True once the receipt element has closed."""
+        return self.end is not None
+
+    def feed(self, chunk: str) -> bool:
+        """Add streamed text and return True once the receipt is complete."""
+        if self.done or not chunk:
+            return self.done
+        search_from = max(0, len(self.text) - len(RECEIPT_END))
+        self.text += chunk
+
+        if self.start is None:
+            match = RECEIPT_START.search(self.text, max(0, search_from - len(RECEIPT_END)))
+            if match is None:
+                return False
+            self.start = self._fed = match.start()
+            self._parser = ET.XMLPullParser(events=('start', 'end'))
+            search_from = self.start
+
+        end = self.text.find(RECEIPT_END, max(search_from, self.start))
+        if end >= 0:
+            self.end = end + len(RECEIPT_END)
+        # Never feed the parser past the closing tag, trailing chatter is not XML
+        self._feed_parser(self.text[self._fed:self.end if self.done else len(self.text)])
+        return self.done
+
+    def _feed_parser(self, data: str) -> None:
+        if self._parser is None or not data:
+            return
+        self._fed += len(data)
+        try:
+            self._parser.feed(data)
+            for event, element in self._parser.read_events():
+                if event == 'start':
+                    self._depth += 1
+                    continue
+                self._depth -= 1
+                self._on_end(element)
+        except ET.ParseError:
+            self._parser = None
+
+    def _on_end(self, element: ET.Element) -> None:
+        if self._depth == 1 and element.tag != 'items':
+            self.progress.sections[element.tag] = _fields(element)
+        elif self._depth == 2 and element.tag == 'item':
+            self.progress.items.append(_fields(element))
+        else:
+            return
+        self.progress.event = element.tag
+        if self.on_progress is not None:
+            self.on_progress(self.progress.snapshot())
+
+    def result(self) -> str:
+        """The receipt text if it closed, otherwise everything received so far."""
+        if self.done:
+            return self.text[self.start:self.end]
+        return self.text
@@ -1,13 +1,17 @@
 """Utility functions for Harina v3."""
 
 import base64
+import functools
 import io
 import re
 import xml.etree.ElementTree as ET
+from typing import Optional, Tuple
 from xml.dom import minidom
 
 from PIL import Image
 
+from .models import Receipt
+
 
 def image_to_base64(image: Image.Image) -> str:
     """Convert PIL Image to base64 string."""
@@ -51,39 +55,165 @@ def extract_xml(text: str) -> str:
     raise ValueError("No valid XML content found in response")
 
 
+def extract_receipts(text: str) -> dict:
+    """Split a batched response into receipts keyed by their 1-based image index.
+
+    Each ``<receipt>`` must be well-formed XML. Receipts are matched by their
+    ``index`` attribute; when no receipt carries one, document order is used.
+    The ``index`` attribute is removed from the returned XML strings.
+    """
+    elements = []
+    for match in re.finditer(r'<receipt\b[^>]*>.*?</receipt>', text, re.DOTALL):
+        try:
+            elements.append(ET.fromstring(match.group(0)))
+        except ET.ParseError:
+            continue
+
+    use_order = all(element.get('index') is None for element in elements)
+    receipts = {}
+    for position, element in enumerate(elements, 1):
+        index = element.attrib.pop('index', None)
+        try:
+            key = position if use_order else int(index)
+        except (TypeError, ValueError):
+            continue
+        receipts.setdefault(key, ET.tostring(element, encoding='unicode'))
+    return receipts
+
+
 def format_xml(xml_content: str) -> str:
-    """Format and validate XML content."""
+    """Format and validate XML content.
+
+    The document is parsed once and pretty-printed directly from the
+    ElementTree, producing the same text as the minidom round trip in
+    :func:`format_xml_minidom` without re-parsing.
+    """
+    return parse_xml(xml_content)[0]
+
+
+def parse_xml(xml_content: str) -> Tuple[str, Optional[ET.Element]]:
+    """Format XML content and also return the parsed root.
+
+    The root is None when the content could not be parsed even after
+    cleaning, in which case the original content is returned unchanged.
+    """
     try:
         # Parse XML to validate structure
         root = ET.fromstring(xml_content)
+        return _pretty_xml(root), root
+
+    except ET.ParseError:
+        # If parsing fails, try to clean up the XML
+        cleaned_xml = clean_xml(xml_content)
+        try:
+            root = ET.fromstring(cleaned_xml)
+            return _pretty_xml(root), root
+        except Exception:
+            # If all else fails, return the original content
+            return xml_content, None
 
-        # Convert back to string with proper formatting
-        rough_string = ET.tostring(root, encoding='unicode')
-        reparsed = minidom.parseString(rough_string)
 
-        # Get formatted XML and clean up unwanted whitespace
-        formatted_xml = reparsed.toprettyxml(indent="  ", encoding=None)
-        
-        # Remove excessive blank lines and clean up formatting
-        cleaned_xml = remove_excessive_whitespace(formatted_xml)
-        
-        return cleaned_xml.strip()
+def format_xml_minidom(xml_content: str) -> str:
+    """Format and validate XML content with a minidom round trip (reference implementation)."""
+    try:
+        # Parse XML to validate structure
+        root = ET.fromstring(xml_content)
+        return _minidom_pretty_xml(root)
 
     except ET.ParseError:
         # If parsing fails, try to clean up the XML
         cleaned_xml = clean_xml(xml_content)
         try:
-            root = ET.fromstring(cleaned_xml)
-            rough_string = ET.tostring(root, encoding='unicode')
-            reparsed = minidom.parseString(rough_string)
-            formatted_xml = reparsed.toprettyxml(indent="  ", encoding=None)
-            cleaned_xml = remove_excessive_whitespace(formatted_xml)
-            return cleaned_xml.strip()
+            return _minidom_pretty_xml(ET.fromstring(cleaned_xml))
         except Exception:
             # If all else fails, return the original content
             return xml_content
 
 
+def _minidom_pretty_xml(root: ET.Element) -> str:
+    # Convert back to string with proper formatting
+    rough_string = ET.tostring(root, encoding='unicode')
+    reparsed = minidom.parseString(rough_string)
+
+    # Get formatted XML and clean up unwanted whitespace
+    formatted_xml = reparsed.toprettyxml(indent="  ", encoding=None)
+
+    # Remove excessive blank lines and clean up formatting
+    cleaned_xml = remove_excessive_whitespace(formatted_xml)
+
+    return cleaned_xml.strip()
+
+
+@functools.lru_cache(maxsize=None)
+def _minidom_escaping() -> tuple:
+    """Probe how this Python's minidom escapes text quotes and attribute whitespace."""
+    probe = minidom.parseString('<a b="&#10;">"</a>').documentElement.toxml()
+    return probe.endswith('&quot;</a>'), '&#10;' in probe
+
+
+def _escape_text(text: str, quote: bool) -> str:
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    if quote:
+        text = text.replace('"', "&quot;")
+    return text
+
+
+def _escape_attribute(value: str, whitespace: bool) -> str:
+    value = value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace('"', "&quot;")
+    if whitespace:
+        value = value.replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#9;")
+    return value
+
+
+def _normalize_newlines(text: str) -> str:
+    # A re-parse would normalize carriage returns in character data
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+
+def _outer_lines(text: str) -> str:
+    # remove_excessive_whitespace() drops lines without markup, so only the first and
+    # last line of multi-line text survive, joined to the tags around them
+    first = text.find("\n")
+    return text if first < 0 else text[:first] + text[text.rindex("\n"):]
+
+
+def _write_pretty(element: ET.Element, indent: str, parts: list, escaping: tuple) -> None:
+    """Write ``element`` as minidom's ``writexml`` pretty-prints it after whitespace cleanup."""
+    quote_text, escape_whitespace = escaping
+    parts.append(f"{indent}<{element.tag}")
+    attributes = "".join(f' {name}="{_escape_attribute(value, escape_whitespace)}"'
+                         for name, value in element.items())
+    parts.append(_outer_lines(attributes))
+
+    if len(element) == 0:
+        if not element.text:
+            parts.append("/>\n")
+            return
+        parts.append(">")
+        parts.append(_outer_lines(_escape_text(_normalize_newlines(element.text), quote_text)))
+    else:
+        # minidom puts the text and tails next to child elements on lines of their
+        # own, which the cleanup drops entirely, so only the children are written
+        parts.append(">\n")
+        child_indent = indent + "  "
+        for child in element:
+            _write_pretty(child, child_indent, parts, escaping)
+        parts.append(indent)
+    parts.append(f"</{element.tag}>\n")
+
+
+def _pretty_xml(root: ET.Element) -> str:
+    """Pretty-print a parsed tree in one pass, identical to :func:`_minidom_pretty_xml`."""
+    for element in root.iter():
+        # Namespaced names get serializer-assigned prefixes, leave those to minidom
+        if '{' in element.tag or any('{' in name for name in element.keys()):
+            return _minidom_pretty_xml(root)
+
+    parts = ['<?xml version="1.0" ?>\n']
+    _write_pretty(root, "", parts, _minidom_escaping())
+    return ''.join(parts).strip()
+
+
 def remove_excessive_whitespace(xml_content: str) -> str:
     """Remove excessive whitespace and blank lines from XML content."""
     lines = xml_content.split('\n')
@@ -123,77 +253,11 @@ def clean_xml(xml_content: str) -> str:
     return xml_content.strip()
 
 
-def convert_xml_to_csv(xml_content: str) -> str:
-    """Convert XML content to CSV format."""
+def convert_xml_to_csv(xml_content: str, typed: bool = False) -> str:
+    """Convert XML content to CSV format; ``typed`` writes amounts as unquoted numbers."""
     try:
-        # Parse XML
-        root = ET.fromstring(xml_content)
-        
-        # Prepare CSV header
-        csv_lines = []
-        header = ["store_name", "store_address", "store_phone",
-                   "transaction_date", "transaction_time", "receipt_number",
-                   "item_name", "item_category", "item_subcategory",
-                   "item_quantity", "item_unit_price", "item_total_price",
-                   "subtotal", "tax", "total",
-                   "payment_method", "amount_paid", "change"]
-        csv_lines.append(",".join(header))
-        
-        # Extract store info
-        store_info = root.find("store_info")
-        store_name = store_info.find("n").text or "" if store_info.find("n") is not None else ""
-        store_address = store_info.find("address").text or "" if store_info.find("address") is not None else ""
-        store_phone = store_info.find("phone").text or "" if store_info.find("phone") is not None else ""
-        
-        # Extract transaction info
-        transaction_info = root.find("transaction_info")
-        transaction_date = transaction_info.find("date").text or "" if transaction_info.find("date") is not None else ""
-        transaction_time = transaction_info.find("time").text or "" if transaction_info.find("time") is not None else ""
-        receipt_number = transaction_info.find("receipt_number").text or "" if transaction_info.find("receipt_number") is not None else ""
-        
-        # Extract totals
-        totals = root.find("totals")
-        subtotal = totals.find("subtotal").text or "" if totals.find("subtotal") is not None else ""
-        tax = totals.find("tax").text or "" if totals.find("tax") is not None else ""
-        total = totals.find("total").text or "" if totals.find("total") is not None else ""
-        
-        # Extract payment info
-        payment_info = root.find("payment_info")
-        payment_method = payment_info.find("method").text or "" if payment_info.find("method") is not None else ""
-        amount_paid = payment_info.find("amount_paid").text or "" if payment_info.find("amount_paid") is not None else ""
-        change = payment_info.find("change").text or "" if payment_info.find("change") is not None else ""
-        
-        # Extract items and create CSV rows
-        items = root.find("items")
-        if items is not None:
-            for item in items.findall("item"):
-                item_name = item.find("n").text or "" if item.find("n") is not None else ""
-                item_category = item.find("category").text or "" if item.find("category") is not None else ""
-                item_subcategory = item.find("subcategory").text or "" if item.find("subcategory") is not None else ""
-                item_quantity = item.find("quantity").text or "" if item.find("quantity") is not None else ""
-                item_unit_price = item.find("unit_price").text or "" if item.find("unit_price") is not None else ""
-                item_total_price = item.find("total_price").text or "" if item.find("total_price") is not None else ""
-                
-                # Create CSV row
-                row = [store_name, store_address, store_phone,
-                       transaction_date, transaction_time, receipt_number,
-                       item_name, item_category, item_subcategory,
-                       item_quantity, item_unit_price, item_total_price,
-                       subtotal, tax, total,
-                       payment_method, amount_paid, change]
-                csv_lines.append(",".join(row))
-        else:
-            # If no items, create a row with store and transaction info only
-            row = [store_name, store_address, store_phone,
-                   transaction_date, transaction_time, receipt_number,
-                   "", "", "", "", "", "",
-                   subtotal, tax, total,
-                   payment_method, amount_paid, change]
-            csv_lines.append(",".join(row))
-        
-        return "\n".join(csv_lines)
-        
+        return Receipt.from_xml(xml_content).to_csv(typed)
     except ET.ParseError as e:
         raise ValueError(f"Failed to parse XML for CSV conversion: {e}") from e
     except Exception as e:
-        raise RuntimeError(f"Failed to convert XML to CSV: {e}") from e
\ No newline at end of file
+        raise RuntimeError(f"Failed to convert XML to CSV: {e}") from e
@@ -0,0 +1,188 @@
+"""Watch-folder ingestion for Harina v3."""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+from loguru import logger
+
+from .scan import IMAGE_EXTENSIONS, PathFilter, scan_images
+
+DEFAULT_SETTLE_SECONDS = 1.0
+DEFAULT_POLL_INTERVAL = 2.0
+
+# (size, mtime_ns) of a file as last seen
+Signature = Tuple[int, int]
+
+
+def _signature(path: str) -> Optional[Signature]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+class _Candidate:
+    """A new or changed file waiting to stop changing."""
+
+    __slots__ = ('first_seen', 'changed_at', 'signature', 'closed')
+
+    def __init__(self, now: float):
+        self.first_seen = now
+        self.changed_at = now
+        self.signature: Optional[Signature] = None
+        self.closed = False
+
+
+class FolderWatcher:
+    """Hands new receipt images in ``directory`` to ``on_ready`` once they are fully written.
+
+    Filesystem events come from ``watchdog`` (inotify on Linux) when it is
+    installed; otherwise, or with ``polling``, the tree is rescanned every
+    ``poll_interval`` seconds. A file is ready when the writer closed it or
+    renamed it into place, or when its size and mtime have not changed for
+    ``settle`` seconds, so partially written scans are never picked up.
+    ``on_ready`` receives the path and the time the file was first seen, and
+    is called again if a processed file is later rewritten.
+    """
+
+    def __init__(self, directory: Union[str, Path], on_ready: Callable[[Path, float], None],
+                 include: Iterable[str] = (), exclude: Iterable[str] = (),
+                 extensions: Iterable[str] = IMAGE_EXTENSIONS, settle: float = DEFAULT_SETTLE_SECONDS,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, polling: bool = False,
+                 process_existing: bool = False):
+        self.directory = Path(directory)
+        self.on_ready = on_ready
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.filter = PathFilter(self.directory, self.include, self.exclude, extensions)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.polling = polling
+        self.process_existing = process_existing
+        self._candidates: Dict[str, _Candidate] = {}
+        self._processed: Dict[str, Signature] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def notify(self, path: Union[str, Path], closed: bool = False) -> None:
+        """Record that ``path`` was created or modified; ``closed`` marks the write as finished."""
+        path = os.fspath(path)
+        if not self.filter.wants_file(path):
+            return
+        with self._lock:
+            candidate = self._candidates.get(path)
+            if candidate is None:
+                candidate = self._candidates[path] = _Candidate(time.monotonic())
+            else:
+                candidate.changed_at = time.monotonic()
+            # The latest event wins: a write after a close reopens the file
+            candidate.closed = closed
+
+    def _scan(self, initial: bool = False) -> None:
+        """Rescan the tree (polling mode, or the backlog at startup)."""
+        for path in scan_images(self.directory, self.include, self.exclude, self.filter.extensions):
+            path = os.fspath(path)
+            signature = _signature(path)
+            if signature is None:
+                continue
+            with self._lock:
+                if self._processed.get(path) == signature or path in self._candidates:
+                    continue
+                if initial and not self.process_existing:
+                    self._processed[path] = signature
+                    continue
+            # Files found at startup are complete; new ones may still be written
+            self.notify(path, closed=initial)
+
+    def check(self) -> None:
+        """Hand files that stopped changing to ``on_ready``."""
+        now = time.monotonic()
+        ready = []
+        with self._lock:
+            for path, candidate in list(self._candidates.items()):
+                signature = _signature(path)
+                if signature is None:
+                    # Deleted or renamed away before it settled
+                    del self._candidates[path]
+                    continue
+                if signature != candidate.signature:
+                    if candidate.signature is not None:
+                        candidate.changed_at = now
+                    candidate.signature = signature
+                stable = now - candidate.changed_at >= self.settle
+                if signature[0] > 0 and (candidate.closed or stable):
+                    if self._processed.get(path) != signature:
+                        ready.append((path, candidate.first_seen))
+                        self._processed[path] = signature
+                    del self._candidates[path]
+        for path, first_seen in ready:
+            try:
+                self.on_ready(Path(path), first_seen)
+            except Exception as e:
+                logger.error(f"❌ Failed to queue {path}: {e}")
+
+    def _start_observer(self):
+        """Start a watchdog observer, or return None when watchdog is unavailable."""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logger.info("🔁 watchdog is not installed, polling for new files "
+                        "(pip install 'harina-v3-cli[watch]' for inotify)")
+            return None
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path)
+
+            def on_moved(self, event):
+                # Writers that rename a finished temp file into place are done
+                if not event.is_directory:
+                    watcher.notify(event.dest_path, closed=True)
+
+            def on_closed(self, event):
+                if not event.is_directory:
+                    watcher.notify(event.src_path, closed=True)
+
+        observer = Observer()
+        try:
+            observer.schedule(Handler(), str(self.directory), recursive=True)
+            observer.start()
+        except OSError as e:
+            # e.g. inotify watch limit reached or an unsupported network filesystem
+            logger.warning(f"⚠️ Filesystem events unavailable ({e}), polling for new files")
+            return None
+        return observer
+
+    def stop(self) -> None:
+        """Stop :meth:`run`."""
+        self._stop.set()
+
+    def run(self) -> None:
+        """Watch until :meth:`stop` is called."""
+        observer = None if self.polling else self._start_observer()
+        self._scan(initial=True)
+        tick = min(0.25, self.settle / 4) if self.settle > 0 else 0.05
+        next_scan = time.monotonic() + self.poll_interval
+        try:
+            while not self._stop.is_set():
+                if observer is None and time.monotonic() >= next_scan:
+                    self._scan()
+                    next_scan = time.monotonic() + self.poll_interval
+                self.check()
+                self._stop.wait(tick)
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
@@ -0,0 +1,307 @@
+"""Durable job queue and worker loop for Harina v3."""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from loguru import logger
+
+from .batch import run_batch
+from .errors import ReceiptProcessingError
+
+QUEUE_FILENAME = '.harina-queue.sqlite3'
+PENDING, RUNNING, SUCCEEDED, FAILED = 'pending', 'running', 'succeeded', 'failed'
+STATUSES = (PENDING, RUNNING, SUCCEEDED, FAILED)
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_LEASE_SECONDS = 600.0
+
+
+def worker_id() -> str:
+    """Identify this process as ``host:pid``."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+@dataclass
+class Job:
+    """One receipt image waiting in (or taken from) the queue."""
+
+    id: int
+    source: str
+    attempts: int
+
+
+class JobQueue:
+    """SQLite-backed queue of receipt jobs with status, attempts and timings.
+
+    Every state change is committed before the next job is handed out, so the
+    queue survives crashes and restarts. A source is enqueued at most once:
+    adding it again never re-runs a receipt that already succeeded. Jobs are
+    leased to a worker while running and the worker renews the lease until the
+    job finishes; leases of crashed workers are recovered so those jobs run
+    again, and a worker that lost its lease cannot record a result.
+    """
+
+    def __init__(self, path: Union[str, Path], max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS):
+        """Open (or create) the queue database at ``path``."""
+        self.path = Path(path)
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        self.worker = worker_id()
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30,
+                                     isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                       id INTEGER PRIMARY KEY,
+                       source TEXT NOT NULL UNIQUE,
+                       status TEXT NOT NULL,
+                       attempts INTEGER NOT NULL DEFAULT 0,
+                       output TEXT,
+                       error TEXT,
+                       status_code INTEGER,
+                       worker TEXT,
+                       created_at REAL NOT NULL,
+                       available_at REAL NOT NULL,
+                       lease_expires REAL,
+                       started_at REAL,
+                       finished_at REAL,
+                       duration REAL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at)")
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front, so workers never interleave."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def enqueue(self, sources: Iterable[Union[str, Path]]) -> int:
+        """Add sources that are not queued yet, returning how many were added."""
+        now = time.time()
+        added = 0
+        with self._lock, self._transaction() as conn:
+            for source in sources:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (source, status, created_at, available_at) VALUES (?, ?, ?, ?)",
+                    (str(source), PENDING, now, now))
+                added += cursor.rowcount
+        return added
+
+    def recover(self) -> int:
+        """Return jobs of crashed workers to the queue, returning how many were recovered.
+
+        A running job is recovered when its lease expired, or when it belongs
+        to a process on this host that no longer exists.
+        """
+        now = time.time()
+        host = socket.gethostname()
+        with self._lock, self._transaction() as conn:
+            stale = []
+            for job_id, worker, lease_expires in conn.execute(
+                    "SELECT id, worker, lease_expires FROM jobs WHERE status = ?", (RUNNING,)):
+                worker_host, _, pid = (worker or '').rpartition(':')
+                dead = worker_host == host and pid.isdigit() and not _process_alive(int(pid))
+                if dead or (lease_expires or 0) < now:
+                    stale.append((job_id,))
+            conn.executemany("UPDATE jobs SET status = 'pending', worker = NULL, lease_expires = NULL "
+                             "WHERE id = ?", stale)
+        if stale:
+            logger.warning(f"♻️ Recovered {len(stale)} interrupted jobs")
+        return len(stale)
+
+    def claim(self) -> Optional[Job]:
+        """Lease the next available job to this worker, or return None."""
+        now = time.time()
+        with self._lock, self._transaction() as conn:
+            row = conn.execute(
+                "SELECT id, source, attempts FROM jobs WHERE status = ? AND available_at <= ? "
+                "ORDER BY available_at, id LIMIT 1", (PENDING, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, started_at = ?, "
+                "lease_expires = ? WHERE id = ?",
+                (RUNNING, self.worker, now, now + self.lease_seconds, row[0]))
+        return Job(id=row[0], source=row[1], attempts=row[2] + 1)
+
+    # Matches the job only while this worker still holds the lease from its claim
+    _LEASE_HELD = "id = ? AND status = 'running' AND worker = ? AND attempts = ?"
+
+    def renew(self, job: Job) -> bool:
+        """Extend ``job``'s lease; returns False when this worker no longer holds it."""
+        with self._lock, self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET lease_expires = ? WHERE {self._LEASE_HELD}",
+                (time.time() + self.lease_seconds, job.id, self.worker, job.attempts))
+        return cursor.rowcount == 1
+
+    def complete(self, job: Job, output: Optional[str] = None) -> bool:
+        """Mark ``job`` as succeeded; returns False when the lease was lost and nothing was recorded."""
+        now = time.time()
+        with self._lock, self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, output = ?, error = NULL, status_code = NULL, lease_expires = NULL, "
+                f"finished_at = ?, duration = ? - started_at WHERE {self._LEASE_HELD}",
+                (SUCCEEDED, output, now, now, job.id, self.worker, job.attempts))
+        return cursor.rowcount == 1
+
+    def fail(self, job: Job, error: ReceiptProcessingError, delay: float) -> bool:
+        """Record a failed attempt; returns True when the job was requeued after ``delay`` seconds.
+
+        Only retryable errors are requeued, and only until ``max_attempts``.
+        Nothing is recorded when this worker lost the lease.
+        """
+        now = time.time()
+        retry = error.retryable and job.attempts < self.max_attempts
+        with self._lock, self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, status_code = ?, lease_expires = NULL, available_at = ?, "
+                f"finished_at = ?, duration = ? - started_at WHERE {self._LEASE_HELD}",
+                (PENDING if retry else FAILED, str(error), error.status_code, now + delay, now, now,
+                 job.id, self.worker, job.attempts))
+        return retry and cursor.rowcount == 1
+
+    def retry_failed(self) -> int:
+        """Queue failed jobs again with a fresh attempt count."""
+        with self._lock, self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = 0, available_at = ? WHERE status = ?",
+                (PENDING, time.time(), FAILED))
+        return cursor.rowcount
+
+    def next_available_in(self) -> Optional[float]:
+        """Seconds until the next pending job becomes available, or None when nothing is pending."""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(available_at) FROM jobs WHERE status = ?", (PENDING,)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(rows)
+        return counts
+
+    def failures(self) -> List[Dict[str, object]]:
+        """Failed jobs with their last error."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, attempts, status_code, error FROM jobs WHERE status = ? ORDER BY id",
+                (FAILED,)).fetchall()
+        return [{'source': source, 'attempts': attempts, 'status_code': status_code, 'error': error}
+                for source, attempts, status_code, error in rows]
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+
+class Worker:
+    """Runs queued jobs through a handler with bounded concurrency.
+
+    ``handler`` receives a job's source and returns the output path (or any
+    string) to record. Failures are classified with
+    :meth:`ReceiptProcessingError.from_exception`; transient ones are retried
+    with exponential backoff, honoring ``Retry-After``.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[str], Optional[str]], concurrency: int = 1,
+                 base_delay: float = 30.0, max_delay: float = 600.0, poll_interval: float = 1.0):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Stop handing out jobs; running ones finish normally."""
+        self._stop.set()
+
+    def _available_jobs(self) -> Iterator[Job]:
+        """Claim jobs as slots free up until none is available right now."""
+        while not self._stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                return
+            yield job
+
+    @contextmanager
+    def _heartbeat(self, job: Job):
+        """Renew ``job``'s lease in the background while its handler runs."""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.queue.lease_seconds / 3):
+                if not self.queue.renew(job):
+                    logger.warning(f"⚠️ Lost the lease on {job.source}, another worker may run it again")
+                    return
+
+        thread = threading.Thread(target=beat, name="harina-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def _run(self, job: Job) -> Optional[str]:
+        try:
+            with self._heartbeat(job):
+                output = self.handler(job.source)
+        except Exception as e:
+            error = ReceiptProcessingError.from_exception(e)
+            error.attempts = job.attempts
+            delay = error.retry_after
+            if delay is None:
+                delay = min(self.max_delay, self.base_delay * 2 ** (job.attempts - 1))
+            if self.queue.fail(job, error, delay):
+                logger.warning(f"🔁 {job.source} failed (attempt {job.attempts}), retrying in {delay:.0f}s: {error}")
+            raise error
+        if not self.queue.complete(job, output):
+            logger.warning(f"⚠️ Lease on {job.source} expired before it finished, result not recorded")
+        return output
+
+    def run(self, follow: bool = False) -> Iterator:
+        """Process jobs, yielding ``(job, output, error)`` as each attempt finishes.
+
+        Returns once the queue is drained, after waiting for delayed retries;
+        with ``follow`` it keeps polling for new jobs until :meth:`stop`.
+        """
+        self.queue.recover()
+        while not self._stop.is_set():
+            yield from run_batch(self._available_jobs(), self._run, self.concurrency)
+            wait = self.queue.next_available_in()
+            if wait is None and not follow:
+                return
+            self._stop.wait(self.poll_interval if wait is None else min(wait, self.poll_interval))
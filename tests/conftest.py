@@ -0,0 +1,8 @@
+"""Shared helpers for the Harina v3 tests."""
+
+from types import SimpleNamespace
+
+
+def fake_response(text, **fields):
+    """A ``litellm.completion`` result whose message is ``text``; ``fields`` (e.g. ``usage``) are added as is."""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], **fields)
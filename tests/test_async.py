@@ -0,0 +1,150 @@
+"""Tests for the native async API of HarinaCore."""
+
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.core import HarinaCore
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGE_BYTES = (SAMPLE_DIR / "IMG_8923.jpg").read_bytes()
+RECEIPT_XML = (SAMPLE_DIR / "IMG_8923.xml").read_text(encoding="utf-8")
+
+
+def _fake_acompletion(delay=0.0, fail_on=None):
+    calls = {"count": 0}
+
+    async def acompletion(**kwargs):
+        calls["count"] += 1
+        if fail_on is not None and calls["count"] == fail_on:
+            raise ConnectionError("upstream failed")
+        await asyncio.sleep(delay)
+        return fake_response(RECEIPT_XML)
+
+    return acompletion
+
+
+def test_aprocess_many_runs_concurrently_and_keeps_order():
+    """Receipts should overlap on one event loop and come back in input order."""
+    ocr = HarinaCore()
+
+    async def main():
+        with mock.patch("harina.core.litellm.acompletion", _fake_acompletion(delay=0.2)):
+            start = time.perf_counter()
+            results = await ocr.aprocess_many([IMAGE_BYTES] * 8, output_format="csv", concurrency=8)
+            return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(main())
+
+    assert len(results) == 8
+    assert all(result.startswith("store_name,") for result in results)
+    assert elapsed < 1.0
+
+
+def test_aprocess_many_returns_exceptions_per_receipt():
+    """One failing receipt should not abort the rest of the batch."""
+    ocr = HarinaCore()
+
+    async def main():
+        with mock.patch("harina.core.litellm.acompletion", _fake_acompletion(fail_on=2)):
+            return await ocr.aprocess_many([IMAGE_BYTES] * 3, concurrency=1)
+
+    results = asyncio.run(main())
+
+    assert isinstance(results[1], RuntimeError)
+    assert results[0] == results[2]
+
+
+def test_aprocess_receipt_timeout():
+    """A slow API call should fail with a timeout instead of hanging."""
+    ocr = HarinaCore(timeout=0.05)
+
+    async def main():
+        with mock.patch("harina.core.litellm.acompletion", _fake_acompletion(delay=1.0)):
+            await ocr.aprocess_receipt(IMAGE_BYTES)
+
+    with pytest.raises(RuntimeError, match="timed out"):
+        asyncio.run(main())
+
+
+def test_aprocess_many_cancellation_cancels_in_flight_receipts():
+    """Cancelling the batch should cancel every in-flight API call."""
+    ocr = HarinaCore()
+    cancelled = []
+
+    async def acompletion(**kwargs):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        with mock.patch("harina.core.litellm.acompletion", acompletion):
+            batch = asyncio.ensure_future(ocr.aprocess_many([IMAGE_BYTES] * 4, concurrency=4))
+            await asyncio.sleep(0.2)
+            batch.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await batch
+
+    asyncio.run(main())
+    assert len(cancelled) == 4
+
+
+def test_cache_and_duplicate_lookups_run_off_the_event_loop(tmp_path):
+    """Image hashing and SQLite lookups and stores should not run on the event loop thread."""
+    from harina.cache import ResultCache
+    from harina.dedup import DuplicateIndex
+
+    threads = []
+    cache = ResultCache(tmp_path / "cache")
+    index = DuplicateIndex(tmp_path / "dedup.sqlite3")
+
+    def on_calling_thread(method):
+        def wrapper(*args):
+            threads.append(threading.get_ident())
+            return method(*args)
+        return wrapper
+
+    cache.get, cache.set = on_calling_thread(cache.get), on_calling_thread(cache.set)
+    ocr = HarinaCore(cache=cache, dedup=index)
+
+    async def main():
+        with mock.patch("harina.core.litellm.acompletion", _fake_acompletion()):
+            await ocr.aprocess_receipt(IMAGE_BYTES)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(main())
+    index.close()
+
+    assert len(threads) == 2
+    assert loop_thread not in threads
+
+
+def test_clients_from_a_finished_event_loop_are_closed():
+    """Switching event loops should close the pooled HTTP clients of the old one."""
+    from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+
+    ocr = HarinaCore(model_name="gemini/gemini-2.5-flash")
+    closed = []
+
+    async def close(self):
+        closed.append(self)
+
+    with mock.patch.object(AsyncHTTPHandler, "close", close):
+        first = asyncio.run(ocr._get_async_client(ocr.model_name))
+        second = asyncio.run(ocr._get_async_client(ocr.model_name))
+        assert first is not second
+        assert closed == [first]
+
+        asyncio.run(ocr.aclose())
+        assert closed == [first, second]
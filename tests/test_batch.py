@@ -0,0 +1,59 @@
+"""Tests for the concurrent batch engine."""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.batch import run_batch
+
+
+def test_run_batch_yields_in_completion_order():
+    """Results should be yielded as soon as each item finishes."""
+    delays = {"slow": 0.2, "fast": 0.01}
+
+    def worker(item):
+        time.sleep(delays[item])
+        return item.upper()
+
+    results = list(run_batch(["slow", "fast"], worker, concurrency=2))
+
+    assert [item for item, _, _ in results] == ["fast", "slow"]
+    assert [result for _, result, _ in results] == ["FAST", "SLOW"]
+
+
+def test_run_batch_isolates_errors():
+    """A failing item should not stop the remaining items."""
+    def worker(item):
+        if item == 2:
+            raise ValueError("boom")
+        return item * 10
+
+    results = {item: (result, error) for item, result, error in run_batch(range(4), worker, concurrency=3)}
+
+    assert results[0] == (0, None)
+    assert results[3] == (30, None)
+    assert isinstance(results[2][1], ValueError)
+
+
+def test_run_batch_bounds_in_flight_items():
+    """No more than ``concurrency`` items should run at the same time."""
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+
+    def worker(item):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.01)
+        with lock:
+            state["active"] -= 1
+        return item
+
+    results = list(run_batch(iter(range(20)), worker, concurrency=4))
+
+    assert len(results) == 20
+    assert state["peak"] <= 4
@@ -0,0 +1,59 @@
+"""Tests for multi-image batched prompts."""
+
+import sys
+from pathlib import Path
+from unittest import mock
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.core import HarinaCore
+from harina.utils import extract_receipts, format_xml
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGES = sorted(SAMPLE_DIR.glob("*.jpg"))[:3]
+
+
+def _receipt(store, index=None):
+    attr = f' index="{index}"' if index is not None else ""
+    return f"<receipt{attr}><store_info><n>{store}</n></store_info></receipt>"
+
+
+def test_extract_receipts_by_index_and_order():
+    """Receipts should be keyed by index attribute, or by order without one."""
+    text = f"```xml\n<receipts>{_receipt('B', 2)}{_receipt('A', 1)}</receipts>\n```"
+    receipts = extract_receipts(text)
+    assert sorted(receipts) == [1, 2]
+    assert "A" in receipts[1] and "index" not in receipts[1]
+
+    receipts = extract_receipts(f"<receipts>{_receipt('A')}{_receipt('B')}</receipts>")
+    assert "B" in receipts[2]
+
+
+def test_process_batch_uses_one_call_and_matches_single_output():
+    """A complete batched response should need exactly one API call."""
+    text = "<receipts>" + "".join(_receipt(f"store{i}", i) for i in range(1, 4)) + "</receipts>"
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(text)) as completion:
+        results = HarinaCore().process_batch(IMAGES)
+
+    assert completion.call_count == 1
+    content = completion.call_args.kwargs["messages"][0]["content"]
+    assert sum(part["type"] == "image_url" for part in content) == 3
+    assert results == [format_xml(_receipt(f"store{i}")) for i in range(1, 4)]
+
+
+def test_process_batch_retries_dropped_receipt_alone():
+    """A receipt missing from the batched response should be retried by itself."""
+    batched = f"<receipts>{_receipt('first', 1)}{_receipt('third', 3)}</receipts>"
+    responses = [fake_response(batched), fake_response(_receipt("second"))]
+
+    with mock.patch("harina.core.litellm.completion", side_effect=responses) as completion:
+        results = HarinaCore().process_batch(IMAGES)
+
+    assert completion.call_count == 2
+    retry_content = completion.call_args.kwargs["messages"][0]["content"]
+    assert sum(part["type"] == "image_url" for part in retry_content) == 1
+    assert "second" in results[1]
+    assert "third" in results[2]
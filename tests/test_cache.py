@@ -0,0 +1,70 @@
+"""Tests for the persistent result cache."""
+
+import sys
+import time
+from pathlib import Path
+from unittest import mock
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.cache import ResultCache
+from harina.core import HarinaCore
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+
+
+def test_make_key_depends_on_every_part():
+    """Changing the image, prompt or model must change the key."""
+    base = ResultCache.make_key(b"image", "prompt-hash", "model")
+
+    assert base == ResultCache.make_key(b"image", "prompt-hash", "model")
+    assert base != ResultCache.make_key(b"image2", "prompt-hash", "model")
+    assert base != ResultCache.make_key(b"image", "prompt-hash2", "model")
+    assert base != ResultCache.make_key(b"image", "prompt-hash", "model2")
+    assert base != ResultCache.make_key(b"imagep", "rompt-hash", "model")
+
+
+def test_get_set_and_age_eviction(tmp_path):
+    """Entries older than max_age_days should be dropped."""
+    cache = ResultCache(tmp_path, max_age_days=1)
+    cache.set("k", "<receipt/>")
+    assert cache.get("k") == "<receipt/>"
+
+    with mock.patch("harina.cache.time.time", return_value=time.time() + 2 * 86400):
+        assert cache.get("k") is None
+    assert cache.get("k") is None
+
+
+def test_size_eviction_drops_least_recently_used(tmp_path):
+    """Pruning should evict the least recently used entries first."""
+    cache = ResultCache(tmp_path, max_bytes=25)
+    cache.set("old", "x" * 10)
+    time.sleep(0.01)
+    cache.set("new", "y" * 10)
+    time.sleep(0.01)
+    cache.get("old")
+    cache.set("newest", "z" * 10)
+
+    assert cache.prune() == 1
+    assert cache.get("new") is None
+    assert cache.get("old") == "x" * 10
+
+
+def test_process_receipt_uses_cache(tmp_path):
+    """A second run of the same image should not call the API."""
+    xml = (SAMPLE_DIR / "IMG_8923.xml").read_text(encoding="utf-8")
+    image_path = SAMPLE_DIR / "IMG_8923.jpg"
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(xml)) as completion:
+        ocr = HarinaCore(cache=ResultCache(tmp_path))
+        first = ocr.process_receipt(image_path)
+        second = ocr.process_receipt(image_path)
+        assert completion.call_count == 1
+
+        refreshing = HarinaCore(cache=ResultCache(tmp_path), refresh_cache=True)
+        refreshing.process_receipt(image_path)
+        assert completion.call_count == 2
+
+    assert first == second
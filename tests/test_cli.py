@@ -0,0 +1,95 @@
+"""Tests for the batch CLI's handling of failed receipts across runs."""
+
+import shutil
+import sys
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from click.testing import CliRunner
+from loguru import logger
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.cli import DEAD_LETTER_FILENAME, cli
+from harina.export import AggregateWriter
+from harina.imaging import PreprocessOptions, prepare_image
+from harina.scheduler import DeadLetterQueue
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGES = sorted(SAMPLE_DIR.glob("*.jpg"))[:2]
+RECEIPT_XML = "<receipt><store_info><n>store</n></store_info></receipt>"
+
+
+@pytest.fixture
+def receipts(tmp_path):
+    """A directory with ``a.jpg`` and ``b.jpg`` and a completion where ``b.jpg`` fails."""
+    directory = tmp_path / "dl"
+    directory.mkdir()
+    for name, image in zip(("a.jpg", "b.jpg"), IMAGES):
+        shutil.copy(image, directory / name)
+    # The samples carry EXIF, so they are uploaded re-encoded with the default options
+    broken = {prepare_image(directory / "b.jpg", PreprocessOptions()).to_base64()}
+
+    def completion(model, messages, **kwargs):
+        url = messages[0]["content"][1]["image_url"]["url"]
+        if url.split(",", 1)[1] in broken:
+            raise ValueError("backend rejected the image")
+        return fake_response(RECEIPT_XML)
+
+    with mock.patch("harina.core.litellm.completion", side_effect=completion):
+        yield directory, broken
+    # The CLI points loguru at the runner's stream, which is closed by now
+    logger.remove()
+
+
+def _run(*args):
+    return CliRunner().invoke(cli, [*map(str, args), "--no-cache", "--max-retries", "0"])
+
+
+def _dead_letters(directory):
+    return [Path(source).name for source in DeadLetterQueue.read_sources(directory / DEAD_LETTER_FILENAME)]
+
+
+def test_single_file_run_keeps_other_dead_letters(receipts):
+    """A successful single-file run should not drop failures recorded by a directory run."""
+    directory, _ = receipts
+    _run(directory)
+    assert _dead_letters(directory) == ["b.jpg"]
+
+    assert _run(directory / "a.jpg").exit_code == 0
+    assert _dead_letters(directory) == ["b.jpg"]
+
+
+def test_subset_run_resolves_only_what_it_retried(receipts):
+    """A run over a subset should keep earlier failures outside it and drop the ones it fixed."""
+    directory, broken = receipts
+    _run(directory)
+
+    _run(directory, "--include", "a.jpg")
+    assert _dead_letters(directory) == ["b.jpg"]
+
+    broken.clear()
+    _run(directory, "--include", "b.jpg")
+    assert not (directory / DEAD_LETTER_FILENAME).exists()
+
+
+def test_incremental_aggregate_run_redoes_receipts_lost_in_a_crash(receipts, tmp_path):
+    """Receipts whose aggregate rows were never flushed must not be marked up to date."""
+    directory, broken = receipts
+    broken.clear()
+    aggregate = tmp_path / "all.csv"
+
+    def crash(writer):
+        # Die without flushing the buffered rows
+        writer._file.close()
+
+    with mock.patch("harina.cli.AggregateWriter.close", crash):
+        _run(directory, "--aggregate", aggregate, "--incremental")
+    assert "a.jpg" not in aggregate.read_text(encoding="utf-8")
+
+    assert _run(directory, "--aggregate", aggregate, "--incremental").exit_code == 0
+    with AggregateWriter(aggregate) as writer:
+        assert sorted(Path(source).name for source in writer.completed) == ["a.jpg", "b.jpg"]
@@ -0,0 +1,99 @@
+"""Tests for perceptual-hash duplicate receipt detection."""
+
+import io
+import random
+import sys
+from itertools import combinations
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from PIL import Image
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.core import HarinaCore
+from harina.dedup import DEFAULT_MAX_DISTANCE, DuplicateIndex, DuplicateReceiptError, MultiIndexHash, hamming, image_dhash
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGES = sorted(SAMPLE_DIR.glob("*.jpg"))[:2]
+RECEIPT_XML = "<receipt><store_info><n>store</n></store_info></receipt>"
+
+
+def _jpeg(image, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", **kwargs)
+    return buffer.getvalue()
+
+
+def test_resized_and_recompressed_copies_hash_close():
+    """A resized, recompressed copy should be near; different receipts should not."""
+    original = Image.open(IMAGES[0]).convert("RGB")
+    copy = original.resize((original.width // 3, original.height // 3))
+    assert hamming(image_dhash(IMAGES[0].read_bytes()), image_dhash(_jpeg(copy, quality=40))) <= DEFAULT_MAX_DISTANCE
+
+    # Every sample is a white receipt on a dark table, so only the paper content may tell them apart
+    hashes = [image_dhash(path.read_bytes()) for path in sorted(SAMPLE_DIR.glob("*.jpg"))]
+    assert min(hamming(a, b) for a, b in combinations(hashes, 2)) > DEFAULT_MAX_DISTANCE
+
+
+def test_multi_index_search_matches_brute_force():
+    """Every hash within the distance, and only those, should be found."""
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    # Plant near neighbours of the first hash at every distance up to 7
+    for distance in range(8):
+        bits = rng.sample(range(64), distance)
+        hashes.append(hashes[0] ^ sum(1 << bit for bit in bits))
+    for max_distance in (0, 3, 5, 8):
+        index = MultiIndexHash(max_distance)
+        for entry_id, value in enumerate(hashes):
+            index.add(entry_id, value)
+        expected = sorted((hamming(hashes[0], value), entry_id) for entry_id, value in enumerate(hashes)
+                          if hamming(hashes[0], value) <= max_distance)
+        assert index.search(hashes[0]) == expected
+
+
+def test_duplicates_reuse_the_earlier_result_across_runs(tmp_path):
+    """A re-sent receipt should reuse the stored result without another API call."""
+    copy = tmp_path / "copy.jpg"
+    original = Image.open(IMAGES[0]).convert("RGB")
+    copy.write_bytes(_jpeg(original.resize((original.width // 2, original.height // 2)), quality=60))
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(RECEIPT_XML)) as completion:
+        index = DuplicateIndex(tmp_path / "dedup.sqlite3")
+        HarinaCore(dedup=index).process_receipt(IMAGES[0])
+        index.close()
+
+        reopened = DuplicateIndex(tmp_path / "dedup.sqlite3")
+        assert len(reopened) == 1
+        assert "store" in HarinaCore(dedup=reopened).process_receipt(copy)
+        with pytest.raises(DuplicateReceiptError, match=IMAGES[0].name):
+            HarinaCore(dedup=reopened, reuse_duplicates=False).process_receipt(copy)
+        # Another model or prompt never reuses the stored result
+        HarinaCore("gpt-4o-mini", dedup=reopened).process_receipt(copy)
+
+    assert completion.call_count == 2
+
+
+def test_reprocessing_a_file_is_not_a_duplicate_of_itself(tmp_path):
+    """A rerun should call the API again and update, not add to, the file's entry."""
+    image = tmp_path / "receipt.jpg"
+    image.write_bytes(IMAGES[0].read_bytes())
+    index = DuplicateIndex(tmp_path / "dedup.sqlite3")
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(RECEIPT_XML)) as completion:
+        for _ in range(3):
+            HarinaCore(dedup=index, reuse_duplicates=False).process_receipt(image)
+
+    assert completion.call_count == 3
+    assert len(index) == 1
+    # The entry follows the file when its content changes
+    image.write_bytes(IMAGES[1].read_bytes())
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(RECEIPT_XML)):
+        HarinaCore(dedup=index).process_receipt(image)
+    assert len(index) == 1
+    assert index.find(image_dhash(IMAGES[0].read_bytes()), HarinaCore()._dedup_scope) is None
+    index.close()
@@ -0,0 +1,116 @@
+"""Tests for aggregated multi-receipt export."""
+
+import csv
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.export import AGGREGATE_COLUMNS, AggregateWriter
+from harina.models import Receipt
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+RECEIPT = Receipt.from_xml((SAMPLE_DIR / "IMG_8923.xml").read_text(encoding="utf-8"))
+QUOTED = Receipt.from_xml('<receipt><store_info><n>A, "B" 店\n2F</n></store_info></receipt>')
+
+
+def test_csv_rows_carry_source_and_metadata(tmp_path):
+    """Every item row should be prefixed with source, model and timestamp and survive quoting."""
+    path = tmp_path / "receipts.csv"
+    with AggregateWriter(path) as writer:
+        writer.add("a.jpg", RECEIPT, "model-a")
+        writer.add("b.jpg", QUOTED, "model-b")
+
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == AGGREGATE_COLUMNS
+    assert len(rows) == 1 + len(RECEIPT.items) + 1
+    assert rows[1][:2] == ["a.jpg", "model-a"] and rows[1][3] == RECEIPT.store_name
+    assert rows[-1][:2] == ["b.jpg", "model-b"] and rows[-1][3] == 'A, "B" 店\n2F'
+
+
+def test_rows_are_buffered_until_flush_every(tmp_path):
+    """Nothing should reach disk before a full batch."""
+    path = tmp_path / "receipts.jsonl"
+    writer = AggregateWriter(path, flush_every=2)
+    writer.add("a.jpg", RECEIPT, "model")
+    assert path.read_text(encoding="utf-8") == ""
+    writer.add("b.jpg", RECEIPT, "model")
+    lines = path.read_text(encoding="utf-8").splitlines()
+    writer.close()
+
+    assert [json.loads(line)["source_file"] for line in lines] == ["a.jpg", "b.jpg"]
+    assert json.loads(lines[0])["receipt"]["items"][0]["name"] == RECEIPT.items[0].name
+
+
+def test_csv_resume_drops_torn_receipt(tmp_path):
+    """A receipt cut off mid-write should be removed and reported as not completed."""
+    path = tmp_path / "receipts.csv"
+    with AggregateWriter(path) as writer:
+        writer.add("a.jpg", RECEIPT, "model")
+        writer.add("b.jpg", RECEIPT, "model")
+    data = path.read_bytes()
+    path.write_bytes(data[:-40])
+
+    with AggregateWriter(path) as writer:
+        assert writer.completed == {"a.jpg"}
+        writer.add("b.jpg", RECEIPT, "model")
+
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == AGGREGATE_COLUMNS
+    assert [row[0] for row in rows[1:]] == ["a.jpg"] * len(RECEIPT.items) + ["b.jpg"] * len(RECEIPT.items)
+
+
+def test_jsonl_resume_truncates_partial_line(tmp_path):
+    """A partial trailing JSON line should be cut before appending."""
+    path = tmp_path / "receipts.jsonl"
+    with AggregateWriter(path) as writer:
+        writer.add("a.jpg", RECEIPT, "model")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"source_file": "b.jpg", "rec')
+
+    with AggregateWriter(path) as writer:
+        assert writer.completed == {"a.jpg"}
+        writer.add("b.jpg", QUOTED, "model")
+
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [record["source_file"] for record in records] == ["a.jpg", "b.jpg"]
+
+
+def test_parquet_copy_has_one_row_per_item(tmp_path):
+    """The Parquet file should hold the same item rows as the CSV export."""
+    pq = pytest.importorskip("pyarrow.parquet")
+    with AggregateWriter(tmp_path / "receipts.jsonl", parquet_path=tmp_path / "receipts.parquet") as writer:
+        writer.add("a.jpg", RECEIPT, "model")
+        writer.add("b.jpg", QUOTED, "model")
+
+    table = pq.read_table(tmp_path / "receipts.parquet")
+    assert table.column_names == AGGREGATE_COLUMNS
+    assert table.num_rows == len(RECEIPT.items) + 1
+
+
+def test_resume_cuts_rows_past_the_last_committed_flush(tmp_path):
+    """Rows written after the last complete flush should be dropped even when cut at a line boundary."""
+    path = tmp_path / "receipts.csv"
+    with AggregateWriter(path) as writer:
+        writer.add("a.jpg", RECEIPT, "model")
+    committed = path.read_bytes()
+    # A crash after the first of b.jpg's item rows reached the disk
+    with AggregateWriter(tmp_path / "scratch.csv") as scratch:
+        scratch.add("b.jpg", RECEIPT, "model")
+    first_row = (tmp_path / "scratch.csv").read_bytes().splitlines(keepends=True)[1]
+    path.write_bytes(committed + first_row)
+
+    with AggregateWriter(path) as writer:
+        assert writer.completed == {"a.jpg"}
+        assert path.read_bytes() == committed
+        writer.add("b.jpg", RECEIPT, "model")
+
+    with open(path, encoding="utf-8", newline="") as f:
+        sources = [row[0] for row in list(csv.reader(f))[1:]]
+    assert sources == ["a.jpg"] * len(RECEIPT.items) + ["b.jpg"] * len(RECEIPT.items)
@@ -0,0 +1,63 @@
+"""Tests that the single-pass XML formatter matches the minidom round trip."""
+
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.utils import format_xml, format_xml_minidom
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+
+EDGE_CASES = [
+    "<receipt><store_info><n>A &amp; B &lt;本店&gt; \"quoted\"</n></store_info></receipt>",
+    "<receipt><items/><totals><total></total></totals></receipt>",
+    "<receipt>\n  <n>line one\nline two\n  <b>x</b> trailing</n>\n</receipt>",
+    "<receipt>mixed <b>bold</b> tail<c/>more</receipt>",
+    '<receipt index="1" note="a &quot;b&quot; &amp; c&#10;d&#9;e&#13;"><n a="&lt;&gt;"/></receipt>',
+    "<receipt><n>carriage&#13;return&#13;&#10;pair</n></receipt>",
+    "<receipt><n>   </n><m>\t</m></receipt>",
+    "<receipt><!-- comment --><n>x</n><?pi data?></receipt>",
+    '<receipt xmlns="urn:harina"><n>namespaced</n></receipt>',
+    '<r:receipt xmlns:r="urn:harina" r:id="1"><r:n>prefixed</r:n></r:receipt>',
+    "<receipt><n>unclosed</receipt>",
+    "not xml at all",
+    "Here is the result: <receipt><n>x</n></receipt> trailing",
+]
+
+
+@pytest.mark.parametrize("path", sorted(SAMPLE_DIR.glob("*.xml")), ids=lambda p: p.name)
+def test_matches_minidom_on_samples(path):
+    """Sample receipts should format byte-identically."""
+    xml_content = path.read_text(encoding="utf-8")
+    assert format_xml(xml_content) == format_xml_minidom(xml_content)
+
+
+@pytest.mark.parametrize("xml_content", EDGE_CASES)
+def test_matches_minidom_on_edge_cases(xml_content):
+    """Escaping, mixed content, empty elements and fallbacks should match."""
+    assert format_xml(xml_content) == format_xml_minidom(xml_content)
+
+
+def test_matches_minidom_on_random_trees():
+    """Randomly generated trees with awkward text should match."""
+    rng = random.Random(0)
+    pieces = ["", " ", "\n", "  \n  ", "text", "a&amp;b", "&lt;x&gt;", "\"q\"", "日本語", "\t", "&#13;",
+              "one\ntwo\nthree", "&#10;x&#10;y&#10;"]
+
+    def element(depth):
+        tag = rng.choice(["n", "item", "price", "x"])
+        attrs = "".join(f' a{i}="{rng.choice(pieces)}"' for i in range(rng.randint(0, 2)))
+        body = rng.choice(pieces)
+        if depth < 3:
+            for _ in range(rng.randint(0, 3)):
+                body += element(depth + 1) + rng.choice(pieces)
+        return f"<{tag}{attrs}>{body}</{tag}>"
+
+    for _ in range(300):
+        xml_content = element(0)
+        assert format_xml(xml_content) == format_xml_minidom(xml_content), xml_content
@@ -0,0 +1,147 @@
+"""Tests for the image preprocessing pipeline."""
+
+import base64
+import io
+import sys
+from pathlib import Path
+
+import pytest
+from PIL import Image, ImageDraw
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.imaging import (
+    EXIF_ORIENTATION,
+    PreprocessOptions,
+    auto_crop_paper,
+    encode_image,
+    load_image,
+    prepare_image,
+    preprocess_image,
+)
+from harina.utils import image_to_base64
+
+
+def _receipt_photo(size=(1200, 1600)):
+    """Create a synthetic photo of white paper on a dark table."""
+    image = Image.new("RGB", size, (40, 35, 30))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((300, 200, 900, 1400), fill=(245, 245, 240))
+    for y in range(260, 1350, 60):
+        draw.rectangle((350, y, 850, y + 12), fill=(20, 20, 20))
+    return image
+
+
+def test_default_options_match_legacy_encoding():
+    """Default preprocessing must produce the same payload as image_to_base64."""
+    image = _receipt_photo((400, 300)).convert("RGBA")
+    options = PreprocessOptions()
+
+    encoded = encode_image(preprocess_image(image, options), options)
+
+    assert encoded.to_base64() == image_to_base64(image)
+    assert encoded.mime_type == "image/jpeg"
+    assert encoded.to_data_url().startswith("data:image/jpeg;base64,")
+
+
+def test_max_edge_and_grayscale():
+    """The long edge should be capped and the mode converted to grayscale."""
+    image = _receipt_photo()
+    options = PreprocessOptions(max_edge=800, grayscale=True)
+
+    processed = preprocess_image(image, options)
+
+    assert processed.size == (600, 800)
+    assert processed.mode == "L"
+    assert image.size == (1200, 1600)
+
+
+@pytest.mark.parametrize("fmt,mime", [("webp", "image/webp"), ("png", "image/png")])
+def test_alternative_formats(fmt, mime):
+    """WebP and PNG encoding should report the matching MIME type."""
+    options = PreprocessOptions(format=fmt, max_edge=200)
+    encoded = encode_image(preprocess_image(_receipt_photo(), options), options)
+
+    assert encoded.mime_type == mime
+    assert max(encoded.width, encoded.height) == 200
+    assert Image.open(io.BytesIO(encoded.data)).format == options.format.upper()
+    assert base64.b64decode(encoded.to_base64()) == encoded.data
+
+
+def test_auto_crop_finds_paper_region():
+    """Auto-crop should keep the paper and drop most of the background."""
+    cropped = auto_crop_paper(_receipt_photo())
+
+    assert 600 <= cropped.width <= 700
+    assert 1200 <= cropped.height <= 1300
+
+
+def test_invalid_options_are_rejected():
+    """Unknown formats and out-of-range values should raise ValueError."""
+    with pytest.raises(ValueError):
+        PreprocessOptions(format="gif")
+    with pytest.raises(ValueError):
+        PreprocessOptions(quality=0)
+
+
+def _jpeg_bytes(image, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95, **kwargs)
+    return buffer.getvalue()
+
+
+def test_prepare_image_passes_acceptable_jpeg_through():
+    """A JPEG that needs no changes should be uploaded byte-for-byte."""
+    data = _jpeg_bytes(_receipt_photo((600, 800)))
+
+    encoded = prepare_image(data, PreprocessOptions(max_edge=1000))
+
+    assert encoded.passthrough
+    assert encoded.data == data
+    assert not prepare_image(data, PreprocessOptions(passthrough=False)).passthrough
+
+
+def test_prepare_image_reencodes_jpegs_with_metadata_or_over_the_size_cap():
+    """EXIF such as GPS must not reach the provider, and large files are not passed through."""
+    exif = Image.Exif()
+    exif.get_ifd(0x8825)[2] = (35.0, 41.0, 0.0)  # GPSLatitude
+    data = _jpeg_bytes(_receipt_photo((600, 800)), exif=exif.tobytes())
+
+    encoded = prepare_image(data, PreprocessOptions())
+    assert not encoded.passthrough
+    assert not Image.open(io.BytesIO(encoded.data)).getexif()
+
+    plain = _jpeg_bytes(_receipt_photo((600, 800)))
+    assert not prepare_image(plain, PreprocessOptions(passthrough_max_bytes=len(plain) - 1)).passthrough
+    assert prepare_image(plain, PreprocessOptions(passthrough_max_bytes=len(plain))).passthrough
+
+
+def test_prepare_image_uses_draft_decoding_and_exif_orientation():
+    """Large JPEGs are draft-decoded and rotated according to EXIF."""
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6  # Rotated 90 degrees clockwise
+    data = _jpeg_bytes(_receipt_photo((1600, 1200)), exif=exif.tobytes())
+
+    image = Image.open(io.BytesIO(data))
+    decoded = load_image(image, PreprocessOptions(max_edge=400))
+    assert decoded.size == (300, 400)  # Draft-decoded at 1/4 scale, then transposed
+
+    encoded = prepare_image(data, PreprocessOptions(max_edge=400))
+    assert not encoded.passthrough
+    assert (encoded.width, encoded.height) == (300, 400)
+
+
+def test_prepare_image_accepts_in_memory_sources():
+    """Bytes, file-like objects and PIL images should all be accepted."""
+    photo = _receipt_photo((300, 400))
+    data = _jpeg_bytes(photo)
+    options = PreprocessOptions()
+
+    from_bytes = prepare_image(bytearray(data), options)
+    from_file = prepare_image(io.BytesIO(data), options)
+    from_image = prepare_image(photo, options)
+
+    assert from_bytes.data == from_file.data == data
+    assert not from_image.passthrough
+    assert (from_image.width, from_image.height) == (300, 400)
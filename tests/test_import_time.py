@@ -0,0 +1,40 @@
+"""Import-time budget for the CLI, measured with ``python -X importtime``."""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+# Cumulative microseconds allowed for ``import harina.cli``; litellm alone takes seconds
+BUDGET_US = int(os.getenv("HARINA_IMPORT_BUDGET_MS", "1000")) * 1000
+
+
+def _importtime(*args):
+    """Return ``{module: cumulative_us}`` from running Python with ``-X importtime``."""
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT), LITELLM_LOCAL_MODEL_COST_MAP="True")
+    result = subprocess.run([sys.executable, "-X", "importtime", *args], cwd=PROJECT_ROOT, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+def test_cli_import_stays_within_budget():
+    """Importing the CLI should not load litellm and should stay within the budget."""
+    modules = _importtime("-c", "import harina.cli")
+    assert "litellm" not in modules
+    assert modules["harina.cli"] < BUDGET_US, f"import harina.cli took {modules['harina.cli'] / 1000:.0f} ms"
+
+
+def test_help_does_not_import_litellm():
+    """``harina --help`` should answer without loading the LLM client."""
+    modules = _importtime("-m", "harina.cli", "--help")
+    assert "harina.core" in modules
+    assert "litellm" not in modules
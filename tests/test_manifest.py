@@ -0,0 +1,85 @@
+"""Tests for the incremental processing manifest."""
+
+import os
+import sys
+from pathlib import Path
+from unittest import mock
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.imaging import PreprocessOptions
+from harina.manifest import Manifest
+
+
+def _make_receipt(tmp_path):
+    image_file = tmp_path / "receipt.jpg"
+    image_file.write_bytes(b"fake image bytes")
+    output_file = tmp_path / "receipt.xml"
+    output_file.write_text("<receipt/>", encoding="utf-8")
+    return image_file, output_file
+
+
+def test_recorded_receipt_is_up_to_date_after_reload(tmp_path):
+    """A recorded receipt should be skipped by a fresh manifest instance."""
+    image_file, output_file = _make_receipt(tmp_path)
+    manifest = Manifest(tmp_path / "manifest.json")
+    assert not manifest.is_up_to_date(image_file, output_file, "model", "xml")
+
+    manifest.record(image_file, output_file, "model", "xml")
+    manifest.save()
+
+    reloaded = Manifest(tmp_path / "manifest.json")
+    assert reloaded.is_up_to_date(image_file, output_file, "model", "xml")
+    assert not reloaded.is_up_to_date(image_file, output_file, "other-model", "xml")
+    assert not reloaded.is_up_to_date(image_file, output_file, "model", "csv")
+
+
+def test_touched_but_unchanged_file_is_not_reprocessed(tmp_path):
+    """Only the content hash should decide when just the mtime moved."""
+    image_file, output_file = _make_receipt(tmp_path)
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.record(image_file, output_file, "model", "xml")
+
+    stat = os.stat(image_file)
+    os.utime(image_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert manifest.is_up_to_date(image_file, output_file, "model", "xml")
+
+    image_file.write_bytes(b"fake image BYTES")
+    assert not manifest.is_up_to_date(image_file, output_file, "model", "xml")
+
+
+def test_missing_output_triggers_reprocessing(tmp_path):
+    """Deleting the output should make the receipt pending again."""
+    image_file, output_file = _make_receipt(tmp_path)
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.record(image_file, output_file, "model", "xml")
+
+    output_file.unlink()
+    assert not manifest.is_up_to_date(image_file, output_file, "model", "xml")
+
+
+def test_unchanged_file_is_skipped_without_hashing(tmp_path):
+    """Untouched inputs should be decided from ``stat`` alone."""
+    image_file, output_file = _make_receipt(tmp_path)
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.record(image_file, output_file, "model", "xml")
+
+    with mock.patch("harina.manifest.file_sha256") as file_sha256:
+        assert manifest.is_up_to_date(image_file, output_file, "model", "xml")
+    file_sha256.assert_not_called()
+
+
+def test_changed_prompt_or_preprocessing_is_not_up_to_date(tmp_path):
+    """A different prompt or preprocessing options should reprocess the receipt."""
+    image_file, output_file = _make_receipt(tmp_path)
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.record(image_file, output_file, "model", "xml", "prompt-a", PreprocessOptions(max_edge=1600))
+    manifest.save()
+
+    reloaded = Manifest(tmp_path / "manifest.json")
+    options = PreprocessOptions(max_edge=1600)
+    assert reloaded.is_up_to_date(image_file, output_file, "model", "xml", "prompt-a", options)
+    assert not reloaded.is_up_to_date(image_file, output_file, "model", "xml", "prompt-b", options)
+    grayscale = PreprocessOptions(max_edge=1600, grayscale=True)
+    assert not reloaded.is_up_to_date(image_file, output_file, "model", "xml", "prompt-a", grayscale)
@@ -0,0 +1,80 @@
+"""Tests for per-receipt timing, token and cost metrics."""
+
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.core import HarinaCore
+from harina.metrics import MetricsCollector, ReceiptMetrics, jsonl_sink
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGES = sorted(SAMPLE_DIR.glob("*.jpg"))[:2]
+MODEL = "gemini/gemini-2.5-flash"
+USAGE = SimpleNamespace(prompt_tokens=1000, completion_tokens=200)
+
+
+def _receipt(store, index=None):
+    attr = f' index="{index}"' if index is not None else ""
+    return f"<receipt{attr}><store_info><n>{store}</n></store_info></receipt>"
+
+
+def test_process_receipt_records_stages_tokens_and_cost(tmp_path):
+    """Every receipt should report its stage timings, payload size, usage and cost."""
+    metrics_file = tmp_path / "metrics.jsonl"
+    collector = MetricsCollector(jsonl_sink(metrics_file))
+    ocr = HarinaCore(MODEL, metrics=collector)
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(_receipt("store"), usage=USAGE)):
+        ocr.process_receipt(IMAGES[0])
+
+    [record] = [json.loads(line) for line in metrics_file.read_text(encoding="utf-8").splitlines()]
+    assert record["source"] == str(IMAGES[0])
+    assert set(record["stages"]) == {"prepare", "api", "parse", "total"}
+    assert record["stages"]["total"] >= record["stages"]["api"]
+    assert record["request_bytes"] > record["image_bytes"] > 0
+    assert (record["prompt_tokens"], record["completion_tokens"]) == (1000, 200)
+    assert record["cost"] > 0
+    assert record["succeeded"] and not record["cached"]
+
+
+def test_batched_usage_is_shared_between_receipts():
+    """Receipts from one batched request should each carry their share of its usage."""
+    collector = MetricsCollector()
+    text = "<receipts>" + "".join(_receipt(f"store{i}", i) for i in range(1, 3)) + "</receipts>"
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(text, usage=SimpleNamespace(prompt_tokens=3000, completion_tokens=800))):
+        HarinaCore(MODEL, metrics=collector).process_batch(IMAGES)
+
+    assert collector.count == 2
+    assert collector.tokens[(MODEL, "prompt")] == 3000
+    assert collector.tokens[(MODEL, "completion")] == 800
+    assert collector.stage_counts["api"] == 2
+
+
+def test_failures_are_recorded_and_exported():
+    """Failed receipts should be counted and show up in the Prometheus text and summary."""
+    collector = MetricsCollector()
+    ocr = HarinaCore(MODEL, metrics=collector)
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response("no xml here", usage=USAGE)):
+        try:
+            ocr.process_receipt(IMAGES[0])
+        except Exception:
+            pass
+    collector.record(ReceiptMetrics(model=MODEL, cached=True, stages={"prepare": 0.01, "total": 0.02}))
+
+    text = collector.to_prometheus()
+    assert f'harina_receipts_total{{model="{MODEL}",status="error",cached="false"}} 1' in text
+    assert f'harina_receipts_total{{model="{MODEL}",status="success",cached="true"}} 1' in text
+    assert 'harina_receipt_seconds_bucket{le="+Inf"} 2' in text
+    assert f'harina_tokens_total{{model="{MODEL}",type="prompt"}} 1000' in text
+
+    summary = collector.summary()
+    assert summary.splitlines()[0].split()[:2] == ["stage", "count"]
+    assert "receipts: 2 (cached 1, failed 1)" in summary
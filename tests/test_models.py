@@ -0,0 +1,107 @@
+"""Tests for the structured Receipt model."""
+
+import csv
+import io
+import json
+import sys
+from pathlib import Path
+from unittest import mock
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.core import HarinaCore
+from harina.models import CSV_HEADER, Receipt, to_number, write_csv
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGE_BYTES = (SAMPLE_DIR / "IMG_8923.jpg").read_bytes()
+RECEIPT_XML = (SAMPLE_DIR / "IMG_8923.xml").read_text(encoding="utf-8")
+
+
+def test_receipt_fields_and_csv_rows():
+    """The model should expose the template fields and render one CSV row per item."""
+    receipt = Receipt.from_xml(RECEIPT_XML)
+
+    assert receipt.store_name == "551 HORAI 新大阪中央口店"
+    assert receipt.items[0].name == "豚まん"
+    assert receipt.items[0].total_price == "1380"
+    lines = receipt.to_csv().split("\n")
+    assert lines[0] == ",".join(CSV_HEADER)
+    assert len(lines) == len(receipt.items) + 1
+    assert lines[1].startswith("551 HORAI 新大阪中央口店,大阪市淀川区西中島 5-16-1,")
+    assert not hasattr(receipt, "__dict__")
+
+
+def test_receipt_tolerates_missing_sections():
+    """Missing sections should render as empty values instead of failing."""
+    receipt = Receipt.from_xml("<receipt><store_info><n>店</n></store_info></receipt>")
+
+    rows = receipt.csv_rows()
+    assert len(rows) == 1 and len(rows[0]) == len(CSV_HEADER)
+    assert rows[0][0] == "店"
+    assert receipt.to_dict()["totals"] == {"subtotal": "", "tax": "", "total": ""}
+
+
+def test_csv_quotes_commas_quotes_and_newlines():
+    """Text with delimiters should be quoted so the columns never shift."""
+    receipt = Receipt.from_xml('<receipt><store_info><n>A, "B"</n><address>1F\n2F</address></store_info>'
+                               '<totals><total>1,380</total></totals></receipt>')
+
+    rows = list(csv.reader(io.StringIO(receipt.to_csv())))
+    assert rows[1][:2] == ['A, "B"', "1F\n2F"]
+    assert rows[1][CSV_HEADER.index("total")] == "1,380"
+
+    typed = receipt.to_csv(typed=True)
+    assert '"A, ""B""",' in typed and ",1380," in typed
+    rows = list(csv.reader(io.StringIO(typed), quoting=csv.QUOTE_NONNUMERIC))
+    assert rows[1][CSV_HEADER.index("total")] == 1380
+
+
+def test_to_number_parses_plain_amounts_only():
+    """Amounts with separators or currency become numbers; anything else stays text."""
+    assert to_number("1,380") == 1380
+    assert to_number("¥165") == 165
+    assert to_number("-50") == -50
+    assert to_number("1.5") == 1.5
+    assert to_number("") == ""
+    assert to_number("2個") == "2個"
+
+
+def test_write_csv_streams_receipts_lazily():
+    """Receipts should be consumed one at a time while rows are written."""
+    receipt = Receipt.from_xml(RECEIPT_XML)
+    consumed = []
+
+    def receipts():
+        for index in range(1000):
+            consumed.append(index)
+            yield receipt
+
+    class Sink:
+        def __init__(self):
+            self.rows = 0
+
+        def write(self, text):
+            # The generator must not have run ahead of the rows written so far
+            assert len(consumed) <= self.rows // len(receipt.items) + 1
+            self.rows += 1
+
+    sink = Sink()
+    assert write_csv(receipts(), sink) == 1000 * len(receipt.items)
+    assert sink.rows == 1000 * len(receipt.items) + 1
+
+
+def test_process_receipt_renders_every_format_from_one_response():
+    """XML, CSV, JSON and the Receipt itself should come from the same parse."""
+    ocr = HarinaCore()
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(RECEIPT_XML)), \
+            mock.patch.object(Receipt, "from_xml") as reparse:
+        receipt = ocr.process_receipt(IMAGE_BYTES, "receipt")
+        as_json = ocr.process_receipt(IMAGE_BYTES, "json")
+
+    reparse.assert_not_called()
+    assert isinstance(receipt, Receipt)
+    assert json.loads(as_json)["items"][1]["name"] == receipt.items[1].name
+    assert receipt.to_xml().startswith('<?xml version="1.0" ?>')
@@ -0,0 +1,89 @@
+"""Tests for the two-stage pipeline with image preparation in worker processes."""
+
+import sys
+import threading
+from pathlib import Path
+from unittest import mock
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.core import HarinaCore
+from harina.dedup import image_dhash
+from harina.imaging import EncodedImage, PreprocessOptions
+from harina.metrics import MetricsCollector
+from harina.pipeline import prepare_files, run_pipeline
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGES = sorted(SAMPLE_DIR.glob("*.jpg"))[:2]
+RECEIPT_XML = "<receipt><store_info><n>store</n></store_info></receipt>"
+
+
+def test_prepare_files_returns_encoded_bytes_or_errors(tmp_path):
+    """Workers should return encoded bytes with their source, and load errors per file."""
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+
+    results = prepare_files([IMAGES[0], broken], PreprocessOptions(max_edge=800), fingerprint=True)
+
+    encoded_image, error = results
+    assert isinstance(encoded_image, EncodedImage)
+    assert encoded_image.source == str(IMAGES[0])
+    assert max(encoded_image.width, encoded_image.height) == 800
+    assert encoded_image.fingerprint == image_dhash(encoded_image.data)
+    assert isinstance(error, ValueError) and "Failed to load image" in str(error)
+
+
+def test_prepared_images_are_sent_without_decoding_again():
+    """HarinaCore should use a prepared image as is and report its original path."""
+    encoded_image = prepare_files([IMAGES[0]], PreprocessOptions(max_edge=800))[0]
+    records = []
+
+    with mock.patch("harina.core.litellm.completion", return_value=fake_response(RECEIPT_XML)) as completion, \
+            mock.patch("harina.imaging.open_image") as open_image:
+        assert "store" in HarinaCore(metrics=MetricsCollector(records.append)).process_receipt(encoded_image)
+
+    open_image.assert_not_called()
+    url = completion.call_args.kwargs["messages"][0]["content"][1]["image_url"]["url"]
+    assert url == encoded_image.to_data_url()
+    assert records[0].source == str(IMAGES[0])
+
+
+def test_run_pipeline_applies_backpressure_and_isolates_errors():
+    """A stalled API stage should stop preparation; a failing item should not stop the rest."""
+    consumed = []
+    stalled = threading.Event()
+    filled = threading.Event()
+    release = threading.Event()
+
+    def items():
+        for item in [-1, -2, "x", -4, -5, -6, -7, -8]:
+            consumed.append(item)
+            if len(consumed) == 4:
+                filled.set()
+            yield item
+
+    def worker(item, prepared):
+        stalled.set()
+        release.wait(5)
+        return prepared * 10
+
+    outcomes = {}
+
+    def consume():
+        for item, result, error in run_pipeline(items(), abs, worker, cpu_workers=2, concurrency=1, max_pending=2):
+            outcomes[item] = (result, error)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    assert stalled.wait(10) and filled.wait(10)
+    # One item in the API stage, two prepared ahead and the one that failed, nothing more
+    assert len(consumed) == 4
+    release.set()
+    consumer.join(10)
+
+    assert len(consumed) == 8
+    assert outcomes[-1] == (10, None)
+    assert outcomes[-8] == (80, None)
+    assert isinstance(outcomes["x"][1], TypeError)
@@ -0,0 +1,55 @@
+"""Tests for the precompiled receipt prompt."""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.prompt import DEFAULT_CATEGORIES_PATH, DEFAULT_TEMPLATE_PATH, ReceiptPrompt
+
+
+def test_prompt_contains_template_and_categories():
+    """The rendered prompt should embed both source files."""
+    prompt = ReceiptPrompt()
+
+    assert DEFAULT_TEMPLATE_PATH.read_text(encoding="utf-8") in prompt.text
+    assert DEFAULT_CATEGORIES_PATH.read_text(encoding="utf-8") in prompt.text
+    assert prompt.hash == ReceiptPrompt().hash
+
+
+def test_prompt_reloads_only_when_mtime_changes(tmp_path):
+    """Edits should be picked up once the file's mtime moves."""
+    template = tmp_path / "template.xml"
+    template.write_text("<receipt><total/></receipt>", encoding="utf-8")
+    prompt = ReceiptPrompt(template_path=str(template))
+    first_hash = prompt.hash
+
+    stat = os.stat(template)
+    template.write_text("<receipt><total/><tax/></receipt>", encoding="utf-8")
+    os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert prompt.hash == first_hash
+
+    os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert prompt.hash != first_hash
+    assert "<tax/>" in prompt.text
+
+
+def test_malformed_template_is_used_as_written(tmp_path):
+    """A template that is not well-formed XML should still be embedded verbatim."""
+    template = tmp_path / "template.xml"
+    template.write_text("<receipt>\n  <store_info>店名など</store_info>\n  ...", encoding="utf-8")
+
+    prompt = ReceiptPrompt(template_path=str(template))
+
+    assert template.read_text(encoding="utf-8") in prompt.text
+    assert prompt.template == template.read_text(encoding="utf-8")
+
+
+def test_missing_template_is_rejected(tmp_path):
+    """A template that cannot be read should raise ValueError."""
+    with pytest.raises(ValueError, match="XML template"):
+        ReceiptPrompt(template_path=str(tmp_path / "missing.xml"))
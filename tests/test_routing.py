@@ -0,0 +1,256 @@
+"""Tests for multi-model fallback and hedged requests."""
+
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.core import HarinaCore
+from harina.metrics import MetricsCollector
+from harina.routing import Router
+from harina.scheduler import Scheduler
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGE_BYTES = (SAMPLE_DIR / "IMG_8923.jpg").read_bytes()
+RECEIPT_XML = (SAMPLE_DIR / "IMG_8923.xml").read_text(encoding="utf-8")
+
+
+def test_falls_back_on_invalid_receipt():
+    """A model answering without a valid receipt should fall through to the next one."""
+    ocr = HarinaCore("gemini/gemini-2.5-flash", fallback_models=["gpt-4o-mini"])
+    answers = {"gemini/gemini-2.5-flash": "I cannot read this image.", "gpt-4o-mini": RECEIPT_XML}
+    models = []
+
+    def completion(model, **kwargs):
+        models.append(model)
+        return fake_response(answers[model])
+
+    with mock.patch("harina.core.litellm.completion", completion):
+        result = ocr.process_receipt(IMAGE_BYTES)
+
+    assert "<receipt>" in result
+    assert models == ["gemini/gemini-2.5-flash", "gpt-4o-mini"]
+    assert ocr.router.stats["gemini/gemini-2.5-flash"].failures == 1
+    assert ocr.router.stats["gpt-4o-mini"].successes == 1
+
+
+def test_degraded_model_moves_to_the_back():
+    """Per-model success counters should reorder the fallback list."""
+    router = Router(["a", "b"])
+    for _ in range(5):
+        router.stats["a"].record(1.0, succeeded=False)
+
+    assert router.order() == ["b", "a"]
+
+
+def test_degraded_model_is_tried_first_again_once_failures_expire():
+    """A demoted model should get the first request again after its failures age out."""
+    router = Router(["a", "b"], health_max_age=60)
+    now = time.monotonic()
+    with mock.patch("harina.routing.time.monotonic", return_value=now):
+        for _ in range(5):
+            router.stats["a"].record(1.0, succeeded=False)
+        assert router.order() == ["b", "a"]
+    with mock.patch("harina.routing.time.monotonic", return_value=now + 61):
+        assert router.order() == ["a", "b"]
+
+
+def test_hedge_delay_uses_p95():
+    """The hedge delay should follow the observed p95 latency once there are enough samples."""
+    router = Router(["a"], hedge=True, initial_hedge_delay=7.0)
+    assert router.delay_for("a") == 7.0
+
+    for latency in [1.0] * 19 + [3.0]:
+        router.stats["a"].record(latency, succeeded=True)
+    assert router.delay_for("a") == 3.0
+
+
+def test_sync_hedge_takes_first_answer():
+    """A slow primary should be overtaken by the hedged request."""
+    router = Router(["slow", "fast"], hedge=True, hedge_delay=0.05)
+    release = threading.Event()
+
+    def fn(model):
+        if model == "slow":
+            release.wait(2)
+        return model
+
+    start = time.perf_counter()
+    assert router.call(fn) == "fast"
+    assert time.perf_counter() - start < 1.0
+    release.set()
+    router.close()
+
+
+def test_async_hedge_cancels_loser():
+    """The losing async request should be cancelled once a winner returns."""
+    router = Router(["slow", "fast"], hedge=True, hedge_delay=0.05)
+    cancelled = []
+
+    async def fn(model):
+        if model == "slow":
+            try:
+                await asyncio.sleep(2)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+        return model
+
+    async def main():
+        result = await router.acall(fn)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == "fast"
+    assert cancelled == ["slow"]
+    assert router.stats["slow"].failures == 0
+
+
+def test_all_models_failing_raises_last_error():
+    """When every model fails the last error should surface."""
+    router = Router(["a", "b"])
+
+    def fn(model):
+        raise ValueError(model)
+
+    with pytest.raises(ValueError, match="b"):
+        router.call(fn)
+
+
+def test_sync_hedge_does_not_queue_primaries_behind_each_other():
+    """Many concurrent hedged calls should all start their primary request at once."""
+    router = Router(["a", "b"], hedge=True, hedge_delay=5.0, max_workers=128)
+
+    def fn(model):
+        time.sleep(0.2)
+        return model
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        results = list(pool.map(lambda _: router.call(fn), range(64)))
+    router.close()
+
+    assert results == ["a"] * 64
+    assert time.perf_counter() - start < 1.5
+
+
+def test_hedged_attempts_count_api_time_once():
+    """Overlapping hedged attempts should not add up to more API time than the call took."""
+    ocr = HarinaCore("gemini/gemini-2.5-flash", fallback_models=["gpt-4o-mini"], hedge=True)
+    ocr.router.hedge_delay = 0.05
+    records = []
+    ocr.metrics = MetricsCollector(records.append)
+
+    def completion(model, **kwargs):
+        time.sleep(0.2)
+        if model == "gemini/gemini-2.5-flash":
+            raise ConnectionError("upstream failed")
+        return fake_response(RECEIPT_XML)
+
+    with mock.patch("harina.core.litellm.completion", completion):
+        ocr.process_receipt(IMAGE_BYTES)
+    ocr.router.close()
+
+    stages = records[0].stages
+    assert records[0].model == "gpt-4o-mini"
+    assert stages["api"] + stages["parse"] <= stages["total"]
+    assert stages["api"] < 0.35
+
+
+def test_sync_hedge_runs_attempts_on_a_bounded_pool():
+    """Primaries and hedges of concurrent sync calls should share the router's worker limit."""
+    router = Router(["a", "b"], hedge=True, hedge_delay=0.01, max_workers=2)
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def fn(model):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return model
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: router.call(fn), range(8)))
+    router.close()
+
+    assert set(results) <= {"a", "b"}
+    assert peak[0] <= 2
+    assert not any(t.name == "harina-primary" for t in threading.enumerate())
+
+
+def test_hedge_loser_stream_is_closed_and_releases_its_slot():
+    """A hedged stream that loses should stop being read and give back its scheduler slot."""
+    scheduler = Scheduler(max_concurrency=2)
+    ocr = HarinaCore("gemini/gemini-2.5-flash", fallback_models=["gpt-4o-mini"], hedge=True,
+                     scheduler=scheduler, stream=True)
+    ocr.router.hedge_delay = 0.05
+    limiter = scheduler._state("gemini/gemini-2.5-flash").limiter
+    closed = threading.Event()
+
+    def chunk(text):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+    def completion(model, **kwargs):
+        def stalling():
+            try:
+                while True:
+                    time.sleep(0.02)
+                    yield chunk(" ")
+            finally:
+                closed.set()
+
+        if model == "gemini/gemini-2.5-flash":
+            return stalling()
+        return iter([chunk(RECEIPT_XML)])
+
+    with mock.patch("harina.core.litellm.completion", completion):
+        assert "<receipt>" in ocr.process_receipt(IMAGE_BYTES)
+        assert closed.wait(5)
+    deadline = time.monotonic() + 5
+    while limiter.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    ocr.router.close()
+
+    assert limiter.in_flight == 0
+    assert ocr.router.stats["gemini/gemini-2.5-flash"].failures == 0
+
+
+def test_late_hedge_loser_usage_is_dropped():
+    """Usage of a hedged response arriving after the winner should not be billed to the receipt."""
+    ocr = HarinaCore("gemini/gemini-2.5-flash", fallback_models=["gpt-4o-mini"], hedge=True)
+    ocr.router.hedge_delay = 0.05
+    records = []
+    ocr.metrics = MetricsCollector(records.append)
+    release = threading.Event()
+    finished = threading.Event()
+
+    def completion(model, **kwargs):
+        if model == "gemini/gemini-2.5-flash":
+            release.wait(5)
+            finished.set()
+            return fake_response(RECEIPT_XML, usage=SimpleNamespace(prompt_tokens=1000, completion_tokens=1000))
+        return fake_response(RECEIPT_XML, usage=SimpleNamespace(prompt_tokens=10, completion_tokens=20))
+
+    with mock.patch("harina.core.litellm.completion", completion):
+        ocr.process_receipt(IMAGE_BYTES)
+        release.set()
+        assert finished.wait(5)
+        time.sleep(0.05)
+    ocr.router.close()
+
+    assert records[0].model == "gpt-4o-mini"
+    assert (records[0].prompt_tokens, records[0].completion_tokens) == (10, 20)
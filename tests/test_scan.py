@@ -0,0 +1,73 @@
+"""Tests for lazy image discovery."""
+
+import sys
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina import scan
+from harina.scan import scan_images
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for name in ["a.jpg", "b.HEIC", "notes.txt", "sub/c.webp", "sub/d.tiff", "sub/deep/e.png",
+                 "archive/old.jpg", "archive/nested/older.jpg"]:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x")
+    return tmp_path
+
+
+def _relative(paths, root):
+    return sorted(path.relative_to(root).as_posix() for path in paths)
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_scan_finds_all_image_extensions(tree, workers):
+    """HEIC, WebP and TIFF should be found alongside the classic formats."""
+    assert _relative(scan_images(tree, workers=workers), tree) == [
+        "a.jpg", "archive/nested/older.jpg", "archive/old.jpg", "b.HEIC",
+        "sub/c.webp", "sub/d.tiff", "sub/deep/e.png"]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_include_and_exclude_globs(tree, workers):
+    """Excluded directories should not be walked and includes should match names or paths."""
+    listed = []
+    original = scan._scan_directory
+
+    def spy(path, follow_symlinks):
+        listed.append(Path(path).name)
+        return original(path, follow_symlinks)
+
+    with mock.patch.object(scan, "_scan_directory", spy):
+        found = _relative(scan_images(tree, exclude=["archive"], workers=workers), tree)
+    assert "archive" not in listed and "nested" not in listed
+    assert found == ["a.jpg", "b.HEIC", "sub/c.webp", "sub/d.tiff", "sub/deep/e.png"]
+
+    assert _relative(scan_images(tree, include=["*.jpg"], workers=workers), tree) == [
+        "a.jpg", "archive/nested/older.jpg", "archive/old.jpg"]
+    assert _relative(scan_images(tree, include=["sub/*"], exclude=["*.tiff"], workers=workers), tree) == [
+        "sub/c.webp", "sub/deep/e.png"]
+
+
+def test_scan_yields_before_walk_finishes(tree):
+    """The first image should be available before deeper directories are listed."""
+    listed = []
+    original = scan._scan_directory
+
+    def spy(path, follow_symlinks):
+        listed.append(path)
+        return original(path, follow_symlinks)
+
+    with mock.patch.object(scan, "_scan_directory", spy):
+        images = scan_images(tree, workers=1)
+        first = next(images)
+        assert first.name in {"a.jpg", "b.HEIC"}
+        assert listed == [str(tree)]
+        images.close()
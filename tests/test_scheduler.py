@@ -0,0 +1,284 @@
+"""Tests for the rate-limit-aware scheduler."""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conftest import fake_response
+from harina.core import HarinaCore
+from harina.errors import ReceiptProcessingError, get_retry_after
+from harina.scheduler import AdaptiveLimiter, DeadLetterQueue, Scheduler, TokenBucket
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGE_BYTES = (SAMPLE_DIR / "IMG_8923.jpg").read_bytes()
+RECEIPT_XML = (SAMPLE_DIR / "IMG_8923.xml").read_text(encoding="utf-8")
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__("429 Resource exhausted")
+        self.status_code = 429
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+
+def test_token_bucket_waits_when_empty():
+    """Reservations beyond the burst capacity should return a wait proportional to the rate."""
+    bucket = TokenBucket(60)  # one token per second
+
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(1) == pytest.approx(2.0, abs=0.05)
+
+    bucket.adjust(-2)
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_adaptive_limiter_aimd():
+    """Throttling should halve the limit and successes should grow it back slowly."""
+    limiter = AdaptiveLimiter(8)
+    limiter.acquire()
+    limiter.release(throttled=True)
+    assert int(limiter.limit) == 4
+
+    # Roughly one slot per limit's worth of successes
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(succeeded=True)
+    assert int(limiter.limit) == 5
+
+
+def test_retry_after_header_parsing():
+    """Retry-After may be given in seconds or milliseconds."""
+    assert get_retry_after(RateLimitError(retry_after=3)) == 3.0
+    error = RuntimeError("x")
+    error.response = SimpleNamespace(headers={"retry-after-ms": "1500"})
+    assert get_retry_after(error) == 1.5
+    assert get_retry_after(ValueError("x")) is None
+
+
+def test_call_retries_rate_limits_and_honors_retry_after():
+    """429s should be retried after at least the Retry-After delay."""
+    scheduler = Scheduler(max_retries=3, base_delay=0.001)
+    outcomes = [RateLimitError(retry_after=2), RateLimitError(), "ok"]
+
+    def fn():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with mock.patch("harina.scheduler.time.sleep") as sleep:
+        assert scheduler.call("model", fn) == "ok"
+
+    delays = [call.args[0] for call in sleep.call_args_list]
+    assert delays[0] >= 2
+    # Two backoffs, each retry also waiting out the Retry-After block (time is mocked)
+    assert len(delays) == 4
+    assert delays[1] > 1.9 and delays[3] > 1.9
+    assert scheduler.concurrency("model") == 4
+
+
+def test_call_does_not_retry_client_errors():
+    """Non-retryable errors should surface immediately as ReceiptProcessingError."""
+    scheduler = Scheduler(max_retries=3)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ReceiptProcessingError) as excinfo:
+        scheduler.call("model", fn)
+
+    assert len(calls) == 1
+    assert not excinfo.value.retryable
+    assert isinstance(excinfo.value.__cause__, ValueError)
+
+
+def test_core_retries_through_scheduler():
+    """HarinaCore should recover from a rate limit when given a scheduler."""
+    scheduler = Scheduler(tpm=100000, max_retries=2, base_delay=0.001)
+    ocr = HarinaCore(scheduler=scheduler)
+    responses = [RateLimitError(), fake_response(RECEIPT_XML, usage=SimpleNamespace(total_tokens=1200))]
+
+    def completion(**kwargs):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    with mock.patch("harina.core.litellm.completion", completion), \
+            mock.patch("harina.scheduler.time.sleep"):
+        result = ocr.process_receipt(IMAGE_BYTES)
+
+    assert "<receipt>" in result
+    assert not responses
+
+
+def test_core_async_gives_up_after_max_retries():
+    """Exhausted retries should raise a rate-limited ReceiptProcessingError."""
+    ocr = HarinaCore(scheduler=Scheduler(max_retries=1, base_delay=0.001))
+
+    async def acompletion(**kwargs):
+        raise RateLimitError()
+
+    async def main():
+        with mock.patch("harina.core.litellm.acompletion", acompletion):
+            await ocr.aprocess_receipt(IMAGE_BYTES)
+
+    with pytest.raises(ReceiptProcessingError) as excinfo:
+        asyncio.run(main())
+
+    assert excinfo.value.rate_limited
+    assert excinfo.value.attempts == 2
+
+
+def test_dead_letter_queue_round_trip(tmp_path):
+    """Failed receipts written to a dead-letter file should be readable for a re-drive."""
+    queue = DeadLetterQueue()
+    queue.add(Path("a.jpg"), ReceiptProcessingError("boom", status_code=503, retryable=True))
+    queue.add(Path("b.jpg"), ValueError("bad image"))
+    path = tmp_path / "dead.jsonl"
+    queue.write(path)
+
+    assert DeadLetterQueue.read_sources(path) == ["a.jpg", "b.jpg"]
+    assert '"status_code": 503' in path.read_text(encoding="utf-8")
+
+
+def test_dead_letter_merge_keeps_entries_this_run_did_not_retry(tmp_path):
+    """Merging should drop resolved receipts, replace re-failed ones and keep the rest."""
+    path = tmp_path / "dead.jsonl"
+    earlier = DeadLetterQueue()
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        earlier.add(tmp_path / name, ValueError("boom"))
+    earlier.write(path)
+
+    run = DeadLetterQueue()
+    run.add(tmp_path / "b.jpg", ValueError("still broken"))
+    assert run.merge(path, resolved=[tmp_path / "a.jpg"]) == 2
+
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [(Path(line["source"]).name, line["error"]) for line in lines] == [("c.jpg", "boom"), ("b.jpg", "still broken")]
+    assert DeadLetterQueue().merge(path, resolved=[tmp_path / "b.jpg", tmp_path / "c.jpg"]) == 0
+    assert not path.exists()
+
+
+def test_async_waiters_are_handed_slots_in_order_without_polling():
+    """Queued coroutines should wake in FIFO order when a slot frees, not poll for one."""
+    limiter = AdaptiveLimiter(1)
+    order = []
+    sleep = asyncio.sleep
+
+    async def use(name):
+        await limiter.aacquire()
+        order.append(name)
+        await sleep(0)
+        limiter.release()
+
+    async def main():
+        await limiter.aacquire()
+        tasks = [asyncio.ensure_future(use(i)) for i in range(5)]
+        await sleep(0)
+        cancelled = tasks.pop(2)
+        cancelled.cancel()
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+    with mock.patch("harina.scheduler.asyncio.sleep") as polling:
+        asyncio.run(main())
+
+    polling.assert_not_called()
+    assert order == [0, 1, 3, 4]
+    assert limiter.in_flight == 0
+
+
+def test_retry_after_holds_back_other_calls_without_rpm():
+    """A Retry-After should delay every new call to the model even without an rpm budget."""
+    scheduler = Scheduler(max_retries=1, base_delay=0.001)
+    outcomes = [RateLimitError(retry_after=0.5), "ok"]
+
+    def fn():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    with mock.patch("harina.scheduler.time.sleep") as sleep:
+        assert scheduler.call("model", fn) == "ok"
+        assert scheduler.call("model", lambda: "other") == "other"
+
+    delays = [call.args[0] for call in sleep.call_args_list]
+    assert delays[0] >= 0.5
+    # Sleeping was mocked, so the retry and the next call both still wait out the Retry-After
+    assert len(delays) == 3
+    assert 0.3 < delays[2] <= 0.5
+
+
+def test_streamed_call_holds_its_slot_until_the_stream_is_read_or_closed():
+    """A stream should count against the concurrency limit until it is exhausted or closed."""
+    scheduler = Scheduler(max_concurrency=2)
+    limiter = scheduler._state("model").limiter
+    closed = []
+
+    def chunks():
+        try:
+            yield from ["a", "b", "c"]
+        finally:
+            closed.append(True)
+
+    stream = scheduler.call("model", chunks, stream=True)
+    assert limiter.in_flight == 1
+    assert list(stream) == ["a", "b", "c"]
+    assert limiter.in_flight == 0
+
+    stream = scheduler.call("model", chunks, stream=True)
+    assert next(stream) == "a"
+    assert limiter.in_flight == 1
+    stream.close()
+    assert limiter.in_flight == 0 and len(closed) == 2
+
+    async def main():
+        async def achunks():
+            yield "a"
+            yield "b"
+
+        async def fn():
+            return achunks()
+
+        stream = await scheduler.acall("model", fn, stream=True)
+        assert limiter.in_flight == 1
+        assert [chunk async for chunk in stream] == ["a", "b"]
+        assert limiter.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_core_stream_keeps_the_slot_while_chunks_are_read():
+    """HarinaCore should read a streamed receipt while still holding the scheduler slot."""
+    scheduler = Scheduler(max_concurrency=1)
+    ocr = HarinaCore(scheduler=scheduler, stream=True)
+    limiter = scheduler._state(ocr.model_name).limiter
+    held = []
+
+    def completion(**kwargs):
+        def chunks():
+            for i in range(0, len(RECEIPT_XML), 200):
+                held.append(limiter.in_flight)
+                delta = SimpleNamespace(content=RECEIPT_XML[i:i + 200])
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        return chunks()
+
+    with mock.patch("harina.core.litellm.completion", completion):
+        assert "<receipt>" in ocr.process_receipt(IMAGE_BYTES)
+
+    assert held and set(held) == {1}
+    assert limiter.in_flight == 0
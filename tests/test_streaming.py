@@ -0,0 +1,127 @@
+"""Tests for streamed completions with early XML extraction."""
+
+import asyncio
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.core import HarinaCore
+from harina.streaming import ReceiptStreamParser
+from harina.utils import format_xml
+
+SAMPLE_DIR = Path(__file__).parent.parent / "example" / "receipt-sample"
+IMAGE_BYTES = (SAMPLE_DIR / "IMG_8923.jpg").read_bytes()
+RECEIPT_XML = (SAMPLE_DIR / "IMG_8923.xml").read_text(encoding="utf-8")
+RESPONSE_TEXT = f"```xml\n{RECEIPT_XML}\n```\nこのレシートには以下の情報が含まれています。" + "説明" * 200
+
+
+def _chunks(text, size=7):
+    return [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + size]))])
+            for i in range(0, len(text), size)]
+
+
+class FakeStream:
+    """Sync and async iterable over chunks that records how much was consumed."""
+
+    def __init__(self, text):
+        self.chunks = _chunks(text)
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            self.consumed += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+def test_parser_stops_at_closing_tag_and_reports_progress():
+    """The parser should report sections and items and ignore trailing chatter."""
+    updates = []
+    parser = ReceiptStreamParser(updates.append)
+    for chunk in _chunks(RESPONSE_TEXT, size=3):
+        if parser.feed(chunk.choices[0].delta.content):
+            break
+
+    assert parser.done
+    assert parser.result().startswith("<receipt>") and parser.result().endswith("</receipt>")
+    assert [update.event for update in updates][0] == "store_info"
+    assert updates[0].store_info["n"]
+    assert "item" in [update.event for update in updates]
+    assert updates[-1].totals
+
+
+def test_parser_survives_malformed_xml():
+    """Malformed XML should stop progress reporting but still find the receipt end."""
+    parser = ReceiptStreamParser()
+    parser.feed("<receipt><store_info><n>A & B</n></store_info>")
+    assert not parser.done
+    assert parser.feed("</receipt> trailing")
+    assert parser.result() == "<receipt><store_info><n>A & B</n></store_info></receipt>"
+
+
+def test_process_receipt_streams_and_stops_early():
+    """Streaming mode should stop reading once the receipt closes and match the non-streamed result."""
+    stream = FakeStream(RESPONSE_TEXT)
+    updates = []
+    ocr = HarinaCore()
+
+    with mock.patch("harina.core.litellm.completion", return_value=stream) as completion:
+        result = ocr.process_receipt(IMAGE_BYTES, on_progress=updates.append)
+
+    assert completion.call_args.kwargs["stream"] is True
+    assert result == format_xml(RECEIPT_XML)
+    assert stream.consumed < len(stream.chunks)
+    assert stream.closed
+    assert updates[-1].complete and updates[-1].xml == result
+
+
+def test_astream_receipt_yields_partial_results():
+    """The async iterator should yield partial results before the final receipt."""
+    ocr = HarinaCore()
+
+    async def acompletion(**kwargs):
+        return FakeStream(RESPONSE_TEXT)
+
+    async def main():
+        with mock.patch("harina.core.litellm.acompletion", acompletion):
+            return [update async for update in ocr.astream_receipt(IMAGE_BYTES)]
+
+    updates = asyncio.run(main())
+
+    assert len(updates) > 2
+    assert not updates[0].complete
+    assert updates[-1].complete
+    assert updates[-1].items == updates[-2].items
+
+
+def test_stopping_early_closes_the_litellm_stream():
+    """The provider stream inside LiteLLM's wrapper, which has no close(), should be closed."""
+    import litellm
+
+    completion = litellm.completion
+    streams = []
+
+    def mocked(**kwargs):
+        stream = completion(**kwargs, mock_response=RESPONSE_TEXT)
+        streams.append((stream, stream.completion_stream))
+        return stream
+
+    with mock.patch("harina.core.litellm.completion", mocked):
+        result = HarinaCore(stream=True).process_receipt(IMAGE_BYTES)
+
+    wrapper, provider_stream = streams[0]
+    assert isinstance(wrapper, litellm.CustomStreamWrapper) and not hasattr(wrapper, "close")
+    assert result == format_xml(RECEIPT_XML)
+    assert provider_stream.gi_frame is None
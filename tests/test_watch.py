@@ -0,0 +1,77 @@
+"""Tests for the watch-folder ingestion."""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.watch import FolderWatcher
+
+
+def _watcher(tmp_path, ready, **kwargs):
+    return FolderWatcher(tmp_path, lambda path, first_seen: ready.append(path.name), polling=True, **kwargs)
+
+
+def test_growing_file_waits_until_it_settles(tmp_path):
+    """A file still being written should only be handed over once it stops changing."""
+    ready = []
+    watcher = _watcher(tmp_path, ready, settle=0.2)
+    partial = tmp_path / "scan.jpg"
+    partial.write_bytes(b"\xff\xd8 first half")
+    watcher.notify(partial)
+
+    watcher.check()
+    assert ready == []
+
+    time.sleep(0.1)
+    with open(partial, "ab") as f:
+        f.write(b" second half")
+    os.utime(partial, ns=(time.time_ns(), time.time_ns() + 10**6))
+    watcher.check()
+    time.sleep(0.12)
+    watcher.check()
+    assert ready == []
+
+    time.sleep(0.15)
+    watcher.check()
+    assert ready == ["scan.jpg"]
+    watcher.check()
+    assert ready == ["scan.jpg"]
+
+
+def test_closed_files_are_ready_immediately(tmp_path):
+    """A close or rename event should skip the settle delay; non-images are ignored."""
+    ready = []
+    watcher = _watcher(tmp_path, ready, settle=60)
+    (tmp_path / "scan.png").write_bytes(b"png")
+    (tmp_path / "scan.xml").write_text("<receipt/>")
+    watcher.notify(tmp_path / "scan.png", closed=True)
+    watcher.notify(tmp_path / "scan.xml", closed=True)
+
+    watcher.check()
+    assert ready == ["scan.png"]
+
+
+def test_polling_picks_up_new_files_but_not_existing_ones(tmp_path):
+    """Only images added after startup should be processed by default."""
+    (tmp_path / "old.jpg").write_bytes(b"old")
+    ready = []
+    watcher = _watcher(tmp_path, ready, settle=0, poll_interval=0.1)
+    thread = threading.Thread(target=watcher.run)
+    thread.start()
+    try:
+        time.sleep(0.2)
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "new.jpg").write_bytes(b"new")
+        deadline = time.monotonic() + 5
+        while not ready and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        watcher.stop()
+        thread.join()
+
+    assert ready == ["new.jpg"]
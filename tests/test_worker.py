@@ -0,0 +1,106 @@
+"""Tests for the durable job queue and worker."""
+
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add the project root directory to the path so we can import harina as a package
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from harina.worker import FAILED, PENDING, RUNNING, SUCCEEDED, JobQueue, Worker
+
+
+class RateLimited(Exception):
+    status_code = 429
+    response = SimpleNamespace(status_code=429, headers={})
+
+
+def test_enqueue_is_idempotent(tmp_path):
+    """Adding a source twice should not create a second job."""
+    queue = JobQueue(tmp_path / "queue.sqlite3")
+    assert queue.enqueue(["a.jpg", "b.jpg"]) == 2
+    assert queue.enqueue(["b.jpg", "c.jpg"]) == 1
+    assert queue.counts()[PENDING] == 3
+
+
+def test_transient_failures_retry_without_rerunning_successes(tmp_path):
+    """Only the rate-limited job should run again; the succeeded one stays done."""
+    queue = JobQueue(tmp_path / "queue.sqlite3", max_attempts=3)
+    queue.enqueue(["ok.jpg", "flaky.jpg", "broken.jpg"])
+    calls = []
+
+    def handle(source):
+        calls.append(source)
+        if source == "flaky.jpg" and calls.count(source) < 3:
+            raise RateLimited("slow down")
+        if source == "broken.jpg":
+            raise ValueError("Response does not contain valid receipt XML")
+        return f"{source}.xml"
+
+    results = list(Worker(queue, handle, concurrency=2, base_delay=0, poll_interval=0.01).run())
+
+    assert sorted(calls) == ["broken.jpg", "flaky.jpg", "flaky.jpg", "flaky.jpg", "ok.jpg"]
+    assert queue.counts() == {PENDING: 0, RUNNING: 0, SUCCEEDED: 2, FAILED: 1}
+    assert [failure["source"] for failure in queue.failures()] == ["broken.jpg"]
+    assert sum(error is None for _, _, error in results) == 2
+
+    # A restart finds nothing left to do
+    assert list(Worker(queue, handle).run()) == []
+    assert len(calls) == 5
+
+
+def test_jobs_of_a_crashed_worker_are_recovered(tmp_path):
+    """Jobs with an expired lease should run again while live leases are kept."""
+    path = tmp_path / "queue.sqlite3"
+    crashed = JobQueue(path, lease_seconds=0)
+    crashed.enqueue(["a.jpg", "b.jpg"])
+    crashed.worker = "elsewhere:1"
+    assert crashed.claim().source == "a.jpg"
+    crashed.close()
+
+    queue = JobQueue(path)
+    assert queue.claim().source == "b.jpg"
+    assert queue.recover() == 1
+    job = queue.claim()
+    assert job.source == "a.jpg" and job.attempts == 2
+
+
+def test_lease_is_renewed_while_a_slow_job_runs(tmp_path):
+    """A job running past its lease should not be recovered by another worker."""
+    path = tmp_path / "queue.sqlite3"
+    queue = JobQueue(path, lease_seconds=0.3)
+    queue.enqueue(["slow.jpg"])
+    other = JobQueue(path)
+    other.worker = "elsewhere:2"
+    recovered = []
+
+    def handle(source):
+        for _ in range(10):
+            time.sleep(0.1)
+            recovered.append(other.recover())
+        return f"{source}.xml"
+
+    results = list(Worker(queue, handle).run())
+
+    assert results[0][2] is None
+    assert not any(recovered)
+    assert queue.counts()[SUCCEEDED] == 1
+
+
+def test_worker_that_lost_its_lease_cannot_record_a_result(tmp_path):
+    """Once a job was recovered and claimed again, the first worker's result is discarded."""
+    path = tmp_path / "queue.sqlite3"
+    first = JobQueue(path, lease_seconds=0)
+    first.enqueue(["a.jpg"])
+    job = first.claim()
+
+    second = JobQueue(path)
+    second.worker = "elsewhere:2"
+    assert second.recover() == 1
+    retried = second.claim()
+
+    assert not first.complete(job, "first.xml")
+    assert not first.renew(job)
+    assert second.complete(retried, "second.xml")
+    assert second.counts()[SUCCEEDED] == 1